@@ -0,0 +1,117 @@
+"""
+Проверка InvalidationBus на настоящих серверах Mongo: доставка через change stream на реплика-сете,
+переход на опрос на standalone-сервере (ошибка 40573) и полная перезагрузка, когда изменения вытеснены из recent.
+
+    docker compose -f docker-compose.test.yaml up -d --wait
+    cd src && python -m benchmarks.invalidation_bus
+
+Адреса серверов: TEST_MONGO_RS_URI и TEST_MONGO_STANDALONE_URI.
+"""
+import asyncio
+import os
+import uuid
+from typing import Optional
+
+from pymongo import AsyncMongoClient
+
+from core.services.invalidation import InvalidationBus
+
+RS_URI = os.getenv("TEST_MONGO_RS_URI", "mongodb://localhost:27117/?directConnection=true")
+STANDALONE_URI = os.getenv("TEST_MONGO_STANDALONE_URI", "mongodb://localhost:27118/?directConnection=true")
+DB_NAME = "invalidation_harness"
+DELIVERY_TIMEOUT = 10
+
+
+class RecordingBus(InvalidationBus):
+    """InvalidationBus, запоминающий, каким способом он слушает изменения"""
+
+    POLL_INTERVAL = 0.2
+    RESTART_DELAY = 0.5
+
+    def __init__(self, db):
+        super().__init__(db)
+        self.polling = False
+
+    async def _poll(self):
+        self.polling = True
+        await super()._poll()
+
+
+class Received:
+    def __init__(self):
+        self.calls: list[Optional[set[str]]] = []
+        self.event = asyncio.Event()
+
+    async def __call__(self, keys: Optional[set[str]]):
+        self.calls.append(keys)
+        self.event.set()
+
+    async def wait(self) -> Optional[set[str]]:
+        await asyncio.wait_for(self.event.wait(), DELIVERY_TIMEOUT)
+        self.event.clear()
+        return self.calls[-1]
+
+
+async def check_delivery(db, expect_polling: bool):
+    topic = f"topic-{uuid.uuid4().hex}"
+    publisher, subscriber = InvalidationBus(db), RecordingBus(db)
+    received = Received()
+    try:
+        await subscriber.subscribe(topic, received)
+        await asyncio.sleep(1)  # стрим открывается или начинается опрос
+
+        await publisher.publish(topic, ["a"])
+        assert await received.wait() == {"a"}, received.calls
+
+        await publisher.publish(topic)
+        assert await received.wait() is None, received.calls
+
+        assert subscriber.polling == expect_polling, f"polling={subscriber.polling}, expected {expect_polling}"
+    finally:
+        await subscriber.close()
+
+
+async def check_trimmed_recent(db):
+    """Подписчик пропустил больше RECENT_LIMIT изменений - ключи неизвестны, он получает None"""
+    topic = f"topic-{uuid.uuid4().hex}"
+    publisher, subscriber = InvalidationBus(db), RecordingBus(db)
+    publisher.RECENT_LIMIT = 3
+    received = Received()
+
+    # подписка без фоновой задачи: изменения забираются вручную через _poll_once
+    subscriber._versions[topic] = await subscriber.get_version(topic)
+    subscriber._subscribers[topic] = [received]
+
+    await publisher.publish(topic, ["a"])
+    await publisher.publish(topic, ["b"])
+    await subscriber._poll_once()
+    assert received.calls == [{"a", "b"}], received.calls
+
+    for key in "cdefg":
+        await publisher.publish(topic, [key])
+    await subscriber._poll_once()
+    assert received.calls[-1] is None, received.calls
+
+    await subscriber._poll_once()
+    assert len(received.calls) == 2, "already processed version was delivered again"
+
+
+async def run(name: str, uri: str, expect_polling: bool):
+    client = AsyncMongoClient(uri, serverSelectionTimeoutMS=5000)
+    db = client[DB_NAME]
+    try:
+        await check_delivery(db, expect_polling)
+        await check_trimmed_recent(db)
+        print(f"{name}: ok")
+    finally:
+        await client.drop_database(DB_NAME)
+        await client.close()
+
+
+async def main():
+    await run("replica set (change stream)", RS_URI, expect_polling=False)
+    await run("standalone (polling fallback)", STANDALONE_URI, expect_polling=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Время загрузки документа товара из Mongo на товаре с большой конфигурацией:
+разбор BSON драйвером и сборка модели через model_validate.
+
+    python -m benchmarks.model_load [количество опций в конфигурации]
+"""
+import sys
+import timeit
+
+import bson
+
+from schemas.db_models import (
+    ConfigurationAnnotation,
+    ConfigurationChoice,
+    ConfigurationOption,
+    ConfigurationSwitch,
+    ConfigurationSwitches,
+    ConfigurationSwitchesGroup,
+    LocalizedEntry,
+    LocalizedMoney,
+    LocalizedSavedMedia,
+    LocalizedString,
+    Product,
+    ProductConfiguration
+)
+
+
+def make_product(options: int = 6, choices: int = 5, switches: int = 6) -> Product:
+    entry = lambda path: LocalizedEntry(path=path)
+    price = lambda rub: LocalizedMoney.from_keys(RUB=rub, USD=rub / 60)
+
+    def make_switch(path: str, n: int) -> ConfigurationSwitch:
+        return ConfigurationSwitch(name=entry(f"{path}.name"), description=entry(f"{path}.description"),
+                                   price=price(100 * n), can_be_blocked_by=["option_0/choice_0"])
+
+    def make_switches(path: str) -> ConfigurationSwitches:
+        group = ConfigurationSwitchesGroup(name=entry(f"{path}.group.name"), description=entry(f"{path}.group.description"),
+                                           switches={f"switch_{n}": make_switch(f"{path}.group.{n}", n) for n in range(switches)})
+        return ConfigurationSwitches(name=entry(f"{path}.name"), description=entry(f"{path}.description"),
+                                     switches={**{f"switch_{n}": make_switch(f"{path}.{n}", n) for n in range(switches)}, "group": group})
+
+    def make_option(o: int) -> ConfigurationOption:
+        path = f"Options.Option{o}"
+        option_choices = {
+            f"choice_{c}": ConfigurationChoice(name=entry(f"{path}.{c}.name"), description=entry(f"{path}.{c}.description"),
+                                               media=LocalizedSavedMedia(media_key=f"photo_{o}_{c}"), price=price(300 * c),
+                                               can_be_blocked_by=[f"option_{o}/choice_0"] if c else [])
+            for c in range(choices)
+        }
+        option_choices["additionals"] = make_switches(f"{path}.additionals")
+        option_choices["annotation"] = ConfigurationAnnotation(name=entry(f"{path}.annotation.name"), text=entry(f"{path}.annotation.text"))
+        return ConfigurationOption(name=entry(f"{path}.name"), text=entry(f"{path}.text"), chosen_key="choice_0", choices=option_choices)
+
+    configuration = ProductConfiguration(options={f"option_{o}": make_option(o) for o in range(options)})
+    return Product(
+        id=bson.ObjectId(),
+        schema_version=Product.latest_schema_version(),
+        name=LocalizedString(data={"ru": "Товар", "en": "Product"}),
+        name_for_tax="Товар",
+        category="dildos",
+        visible=True,
+        description=LocalizedString(data={"ru": "Описание " * 100, "en": "Description " * 100}),
+        description_media=LocalizedSavedMedia(media_key="photo_product"),
+        base_price=price(6000),
+        configuration=configuration,
+        configuration_media=LocalizedSavedMedia(media_key="photo_product")
+    )
+
+
+def to_mongo_document(product: Product) -> dict:
+    """Документ в том виде, в котором его вернёт драйвер после записи в Mongo"""
+    return bson.decode(bson.encode(product.model_dump()))
+
+
+def main():
+    options = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    product = make_product(options)
+    document = to_mongo_document(product)
+    assert Product.model_validate(dict(document)).model_dump() == product.model_dump(), "loaded product differs from saved"
+
+    raw = bson.encode(document)
+
+    number = 200
+    decode_time = timeit.timeit(lambda: bson.decode(raw), number=number) / number
+    validate_time = timeit.timeit(lambda: Product.model_validate(dict(document)), number=number) / number
+
+    print(f"document: {len(raw) / 1024:.1f} KiB, {options} options")
+    print(f"bson.decode:    {decode_time * 1000:.2f} ms")
+    print(f"model_validate: {validate_time * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
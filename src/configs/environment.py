@@ -12,7 +12,8 @@ BOT_TOKEN = load_env("BOT_TOKEN")
 USE_WEBHOOK = load_env("USE_WEBHOOK", "0") == "1"
 
 APP_SERVER = load_env("APP_SERVER", "aiohttp")
-WORKERS = int(load_env("WORKERS", "1"))
+# по умолчанию как в entrypoint.sh: gunicorn запускает 2 воркера, aiohttp - один процесс
+WORKERS = int(load_env("WORKERS", "2" if APP_SERVER == "gunicorn" else "1"))
 
 WEB_SERVER_HOST = load_env('WEB_SERVER_HOST', "0.0.0.0")
 WEB_SERVER_PORT = int(load_env('WEB_SERVER_PORT', "80"))
@@ -27,6 +28,20 @@ PROVIDER_TOKEN = load_env("PROVIDER_TOKEN")
 MONGO_URI = load_env("MONGO_URI")
 MONGO_TLS_CA_PATH = load_env("MONGO_TLS_CA_PATH")
 MONGO_TLS_KEY_PATH = load_env("MONGO_TLS_KEY_PATH")
+# база приложения: репозитории, лимиты и прочие служебные коллекции
+MONGO_DB_NAME = load_env("MONGO_DB_NAME", "Shop")
+
+# пул общего клиента Mongo (core/services/mongo.py), один на процесс
+MONGO_MAX_POOL_SIZE = int(load_env("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(load_env("MONGO_MIN_POOL_SIZE", "2"))
+MONGO_MAX_IDLE_TIME_MS = int(load_env("MONGO_MAX_IDLE_TIME_MS", "300000"))
+# сжатие по порядку предпочтения; недоступные в окружении или на сервере пропускаются, none - без сжатия
+MONGO_COMPRESSORS = [c for c in load_env("MONGO_COMPRESSORS", "zstd,snappy,zlib").split(",") if c and c != "none"]
+MONGO_CONNECT_TIMEOUT_MS = int(load_env("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(load_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", "15000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(load_env("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+# больше команд Mongo за один апдейт - предупреждение в логе
+MONGO_QUERY_BUDGET = int(load_env("MONGO_QUERY_BUDGET", "30"))
 MEDIA_PATH = load_env("MEDIA_PATH")
 CONFIGS_PATH = load_env("CONFIGS_PATH")
 LOGS_PATH = load_env("LOGS_PATH")
@@ -34,6 +49,13 @@ LOGS_PATH = load_env("LOGS_PATH")
 TG_LOGS_CHANNEL_ID = load_env("TG_LOGS_CHANNEL_ID")
 TG_ADMIN_CHAT_ID = load_env("TG_ADMIN_CHAT_ID")
 
+# mongo - PyMongoStorage, tiered - кеш в памяти с фоновой записью в Mongo
+FSM_STORAGE = load_env("FSM_STORAGE", "mongo")
+FSM_SYNC_FLUSH = load_env("FSM_SYNC_FLUSH", "0") == "1"
+
+# memory - лимиты в памяти каждого воркера, mongo - общие для всех воркеров
+THROTTLE_BACKEND = load_env("THROTTLE_BACKEND", "memory")
+
 DEBUG = load_env("DEBUG", "0") == "1"
 
 __all__ = [
@@ -51,10 +73,22 @@ __all__ = [
     "MONGO_URI",
     "MONGO_TLS_CA_PATH",
     "MONGO_TLS_KEY_PATH",
+    "MONGO_DB_NAME",
+    "MONGO_MAX_POOL_SIZE",
+    "MONGO_MIN_POOL_SIZE",
+    "MONGO_MAX_IDLE_TIME_MS",
+    "MONGO_COMPRESSORS",
+    "MONGO_CONNECT_TIMEOUT_MS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    "MONGO_QUERY_BUDGET",
     "MEDIA_PATH",
     "CONFIGS_PATH",
     "LOGS_PATH",
     "TG_LOGS_CHANNEL_ID",
     "TG_ADMIN_CHAT_ID",
+    "FSM_STORAGE",
+    "FSM_SYNC_FLUSH",
+    "THROTTLE_BACKEND",
     "DEBUG"
 ]
\ No newline at end of file
@@ -0,0 +1,284 @@
+import asyncio
+import copy
+import logging
+from collections.abc import Mapping
+from typing import Any, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.pymongo import PyMongoStorage
+from cachetools import TTLCache
+from pymongo import AsyncMongoClient, DeleteOne, ReplaceOne
+
+
+_NOT_LOADED = object()
+
+
+def resolve_state(value: StateType) -> Optional[str]:
+    if value is None: return None
+    if isinstance(value, State): return value.state
+    return str(value)
+
+
+class BufferedFSMContext(FSMContext):
+    """
+    FSMContext на время одного апдейта: состояние и данные читаются из хранилища один раз,
+    все изменения копятся в памяти и записываются одним запросом в flush().
+    """
+
+    def __init__(self, storage: BaseStorage, key: StorageKey, raw_state: Any = _NOT_LOADED) -> None:
+        super().__init__(storage, key)
+        self._state: Any = raw_state
+        self._data: Any = _NOT_LOADED
+
+        self._state_dirty = False
+        self._data_replaced = False
+        self._dirty_keys: set[str] = set()
+
+    @classmethod
+    def wrap(cls, fsm: FSMContext, raw_state: Any = _NOT_LOADED) -> "BufferedFSMContext":
+        if isinstance(fsm, cls): return fsm
+        return cls(fsm.storage, fsm.key, raw_state)
+
+    @property
+    def dirty(self) -> bool:
+        return self._state_dirty or self._data_replaced or bool(self._dirty_keys)
+
+    async def _ensure_data(self) -> dict[str, Any]:
+        if self._data is _NOT_LOADED:
+            self._data = await self.storage.get_data(key=self.key)
+        return self._data
+
+    async def set_state(self, state: StateType = None) -> None:
+        self._state = resolve_state(state)
+        self._state_dirty = True
+
+    async def get_state(self) -> Optional[str]:
+        if self._state is _NOT_LOADED:
+            self._state = await self.storage.get_state(key=self.key)
+        return self._state
+
+    async def set_data(self, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+
+        self._data = copy.deepcopy(data)
+        self._data_replaced = True
+        self._dirty_keys.clear()
+
+    async def get_data(self) -> dict[str, Any]:
+        return copy.deepcopy(await self._ensure_data())
+
+    async def get_value(self, key: str, default: Any | None = None) -> Any | None:
+        data = await self._ensure_data()
+        return copy.deepcopy(data[key]) if key in data else default
+
+    async def update_data(self, data: Mapping[str, Any] | None = None, **kwargs: Any) -> dict[str, Any]:
+        if data:
+            kwargs.update(data)
+
+        current = await self._ensure_data()
+        current.update(copy.deepcopy(kwargs))
+        if not self._data_replaced:
+            self._dirty_keys.update(kwargs)
+
+        return copy.deepcopy(current)
+
+    async def flush(self) -> None:
+        """Записывает накопленные изменения в хранилище"""
+        if not self.dirty: return
+
+        if isinstance(self.storage, PyMongoStorage):
+            await self._flush_pymongo(self.storage)
+        else:
+            if self._state_dirty:
+                await self.storage.set_state(key=self.key, state=self._state)
+            if self._data_replaced:
+                await self.storage.set_data(key=self.key, data=self._data)
+            elif self._dirty_keys:
+                await self.storage.update_data(key=self.key, data={k: self._data[k] for k in self._dirty_keys})
+
+        self._state_dirty = False
+        self._data_replaced = False
+        self._dirty_keys.clear()
+
+    async def _flush_pymongo(self, storage: PyMongoStorage) -> None:
+        # у PyMongoStorage нет метода для записи состояния и данных разом, поэтому пишем в его коллекцию напрямую
+        collection = storage._collection
+        document_id = storage._key_builder.build(self.key)
+
+        to_set: dict[str, Any] = {}
+        to_unset: dict[str, int] = {}
+
+        if self._state_dirty:
+            if self._state is None: to_unset["state"] = 1
+            else: to_set["state"] = self._state
+
+        if self._data_replaced:
+            if self._data: to_set["data"] = self._data
+            else: to_unset["data"] = 1
+        else:
+            to_set.update({f"data.{k}": self._data[k] for k in self._dirty_keys})
+
+        if not to_set and self._state is None and not self._data:
+            await collection.delete_one({"_id": document_id})
+            return
+
+        update = {}
+        if to_set: update["$set"] = to_set
+        if to_unset: update["$unset"] = to_unset
+
+        await collection.update_one({"_id": document_id}, update, upsert=True)
+
+
+class TieredMongoStorage(BaseStorage):
+    """
+    Хранилище FSM с горячим слоем в памяти: записи пользователей держатся в LRU-кеше,
+    изменения пачками пишутся в Mongo в фоне (write-behind), при промахе запись читается из Mongo.
+    Формат документов совместим с PyMongoStorage.
+    """
+
+    FLUSH_INTERVAL = 1.0
+    CACHE_MAXSIZE = 50_000
+    CACHE_TTL = 30 * 60 # 30m
+
+    def __init__(self,
+                 client: AsyncMongoClient[Any],
+                 key_builder: KeyBuilder | None = None,
+                 db_name: str = "aiogram_fsm",
+                 collection_name: str = "states_and_data",
+                 sync_flush: bool = False) -> None:
+        """
+        :param sync_flush: сразу записывать в Mongo при смене состояния, а не ждать фоновой записи
+        """
+        self._client = client
+        self._collection = client[db_name][collection_name]
+        self._key_builder = key_builder or DefaultKeyBuilder()
+        self.sync_flush = sync_flush
+
+        # document_id -> {"state": ..., "data": {...}}
+        self._records: TTLCache[str, dict[str, Any]] = TTLCache(maxsize=self.CACHE_MAXSIZE, ttl=self.CACHE_TTL)
+        # записи, ещё не попавшие в Mongo; держим их тут, даже если кеш их уже вытеснил
+        self._dirty: dict[str, dict[str, Any]] = {}
+
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def _get_record(self, key: StorageKey) -> tuple[str, dict[str, Any]]:
+        document_id = self._key_builder.build(key)
+        if (record := self._peek(document_id)) is not None:
+            return document_id, record
+
+        document = await self._collection.find_one({"_id": document_id})
+        # пока ждали Mongo, запись могла появиться в памяти из параллельного апдейта
+        if (record := self._peek(document_id)) is not None:
+            return document_id, record
+
+        record = {
+            "state": document.get("state") if document else None,
+            "data": (document.get("data") or {}) if document else {}
+        }
+        self._records[document_id] = record
+        return document_id, record
+
+    def _peek(self, document_id: str) -> Optional[dict[str, Any]]:
+        record = self._records.get(document_id)
+        if record is None and (record := self._dirty.get(document_id)) is not None:
+            self._records[document_id] = record
+        return record
+
+    def _mark_dirty(self, document_id: str, record: dict[str, Any]):
+        self._dirty[document_id] = record
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._background_flush())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        document_id, record = await self._get_record(key)
+        record["state"] = resolve_state(state)
+        self._mark_dirty(document_id, record)
+
+        if self.sync_flush:
+            await self.flush()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._get_record(key)
+        return record["state"]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+
+        document_id, record = await self._get_record(key)
+        record["data"] = copy.deepcopy(data)
+        self._mark_dirty(document_id, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, record = await self._get_record(key)
+        return copy.deepcopy(record["data"])
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        document_id, record = await self._get_record(key)
+        record["data"].update(copy.deepcopy(dict(data)))
+        self._mark_dirty(document_id, record)
+        return copy.deepcopy(record["data"])
+
+    async def flush(self) -> None:
+        """Записывает все накопленные изменения в Mongo одним bulk_write"""
+        async with self._flush_lock:
+            if not self._dirty: return
+            pending, self._dirty = self._dirty, {}
+
+            operations = []
+            for document_id, record in pending.items():
+                document = {}
+                if record["state"] is not None: document["state"] = record["state"]
+                if record["data"]: document["data"] = copy.deepcopy(record["data"])
+
+                if document: operations.append(ReplaceOne({"_id": document_id}, document, upsert=True))
+                else: operations.append(DeleteOne({"_id": document_id}))
+
+            try:
+                await self._collection.bulk_write(operations, ordered=False)
+            except BaseException:
+                # не теряем изменения: повторим на следующем цикле, если запись с тех пор не обновилась
+                for document_id, record in pending.items():
+                    self._dirty.setdefault(document_id, record)
+                raise
+
+    async def _background_flush(self):
+        while self._dirty:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.getLogger(__name__).exception(f"Failed to flush FSM records: {e}")
+
+    async def close(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass  # Ожидаемое исключение при отмене задачи
+
+        # клиент принадлежит тому, кто его создал (общий клиент закрывает close_mongo_client)
+        await self.flush()
+
+
+class SharedClientMongoStorage(PyMongoStorage):
+    """PyMongoStorage, который при остановке не закрывает переданный ему клиент"""
+
+    async def close(self) -> None:
+        pass
+
+
+__all__ = [
+    "BufferedFSMContext",
+    "SharedClientMongoStorage",
+    "TieredMongoStorage",
+    "resolve_state"
+]
@@ -26,6 +26,8 @@ if TYPE_CHECKING:
     from core.services.placeholders import PlaceholderManager
     from core.services.currency_converter import AsyncCurrencyConverter
     from core.services.media_saver import MediaSaver
+    from core.services.statistics import StatisticsService
+    from core.services.catalog import CatalogCache
     
 CRYPTO_KEY = base64.b64decode(getenv("CRYPTO_KEY").encode("utf-8"))
 
@@ -148,6 +150,8 @@ class ServiceHub:
     placeholders: "PlaceholderManager"
     currency_converter: "AsyncCurrencyConverter"
     media_saver: "MediaSaver"
+    statistics: "StatisticsService"
+    catalog: "CatalogCache"
 
 @dataclass
 class Context:
@@ -1,18 +1,21 @@
 import logging
 from os import getenv
 from typing import Any, Awaitable, Callable, Dict, Optional
-import time
 from aiogram import BaseMiddleware
 from aiogram.types import ReplyKeyboardRemove, TelegramObject
-from cachetools import TTLCache
 
+from core.fsm import BufferedFSMContext
 from core.services.currency_converter import AsyncCurrencyConverter
 from core.services.db import DatabaseService
 from core.helper_classes import Context, ServiceHub
+from core.services.catalog import CatalogCache
 from core.services.media_saver import MediaSaver
+from core.services.mongo import close_mongo_client, command_monitor, current_update
 from core.services.notifications import NotificatorHub
 from core.services.placeholders import PlaceholderManager
+from core.services.statistics import StatisticsService
 from core.services.tax import TaxSystem
+from core.services.throttling import MemoryThrottleBackend, ThrottleBackend, ThrottleVerdict
 from core.states import NewUserStates
 from ui.translates import TranslatorHub
 
@@ -33,9 +36,11 @@ class ContextMiddleware(BaseMiddleware):
             notificators=NotificatorHub(bot=bot,
                                         logs_channel_id=int(env_var) if (env_var := getenv("TG_LOGS_CHANNEL_ID")) else None,
                                         admin_chat_id=int(env_var) if (env_var := getenv("TG_ADMIN_CHAT_ID")) else None),
-            placeholders=PlaceholderManager(db.placeholders),
+            placeholders=PlaceholderManager(db.placeholders, db.invalidation),
             currency_converter=AsyncCurrencyConverter(),
-            media_saver=MediaSaver(bot=bot)
+            media_saver=MediaSaver(bot=bot, invalidation=db.invalidation),
+            statistics=StatisticsService(db),
+            catalog=CatalogCache(db)
         )
         
         self.initialized = True
@@ -45,6 +50,27 @@ class ContextMiddleware(BaseMiddleware):
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
         event: TelegramObject,
         data: Dict[str, Any]
+    ) -> Any:
+        # все команды Mongo за апдейт, включая запись FSM в конце, считаются в его бюджет запросов
+        token = command_monitor.begin_update(self._update_label(event))
+        try:
+            return await self._handle(handler, event, data)
+        finally:
+            command_monitor.end_update(token)
+
+    @staticmethod
+    def _update_label(event: TelegramObject) -> str:
+        if event.message:
+            return f"update {event.update_id} (message {(event.message.text or event.message.content_type)[:40]!r})"
+        if event.callback_query:
+            return f"update {event.update_id} (callback {event.callback_query.data!r})"
+        return f"update {event.update_id}"
+
+    async def _handle(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
     ) -> Any:
         user_id = data["event_from_user"].id
 
@@ -57,37 +83,49 @@ class ContextMiddleware(BaseMiddleware):
             
         lang = customer.lang if customer and customer.lang else "?"                          
 
+        # все обращения к FSM за апдейт идут через буфер и записываются одним запросом в конце
+        fsm = BufferedFSMContext.wrap(data["state"], data.get("raw_state"))
+        data["state"] = fsm
+
         data["ctx"] = Context(event.message or event.callback_query,
-                              data.get("state"),
+                              fsm,
                               customer,
                               lang,
                               TranslatorHub.get_for_lang(lang, self.services.placeholders),
                               self.services)
-        state = await data.get("state").get_state()
-        if not customer and not state == NewUserStates.LangChoosing and state != None:
-            await data["ctx"].fsm.set_state(NewUserStates.LangChoosing)
-            return await data["ctx"].message.answer("Account deleted. Enter /start.", reply_keyboard=ReplyKeyboardRemove())
-        
-        if customer and event.message and customer.username != data["ctx"].message.from_user.username:
-            customer.username = data["ctx"].message.from_user.username
-            await self.services.db.customers.save(customer)
-
         try:
-            if hasattr(event, "message") and event.message: await data["ctx"].update_messages_log(event.message)
-        except Exception as e: 
-            logging.getLogger(__name__).exception(f"Failed to update messages log: {e}")
-        
-        return await handler(event, data)
+            state = await fsm.get_state()
+            # хендлер выбирается по состоянию FSM - добавляем его в метку для лога бюджета
+            if update := current_update.get(): update.label += f", state {state}"
+            if not customer and not state == NewUserStates.LangChoosing and state != None:
+                await fsm.set_state(NewUserStates.LangChoosing)
+                return await data["ctx"].message.answer("Account deleted. Enter /start.", reply_keyboard=ReplyKeyboardRemove())
+            
+            if customer and event.message and customer.username != data["ctx"].message.from_user.username:
+                customer.username = data["ctx"].message.from_user.username
+                await self.services.db.customers.save_changes(customer)
+
+            try:
+                if hasattr(event, "message") and event.message: await data["ctx"].update_messages_log(event.message)
+            except Exception as e: 
+                logging.getLogger(__name__).exception(f"Failed to update messages log: {e}")
+            
+            return await handler(event, data)
+        finally:
+            await fsm.flush()
     
     async def stop(self):
         if not self.initialized: return
         
         if self.services.notificators: await self.services.notificators.stop()
+        if self.services.catalog: await self.services.catalog.close()
         if self.services.db: await self.services.db.close()
         if self.services.tax: await self.services.tax.close()
         if self.services.placeholders: await self.services.placeholders.close()
         if self.services.currency_converter: await self.services.currency_converter.close()
         if self.services.media_saver: await self.services.media_saver.close()
+        # общий клиент Mongo закрывается последним: сервисы выше могут писать в БД при закрытии
+        await close_mongo_client()
         
 class ErrorLoggingMiddleware(BaseMiddleware):
     async def __call__(
@@ -103,11 +141,10 @@ class ErrorLoggingMiddleware(BaseMiddleware):
             raise e
 
 class ThrottlingMiddleware(BaseMiddleware):
-    default = TTLCache(maxsize=25_000, ttl=.25)
-    # Храним временные метки запросов пользователя (user_id -> [timestamps])
-    user_requests = TTLCache(maxsize=25_000, ttl=30)
-    # Храним "забаненных" пользователей (user_id -> время окончания бана)
-    banned_users = TTLCache(maxsize=25_000, ttl=15)
+    def __init__(self, backend: Optional[ThrottleBackend] = None):
+        super().__init__()
+        # по умолчанию лимиты считаются в памяти процесса
+        self.backend = backend or MemoryThrottleBackend()
 
     async def __call__(
         self,
@@ -125,25 +162,13 @@ class ThrottlingMiddleware(BaseMiddleware):
             return
         
         user_id = data["event_from_user"].id
-        # Проверяем, не забанен ли пользователь
-        if user_id in self.banned_users:
-            return
+        verdict = await self.backend.hit(user_id)
         
-        if user_id in self.default:
-            now = time.time()
-            # Получаем список временных меток запросов пользователя
-            timestamps = self.user_requests.get(user_id, [])
-            # Оставляем только те, что были за последние 30 секунд
-            timestamps = [ts for ts in timestamps if now - ts < 30]
-            timestamps.append(now)
-            self.user_requests[user_id] = timestamps
-
-            if len(timestamps) > 5:
-                # Баним пользователя на 15 секунд
-                self.banned_users[user_id] = None
-                return await getattr(event, "message", event).answer("Throttled for 15 seconds.")
-        else:
-            self.default[user_id] = None
+        if verdict == ThrottleVerdict.banned:
+            return
+        if verdict == ThrottleVerdict.throttled:
+            # Баним пользователя на 15 секунд
+            return await getattr(event, "message", event).answer("Throttled for 15 seconds.")
 
         return await handler(event, data)
 
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from core.helper_classes import Context
+    from core.services.db import DatabaseService
+    from schemas.db_models import Category, DeliveryService, Product, ProductAdditional
+
+
+class CatalogCache:
+    """
+    Категории, товары, дополнения и службы доставки в памяти процесса.
+    Данные перечитываются целиком, когда меняется версия каталога: её поднимает любая запись
+    через CatalogRepository, а другие воркеры узнают об этом через InvalidationBus.
+    Наружу отдаются копии моделей: хендлеры их изменяют и сохраняют в FSM.
+    """
+
+    def __init__(self, db: "DatabaseService"):
+        self.db = db
+        self.logger = logging.getLogger(__name__)
+
+        self.version = -1
+        self._categories: list["Category"] = []
+        self._products: dict = {}                                        # id -> Product
+        self._products_by_category: dict[str, list["Product"]] = {}      # отсортированы по _id
+        self._visible_by_category: dict[str, list["Product"]] = {}
+        self._additionals_by_category: dict[str, list["ProductAdditional"]] = {}
+        self._delivery_services: dict = {}                               # id -> DeliveryService
+
+        self._reload_lock = asyncio.Lock()
+        self._start_task = asyncio.create_task(self._start())
+
+    async def reload(self, version: Optional[int] = None):
+        async with self._reload_lock:
+            # версию читаем до данных: если каталог изменится во время загрузки, следующая проверка перечитает его снова
+            version = await self.db.get_catalog_version() if version is None else version
+            if version <= self.version: return
+
+            categories, products, additionals, delivery_services = await asyncio.gather(
+                self.db.categories.find_by({}, sort=[("_id", 1)]),
+                self.db.products.find_by({}, sort=[("_id", 1)]),
+                self.db.additionals.find_by({}, sort=[("_id", 1)]),
+                self.db.delivery_services.find_by({}, sort=[("_id", 1)])
+            )
+
+            products_by_category, visible_by_category, additionals_by_category = {}, {}, {}
+            for product in products:
+                products_by_category.setdefault(product.category, []).append(product)
+                if product.visible: visible_by_category.setdefault(product.category, []).append(product)
+            for additional in additionals:
+                additionals_by_category.setdefault(additional.category, []).append(additional)
+
+            self._categories = list(categories)
+            self._products = {product.id: product for product in products}
+            self._products_by_category = products_by_category
+            self._visible_by_category = visible_by_category
+            self._additionals_by_category = additionals_by_category
+            self._delivery_services = {service.id: service for service in delivery_services}
+            self.version = version
+
+            self.logger.info(f"Catalog cache loaded, version {self.version}")
+
+    async def _ensure_fresh(self):
+        if self.version < 0 or self.version < self.db.catalog_version_written:
+            await self.reload()
+
+    async def _start(self):
+        try:
+            await self.db.invalidation.subscribe(self.db.CATALOG_TOPIC, self._on_invalidated)
+            await self.reload()
+        except Exception as e:
+            self.logger.exception(f"Failed to load catalog cache: {e}")
+
+    async def _on_invalidated(self, _keys: Optional[set[str]]):
+        # каталог небольшой и перечитывается целиком
+        await self.reload()
+
+    async def close(self):
+        if self._start_task and not self._start_task.done():
+            self._start_task.cancel()
+            try:
+                await self._start_task
+            except asyncio.CancelledError:
+                pass  # Ожидаемое исключение при отмене задачи
+
+    async def get_categories(self) -> list["Category"]:
+        await self._ensure_fresh()
+        return [category.model_copy(deep=True) for category in self._categories]
+
+    async def find_category_by_localized_name(self, name: str, ctx: "Context") -> Optional["Category"]:
+        await self._ensure_fresh()
+        category = next((category for category in self._categories if category.localized_name.get(ctx) == name), None)
+        return category.model_copy(deep=True) if category else None
+
+    def _category_products(self, category: str, only_visible: bool) -> list["Product"]:
+        return (self._visible_by_category if only_visible else self._products_by_category).get(category, [])
+
+    async def count_in_category(self, category: str, only_visible: bool = True) -> int:
+        await self._ensure_fresh()
+        return len(self._category_products(category, only_visible))
+
+    async def find_by_category_and_index(self, category: str, idx: int, only_visible: bool = True) -> Optional["Product"]:
+        product, _ = await self.find_by_category_and_index_with_count(category, idx, only_visible)
+        return product
+
+    async def find_by_category_and_index_with_count(self, category: str, idx: int, only_visible: bool = True) -> tuple[Optional["Product"], int]:
+        await self._ensure_fresh()
+        products = self._category_products(category, only_visible)
+        product = products[idx].model_copy(deep=True) if 0 <= idx < len(products) else None
+        return product, len(products)
+
+    async def get_product(self, product_id) -> Optional["Product"]:
+        await self._ensure_fresh()
+        product = self._products.get(product_id)
+        return product.model_copy(deep=True) if product else None
+
+    async def get_additionals(self, product: "Product") -> list["ProductAdditional"]:
+        """Дополнения категории товара, разрешённые для него (как AdditionalsRepository.get)"""
+        await self._ensure_fresh()
+        return [additional.model_copy(deep=True) for additional in self._additionals_by_category.get(product.category, [])
+                if product.id not in additional.disallowed_products]
+
+    async def get_delivery_services(self, is_foreign: bool) -> list["DeliveryService"]:
+        await self._ensure_fresh()
+        return [service.model_copy(deep=True) for service in self._delivery_services.values() if service.is_foreign == is_foreign]
+
+    async def get_delivery_service(self, service_id) -> Optional["DeliveryService"]:
+        await self._ensure_fresh()
+        service = self._delivery_services.get(service_id)
+        return service.model_copy(deep=True) if service else None
+
+
+__all__ = [
+    "CatalogCache"
+]
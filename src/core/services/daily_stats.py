@@ -0,0 +1,189 @@
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from bson import Decimal128, ObjectId
+from pymongo import UpdateOne
+
+from core.types.enums import CartItemSource
+
+if TYPE_CHECKING:
+    from core.services.db import DatabaseService
+    from schemas.db_models import CartEntry, Order
+
+
+@dataclass
+class DailyTotals:
+    """Сумма дневных сводок за период"""
+    orders: int = 0                                                # сформированные заказы
+    items: dict[ObjectId, int] = field(default_factory=dict)       # товар -> заказанное количество
+    discounted: int = 0                                            # заказанные товары уценки
+    paid_orders: int = 0
+    revenue: dict[str, Decimal] = field(default_factory=dict)      # валюта -> сумма оплаченных заказов
+
+
+def _day(moment: datetime) -> str:
+    # naive datetime (payment_time из /confirm_manual_payment) - местное время процесса (TZ), как и в чеках;
+    # astimezone() переводит его в UTC так же, как и aware
+    return moment.astimezone(timezone.utc).date().isoformat()
+
+
+def _add(inc: dict, key: str, value):
+    inc[key] = inc.get(key, 0) + value
+
+
+def _formed_inc(entries: Iterable[tuple[str, ObjectId, int]], sign: int) -> dict:
+    """$inc для дня формирования заказа по записям (source_type, source_id, quantity)"""
+    inc = {"orders": sign}
+    for source_type, source_id, quantity in entries:
+        if source_type == CartItemSource.discounted:
+            _add(inc, "discounted", sign)
+        else:
+            _add(inc, f"items.{source_id}", sign * quantity)
+    return inc
+
+
+def _paid_inc(currency: str, amount: Decimal) -> dict:
+    return {"paid_orders": 1, f"revenue.{currency}": amount}
+
+
+def _merge_inc(inc: dict, other: dict):
+    for key, value in other.items():
+        _add(inc, key, value)
+
+
+def _to_bson(inc: dict) -> dict:
+    return {key: Decimal128(str(value)) if isinstance(value, Decimal) else value for key, value in inc.items()}
+
+
+class DailyStatsRollup:
+    """
+    Дневные сводки продаж в коллекции stats_daily (_id - дата "YYYY-MM-DD" в UTC).
+    Обновляются через $inc при формировании/расформировании и оплате заказа,
+    так что отчёт за любой период читает не больше одного документа на день.
+    """
+
+    COLLECTION = "stats_daily"
+    BACKFILL_BATCH_SIZE = 500
+
+    def __init__(self, dbs: "DatabaseService"):
+        self.dbs = dbs
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def collection(self):
+        return self.dbs.db[self.COLLECTION]
+
+    async def _inc(self, day: str, inc: dict):
+        await self.collection.update_one({"_id": day}, {"$inc": _to_bson(inc)}, upsert=True)
+
+    async def record_order_formed(self, order: "Order", entries: Iterable["CartEntry"], sign: int = 1):
+        entries = [(entry.source_type, entry.source_id, entry.quantity) for entry in entries]
+        await self._inc(_day(order.id.generation_time), _formed_inc(entries, sign))
+
+    async def record_order_unformed(self, order: "Order", entries: Iterable["CartEntry"]):
+        # вычитаем из дня создания заказа, а не из текущего
+        await self.record_order_formed(order, entries, sign=-1)
+
+    async def record_payment(self, order: "Order"):
+        price_details = order.price_details
+        if not price_details.total_price: return
+
+        await self._inc(_day(price_details.payment_time or order.id.generation_time),
+                        _paid_inc(price_details.total_price.currency, price_details.total_price.amount))
+
+    async def totals(self, since: Optional[date] = None, until: Optional[date] = None) -> DailyTotals:
+        """Суммирует сводки за дни [since; until] включительно"""
+        query = {}
+        if since: query.setdefault("_id", {})["$gte"] = since.isoformat()
+        if until: query.setdefault("_id", {})["$lte"] = until.isoformat()
+
+        totals = DailyTotals()
+        async for document in self.collection.find(query):
+            totals.orders += document.get("orders", 0)
+            totals.discounted += document.get("discounted", 0)
+            totals.paid_orders += document.get("paid_orders", 0)
+            for product_id, quantity in document.get("items", {}).items():
+                totals.items[ObjectId(product_id)] = totals.items.get(ObjectId(product_id), 0) + quantity
+            for currency, amount in document.get("revenue", {}).items():
+                totals.revenue[currency] = totals.revenue.get(currency, Decimal(0)) + Decimal(str(amount))
+        return totals
+
+    async def needs_backfill(self) -> bool:
+        """Сводок ещё нет, а заказы уже есть - например, сразу после появления сводок в проекте. Пересчёт - /rebuild_stats"""
+        if await self.collection.estimated_document_count(): return False
+        return await self.dbs.orders.get_collection().estimated_document_count() > 0
+
+    async def rebuild(self) -> int:
+        """
+        Пересчитывает сводки из orders и cart_entries, читая заказы батчами. Сформированными считаются заказы
+        с привязанными записями корзины - те же, что учитывают record_order_formed/record_order_unformed.
+        Запускается только вручную через /rebuild_stats.
+        Результат собирается во временной коллекции и подменяет stats_daily целиком (rename с dropTarget),
+        поэтому $inc, сделанные в stats_daily во время пересчёта (формирование, расформирование и оплата заказов),
+        теряются, а заказы, изменившиеся после того, как курсор их прочитал, учитываются в старом состоянии.
+        Запускать в тихое время; повторный пересчёт исправляет такие расхождения.
+        """
+        target = self.dbs.db[f"{self.COLLECTION}_rebuild"]
+        await target.drop()
+
+        processed = 0
+        batch: list[dict] = []
+
+        async def flush_batch():
+            nonlocal processed
+            entries = defaultdict(list)
+            cursor = self.dbs.cart_entries.get_collection().find(
+                {"order_id": {"$in": [order["_id"] for order in batch]}},
+                projection={"order_id": 1, "source_type": 1, "source_id": 1, "quantity": 1}
+            )
+            async for entry in cursor:
+                entries[entry["order_id"]].append((entry.get("source_type", CartItemSource.product),
+                                                   entry["source_id"],
+                                                   entry.get("quantity", 1)))
+
+            days: dict[str, dict] = defaultdict(dict)
+            for order in batch:
+                # как и record_order_formed: заказ учитывается, только когда к нему привязаны записи корзины
+                if entries[order["_id"]]:
+                    _merge_inc(days[_day(order["_id"].generation_time)], _formed_inc(entries[order["_id"]], 1))
+
+                price_details = order.get("price_details") or {}
+                total_price = price_details.get("total_price")
+                if price_details.get("customer_paid") and total_price:
+                    _merge_inc(days[_day(price_details.get("payment_time") or order["_id"].generation_time)],
+                               _paid_inc(total_price["currency"], Decimal(str(total_price["amount"]))))
+
+            if days:
+                await target.bulk_write([UpdateOne({"_id": day}, {"$inc": _to_bson(inc)}, upsert=True) for day, inc in days.items()])
+            processed += len(batch)
+            batch.clear()
+
+        cursor = self.dbs.orders.get_collection().find(
+            {},
+            projection={"price_details.customer_paid": 1, "price_details.payment_time": 1, "price_details.total_price": 1},
+            batch_size=self.BACKFILL_BATCH_SIZE
+        ).sort("_id", 1)
+        async for order in cursor:
+            batch.append(order)
+            if len(batch) >= self.BACKFILL_BATCH_SIZE:
+                await flush_batch()
+        if batch:
+            await flush_batch()
+
+        if await target.estimated_document_count():
+            await target.rename(self.COLLECTION, dropTarget=True)
+        else:
+            await self.collection.drop()
+
+        self.logger.info(f"Rebuilt {self.COLLECTION} from {processed} orders")
+        return processed
+
+
+__all__ = [
+    "DailyTotals",
+    "DailyStatsRollup"
+]
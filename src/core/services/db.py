@@ -1,9 +1,18 @@
 import asyncio
+import hashlib
+import json
 import logging
 
-from pymongo import AsyncMongoClient, ASCENDING
+from typing import Optional
 
-from configs.environment import MONGO_URI, MONGO_TLS_CA_PATH, MONGO_TLS_KEY_PATH
+from pymongo import AsyncMongoClient
+
+from configs.environment import DEBUG, MONGO_DB_NAME
+from core.services.daily_stats import DailyStatsRollup
+from core.services.indexes import IndexManager
+from core.services.invalidation import InvalidationBus
+from core.services.lease import MongoLease
+from core.services.mongo import get_mongo_client
 from schemas.db_models import *
 
 _REPO_REGISTRY: dict[str, type[AppAbstractRepository]] = {
@@ -24,6 +33,9 @@ _REPO_REGISTRY: dict[str, type[AppAbstractRepository]] = {
 
 class DatabaseService:
     
+    STARTUP_WAIT_TIMEOUT = 120
+    CATALOG_TOPIC = "catalog"
+    
     logs: LogsRepository
     giveaways: GiveawaysRepository
     placeholders: PlaceholdersRepository
@@ -38,23 +50,27 @@ class DatabaseService:
     inviters: InvitersRepository
     promocodes: PromocodesRepository
     
-    def __init__(self, db_name="Shop"):
-        self.client = AsyncMongoClient(MONGO_URI, 
-                                       tls=True,
-                                       tlsCAFile=MONGO_TLS_CA_PATH,
-                                       tlsCertificateKeyFile=MONGO_TLS_KEY_PATH)
+    def __init__(self, db_name=MONGO_DB_NAME, client: Optional[AsyncMongoClient] = None):
+        # клиент закрывает тот, кто его создал: переданный - вызывающий код, общий - close_mongo_client()
+        self.client = client or get_mongo_client()
         self.db = self.client.get_database(db_name)
         
         self.repositories: dict[str, AppAbstractRepository] = {}
+        self.indexes = IndexManager(self)
+        self.daily_stats = DailyStatsRollup(self)
+        self.invalidation = InvalidationBus(self.db)
+        self.catalog_version_written = 0
+        self._startup_task: Optional[asyncio.Task] = None
 
         self._init_collections()
         
         logging.getLogger(__name__).info("Database service initialized.")
         
     @classmethod
-    async def create(cls, db_name: str = "Shop") -> "DatabaseService":
-        instance = cls(db_name)
+    async def create(cls, db_name: str = MONGO_DB_NAME, client: Optional[AsyncMongoClient] = None) -> "DatabaseService":
+        instance = cls(db_name, client)
         await instance.prepare()
+        await instance.customers.subscribe_invalidations()
         return instance
 
     def _init_collections(self):
@@ -63,21 +79,40 @@ class DatabaseService:
             self.repositories[name] = repo
             setattr(self, name, repo)
 
-    async def _create_indexes(self):
-        await self.db["placeholders"].create_index([("key", ASCENDING)], unique=True)
+    def _indexes_fingerprint(self) -> str:
+        declared = sorted(
+            (name, index.document["name"], list(index.document["key"].items()), bool(index.document.get("unique")),
+             index.document.get("partialFilterExpression"))
+            for name, repo in self.repositories.items()
+            for index in self.indexes.declared_indexes(repo)
+        )
+        return hashlib.sha1(json.dumps(declared, default=str).encode()).hexdigest()
+    
+    async def _get_startup_state(self) -> dict:
+        return await self.db.startup_state.find_one({"_id": "schema"}) or {}
+    
+    async def _set_startup_state(self, **fields):
+        await self.db.startup_state.update_one({"_id": "schema"}, {"$set": fields}, upsert=True)
+
+    async def _sync_indexes(self):
+        try:
+            # при ошибках отпечаток не сохраняем - следующий запуск повторит синхронизацию
+            if not await self.indexes.sync():
+                await self._set_startup_state(indexes=self._indexes_fingerprint())
+            if DEBUG: await self.indexes.check_query_plans()
+        except Exception as e:
+            logging.getLogger(__name__).exception(f"Index sync failed: {e}")
+            
+    async def _background_startup(self, lease: MongoLease):
+        try:
+            await self._sync_indexes()
+        finally:
+            await lease.release()
         
-        await self.db["orders"].create_index([("customer_id", ASCENDING)])
-        await self.db["orders"].create_index([("number", ASCENDING)], unique=True)
-
-        await self.db["cart_entries"].create_index([("customer_id", ASCENDING)])
-
-        await self.db["customers"].create_index([("user_id", ASCENDING)], unique=True)
-
-        await self.db["categories"].create_index([("name", ASCENDING)], unique=True)
-
-        await self.db["inviters"].create_index([("customer_id", ASCENDING)], unique=True)
-
-        await self.db["promocodes"].create_index([("code", ASCENDING)], unique=True)
+    async def _needs_migrations(self) -> bool:
+        # отпечаток версий схем не годится: документы старой схемы могут записать воркеры, ещё работающие на старом коде
+        results = await asyncio.gather(*(repo.has_outdated_documents() for repo in self.repositories.values()))
+        return any(results)
         
     async def _check_migrations(self):
         semaphore = asyncio.Semaphore(3)
@@ -98,8 +133,57 @@ class DatabaseService:
         
 
     async def prepare(self):
-        await self._create_indexes()
-        await self._check_migrations()
+        """
+        Индексы и миграции выполняет только один воркер, получивший аренду startup в Mongo.
+        Миграции нужны, пока в коллекциях есть документы со schema_version ниже текущей;
+        остальные воркеры ждут, пока лидер их переведёт, и не повторяют ту же работу.
+        Дневная статистика при запуске не пересчитывается: пересчёт подменяет коллекцию целиком и теряет $inc,
+        сделанные во время него, поэтому запускается только вручную через /rebuild_stats.
+        """
+        logger = logging.getLogger(__name__)
+        indexes_fp = self._indexes_fingerprint()
+        lease = MongoLease(self.db.locks, "startup")
+        waited = 0.0
+        
+        while True:
+            state = await self._get_startup_state()
+            need_migrations = await self._needs_migrations()
+            need_indexes = state.get("indexes") != indexes_fp
+            
+            if not need_migrations and not need_indexes:
+                break
+            
+            if await lease.acquire():
+                # состояние могло измениться, пока предыдущий лидер держал аренду
+                state = await self._get_startup_state()
+                
+                if await self._needs_migrations():
+                    try:
+                        await self._check_migrations()
+                    except Exception:
+                        await lease.release()
+                        raise
+                    
+                if state.get("indexes") != indexes_fp:
+                    # индексы строятся в фоне, чтобы не задерживать запуск; аренда отпускается по завершении
+                    self._startup_task = asyncio.create_task(self._background_startup(lease))
+                else:
+                    await lease.release()
+                break
+            
+            if not need_migrations:
+                # индексы строит другой воркер, миграции уже выполнены
+                break
+            
+            if waited >= self.STARTUP_WAIT_TIMEOUT:
+                logger.warning("Timed out waiting for migrations in another worker, starting with current schema.")
+                break
+            
+            await asyncio.sleep(1)
+            waited += 1
+        
+        if await self.daily_stats.needs_backfill():
+            logger.warning("Daily stats are empty while orders exist, run /rebuild_stats to fill them.")
         
 
     async def get_next_for_counter(self, name):
@@ -113,6 +197,33 @@ class DatabaseService:
 
         return counter["value"]
     
+    async def reserve_counter_block(self, name, size: int) -> int:
+        """Резервирует size значений счётчика одним запросом и возвращает последнее из них"""
+        counter = await self.db.counters.find_one_and_update(
+            {"name": name},
+            {"$inc": {"value": size}},
+            upsert=True,
+            return_document=True
+        )
+
+        return counter["value"]
+    
+    async def get_catalog_version(self) -> int:
+        return await self.invalidation.get_version(self.CATALOG_TOPIC)
+    
+    async def bump_catalog_version(self) -> int:
+        """Поднимает версию каталога после записи в его коллекции; кеши каталога во всех воркерах перечитают данные"""
+        version = await self.invalidation.publish(self.CATALOG_TOPIC)
+        # свой воркер видит изменения сразу, не дожидаясь события шины
+        self.catalog_version_written = max(self.catalog_version_written, version)
+        return version
+    
     async def close(self):
-        await self.client.close()
+        if self._startup_task and not self._startup_task.done():
+            self._startup_task.cancel()
+            try:
+                await self._startup_task
+            except asyncio.CancelledError:
+                pass  # Ожидаемое исключение при отмене задачи
+        await self.invalidation.close()
         logging.getLogger(__name__).info("Database service closed.")
\ No newline at end of file
@@ -0,0 +1,174 @@
+import logging
+from typing import TYPE_CHECKING, Any, Optional
+
+from bson import ObjectId
+from pymongo import IndexModel
+from pymongo.errors import PyMongoError
+
+if TYPE_CHECKING:
+    from core.services.db import DatabaseService
+    from schemas.db_models import AppAbstractRepository
+
+
+# Типичные запросы репозиториев для проверки планов через explain(): (фильтр, сортировка)
+QUERY_SHAPES: dict[str, list[tuple[dict, Optional[list[tuple[str, int]]]]]] = {
+    "placeholders": [({"key": ""}, None)],
+    "orders": [
+        ({"customer_id": ObjectId()}, None),
+        ({"puid": ""}, None),
+        ({"state.key": {"$ne": "received"}}, None)
+    ],
+    "cart_entries": [
+        ({"customer_id": ObjectId(), "order_id": None}, [("_id", 1)]),
+        ({"order_id": ObjectId()}, [("_id", 1)]),
+        ({"source_id": ObjectId(), "order_id": None}, None)
+    ],
+    "products": [({"category": "", "visible": True}, [("_id", 1)])],
+    "additionals": [({"category": ""}, None)],
+    "promocodes": [({"code": ""}, None)],
+    "inviters": [({"customer_id": ObjectId()}, None)],
+    "delivery_services": [({"is_foreign": False}, None)],
+    "customers": [
+        ({"user_id": 0}, None),
+        ({"invited_by": ObjectId()}, None)
+    ],
+    "categories": [({"name": ""}, None)]
+}
+
+
+def _find_stages(plan: dict[str, Any]) -> set[str]:
+    stages = {plan.get("stage")}
+    for key in ("inputStage", "queryPlan"):
+        if key in plan: stages |= _find_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages |= _find_stages(child)
+    return stages
+
+
+class IndexManager:
+    """Сверяет индексы, объявленные в Meta.indexes репозиториев, с существующими в БД"""
+
+    REBUILD_SUFFIX = "_rebuilt"
+
+    def __init__(self, dbs: "DatabaseService"):
+        self.dbs = dbs
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def declared_indexes(repo: "AppAbstractRepository") -> list[IndexModel]:
+        return list(getattr(repo.Meta, "indexes", []))
+
+    @staticmethod
+    def _differs(info: dict[str, Any], index: IndexModel) -> bool:
+        """Совпадает имя, но не ключи или опции - такой индекс нужно пересоздать"""
+        document = index.document
+        return (list(info["key"]) != [(field, direction) for field, direction in document["key"].items()]
+                or bool(info.get("unique")) != bool(document.get("unique"))
+                or info.get("partialFilterExpression") != document.get("partialFilterExpression"))
+
+    async def diff(self, repo: "AppAbstractRepository") -> tuple[list[IndexModel], list[str], list[tuple[IndexModel, str]], list[str]]:
+        """
+        Возвращает (отсутствующие в БД индексы, лишние индексы в БД, изменившиеся индексы с именем существующего,
+        старые индексы, уже заменённые пересобранными). Пересобранный индекс может называться <имя>_rebuilt.
+        """
+        declared = {index.document["name"]: index for index in self.declared_indexes(repo)}
+        existing = await repo.get_collection().index_information()
+
+        missing, changed, superseded, known = [], [], [], set()
+        for name, index in declared.items():
+            present = [candidate for candidate in (name, name + self.REBUILD_SUFFIX) if candidate in existing]
+            known.update(present)
+            matching = [candidate for candidate in present if not self._differs(existing[candidate], index)]
+
+            if matching:
+                # пересборка прервалась после построения нового индекса - старый можно удалять
+                superseded.extend(candidate for candidate in present if candidate not in matching)
+            elif present:
+                changed.append((index, present[0]))
+            else:
+                missing.append(index)
+
+        extra = [name for name in existing if name != "_id_" and name not in known]
+        return missing, extra, changed, superseded
+
+    async def _rebuild(self, repo: "AppAbstractRepository", index: IndexModel, existing_name: str) -> bool:
+        """
+        Ключи и опции существующего индекса поменять нельзя: новый индекс строится рядом под другим именем,
+        и только после успешного построения удаляется старый. Если построить не удалось, старый индекс остаётся.
+        """
+        collection = repo.get_collection()
+        name = index.document["name"]
+        target = name + self.REBUILD_SUFFIX if existing_name == name else name
+        options = {key: value for key, value in index.document.items() if key not in ("key", "name")}
+
+        self.logger.warning(f"Index {existing_name} in {repo._collection_name} differs from declared, building {target} next to it")
+        try:
+            await collection.create_indexes([IndexModel(list(index.document["key"].items()), name=target, **options)])
+        except PyMongoError as e:
+            # например, дубликаты под новым уникальным индексом или тот же ключ с другими опциями (IndexOptionsConflict)
+            self.logger.error(f"Failed to build index {target} in {repo._collection_name}, keeping {existing_name}: {e}")
+            return False
+
+        await collection.drop_index(existing_name)
+        self.logger.info(f"Index {existing_name} in {repo._collection_name} replaced with {target}")
+        return True
+
+    async def _sync_repo(self, repo: "AppAbstractRepository"):
+        missing, extra, changed, superseded = await self.diff(repo)
+        collection = repo.get_collection()
+
+        # выполняется под арендой startup, так что пересборкой занят только один воркер
+        rebuilt = [await self._rebuild(repo, index, existing_name) for index, existing_name in changed]
+        for name in superseded:
+            await collection.drop_index(name)
+            self.logger.info(f"Dropped index {name} in {repo._collection_name} replaced by a rebuilt one")
+
+        if missing:
+            names = await collection.create_indexes(missing)
+            self.logger.info(f"Created indexes {', '.join(names)} in {repo._collection_name} collection")
+        for name in extra:
+            self.logger.warning(f"Index {name} in {repo._collection_name} is not declared in Meta.indexes and can be dropped")
+
+        if not all(rebuilt):
+            raise RuntimeError(f"{rebuilt.count(False)} changed indexes in {repo._collection_name} were not rebuilt")
+
+    async def sync(self) -> list[str]:
+        """
+        Создаёт недостающие и пересоздаёт изменившиеся индексы всех репозиториев.
+        Ошибка в одной коллекции (например, дубликаты под уникальным индексом) не мешает остальным.
+        Возвращает имена коллекций, индексы которых синхронизировать не удалось.
+        """
+        failed = []
+        for name, repo in self.dbs.repositories.items():
+            try:
+                await self._sync_repo(repo)
+            except Exception as e:
+                self.logger.exception(f"Failed to sync indexes of {repo._collection_name}: {e}")
+                failed.append(name)
+
+        if failed:
+            self.logger.error(f"Indexes were not synced for: {', '.join(failed)}")
+        return failed
+
+    async def plan_stages(self, repo: "AppAbstractRepository", query: dict, sort: Optional[list[tuple[str, int]]] = None) -> set[str]:
+        """Стадии выигравшего плана запроса по explain()"""
+        cursor = repo.get_collection().find(repo._map_id(query))
+        if sort: cursor = cursor.sort(repo._map_sort(sort))
+
+        return _find_stages((await cursor.explain())["queryPlanner"]["winningPlan"])
+
+    async def uses_index(self, repo: "AppAbstractRepository", query: dict, sort: Optional[list[tuple[str, int]]] = None) -> bool:
+        return "COLLSCAN" not in await self.plan_stages(repo, query, sort)
+
+    async def check_query_plans(self) -> list[str]:
+        """Прогоняет QUERY_SHAPES через explain() и возвращает запросы, выполняемые полным сканированием"""
+        collscans = []
+        for name, shapes in QUERY_SHAPES.items():
+            repo = self.dbs.repositories[name]
+            for query, sort in shapes:
+                if not await self.uses_index(repo, query, sort):
+                    collscans.append(f"{name}: {query} sort={sort}")
+
+        for entry in collscans:
+            self.logger.warning(f"COLLSCAN: {entry}")
+        return collscans
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable, Optional
+
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import OperationFailure, PyMongoError
+
+# keys=None - изменилось неизвестно что, подписчик перечитывает всё
+InvalidationCallback = Callable[[Optional[set[str]]], Awaitable[None]]
+
+
+class InvalidationBus:
+    """
+    Шина инвалидации кешей между воркерами.
+    На каждую тему (topic) в коллекции invalidations хранится один документ: счётчик версии
+    и последние RECENT_LIMIT изменений с их ключами. Публикация - один атомарный update.
+    Воркеры узнают об изменениях через change stream, а на standalone-сервере без реплика-сета -
+    опросом этой маленькой коллекции раз в POLL_INTERVAL секунд.
+    """
+
+    COLLECTION = "invalidations"
+    RECENT_LIMIT = 50
+    POLL_INTERVAL = 2
+    RESTART_DELAY = 5
+
+    def __init__(self, db: AsyncDatabase):
+        self.collection = db[self.COLLECTION]
+        self.logger = logging.getLogger(__name__)
+
+        self._subscribers: dict[str, list[InvalidationCallback]] = {}
+        self._versions: dict[str, int] = {}  # последняя обработанная версия темы
+        self._listen_task: Optional[asyncio.Task] = None
+
+    async def publish(self, topic: str, keys: Optional[Iterable[str]] = None) -> int:
+        """Сообщает всем воркерам об изменении ключей keys темы topic (None - всей темы). Возвращает новую версию"""
+        version = {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+        change = {"version": version, "keys": None if keys is None else {"$literal": list(keys)}}
+
+        document = await self.collection.find_one_and_update(
+            {"_id": topic},
+            [
+                {"$set": {
+                    "recent": {"$slice": [{"$concatArrays": [{"$ifNull": ["$recent", []]}, [change]]}, -self.RECENT_LIMIT]},
+                    "version": version
+                }}
+            ],
+            upsert=True,
+            return_document=True,
+            projection={"version": 1}
+        )
+        return document["version"]
+
+    async def get_version(self, topic: str) -> int:
+        document = await self.collection.find_one({"_id": topic}, projection={"version": 1})
+        return document["version"] if document else 0
+
+    async def subscribe(self, topic: str, callback: InvalidationCallback):
+        """Подписывает callback на изменения темы. Изменения, опубликованные до подписки, не доставляются"""
+        if topic not in self._versions:
+            self._versions[topic] = await self.get_version(topic)
+        self._subscribers.setdefault(topic, []).append(callback)
+
+        if not self._listen_task:
+            self._listen_task = asyncio.create_task(self._listen())
+
+    def _changed_keys(self, document: dict) -> Optional[tuple[int, Optional[set[str]]]]:
+        """(новая версия, изменённые ключи) или None, если новых изменений нет"""
+        topic, version = document["_id"], document.get("version", 0)
+        seen = self._versions.get(topic, 0)
+        if version <= seen: return None
+
+        missed = [change for change in document.get("recent", []) if change["version"] > seen]
+        # часть изменений уже вытеснена из recent или кто-то поменял тему целиком
+        if len(missed) < version - seen or any(change.get("keys") is None for change in missed):
+            return version, None
+        return version, {key for change in missed for key in change["keys"]}
+
+    async def _dispatch(self, document: dict):
+        topic = document["_id"]
+        if topic not in self._subscribers: return
+
+        changed = self._changed_keys(document)
+        if changed is None: return
+
+        version, keys = changed
+        self._versions[topic] = version
+        for callback in self._subscribers[topic]:
+            try:
+                await callback(keys)
+            except Exception as e:
+                self.logger.exception(f"Invalidation callback for {topic} failed: {e}")
+
+    async def _poll_once(self):
+        async for document in self.collection.find({"_id": {"$in": list(self._subscribers)}}):
+            await self._dispatch(document)
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        async with await self.collection.watch(pipeline, full_document="updateLookup") as stream:
+            # изменения между подпиской и открытием стрима
+            await self._poll_once()
+            async for change in stream:
+                if document := change.get("fullDocument"):
+                    await self._dispatch(document)
+
+    async def _poll(self):
+        while True:
+            try:
+                await self._poll_once()
+            except PyMongoError as e:
+                self.logger.warning(f"Invalidation polling failed: {e}")
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def _listen(self):
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                # 40573: change streams доступны только на реплика-сетах и шардированных кластерах
+                if e.code == 40573:
+                    self.logger.info("Change streams are not supported by the server, polling invalidations instead.")
+                    await self._poll()
+                self.logger.warning(f"Invalidation change stream failed, restarting: {e}")
+            except Exception as e:
+                self.logger.warning(f"Invalidation change stream failed, restarting: {e}")
+            await asyncio.sleep(self.RESTART_DELAY)
+
+    async def close(self):
+        if self._listen_task:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass  # Ожидаемое исключение при отмене задачи
+            self._listen_task = None
+
+
+__all__ = [
+    "InvalidationCallback",
+    "InvalidationBus"
+]
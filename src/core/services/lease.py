@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import uuid4
+
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import DuplicateKeyError
+
+
+class MongoLease:
+    """
+    Аренда (lock с истечением) на документе в Mongo: держать её может только один процесс.
+    Пока аренда удерживается, она продлевается в фоне; если процесс упал, она истекает через ttl.
+    """
+
+    def __init__(self, collection: AsyncCollection, name: str, ttl: int = 60):
+        self.collection = collection
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+
+        self._renew_task: Optional[asyncio.Task] = None
+
+    async def acquire(self) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"expires_at": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # документ есть, но аренда чужая и ещё не истекла
+            return False
+
+        self._renew_task = asyncio.create_task(self._renew_loop())
+        return True
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self.collection.update_one(
+                    {"_id": self.name, "owner": self.owner},
+                    {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl)}}
+                )
+            except Exception as e:
+                logging.getLogger(__name__).exception(f"Failed to renew lease {self.name}: {e}")
+
+    async def release(self):
+        if self._renew_task:
+            self._renew_task.cancel()
+            try:
+                await self._renew_task
+            except asyncio.CancelledError:
+                pass  # Ожидаемое исключение при отмене задачи
+            self._renew_task = None
+
+        await self.collection.delete_one({"_id": self.name, "owner": self.owner})
@@ -1,9 +1,10 @@
 import asyncio
 import json
+import logging
 import os
 from os.path import join, splitext, relpath
 from os import getenv
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Optional, Union
 
 from aiogram import Bot
 from aiogram.types import BufferedInputFile
@@ -11,17 +12,25 @@ from aiogram.types import BufferedInputFile
 from configs.languages import SUPPORTED_LANGUAGES_TEXT
 from core.types.enums import MediaType
 
+if TYPE_CHECKING:
+    from core.services.invalidation import InvalidationBus
+
 
 class MediaSaver:
+    """
+    Кеш file_id медиа из MEDIA_PATH. Новые файлы загружаются в Telegram по update_cache (/update_media),
+    после чего остальные воркеры перечитывают data.json по событию InvalidationBus.
+    """
     
-    REFRESH_INTERVAL = 15 * 60  # 15m
+    INVALIDATION_TOPIC = "media"
     
-    def __init__(self, media_path: str = None, bot: Bot = None):
+    def __init__(self, media_path: str = None, bot: Bot = None, invalidation: Optional["InvalidationBus"] = None):
         self.media_path = media_path or getenv("MEDIA_PATH")
         if not self.media_path:
             raise RuntimeError("Не задан MEDIA_PATH")
         
         self.bot = bot
+        self.invalidation = invalidation
         
         admin_chat_id = getenv("TG_ADMIN_CHAT_ID")
         if not admin_chat_id:
@@ -31,9 +40,20 @@ class MediaSaver:
         self.supported_langs = set(SUPPORTED_LANGUAGES_TEXT.values())
         self._media_cache: dict[str, Union[str, dict[str, str]]] = {}
         
-        self._refresh_task = asyncio.create_task(self._background_refresh())
+        self._start_task = asyncio.create_task(self._start())
+    
+    def load_cache(self):
+        """Читает уже загруженные file_id из data.json, ничего не отправляя в Telegram"""
+        data_path = join(self.media_path, "data.json")
+        if not os.path.exists(data_path): return
+        
+        with open(data_path, "r", encoding="utf-8") as f:
+            try:
+                self._media_cache = json.load(f)
+            except json.JSONDecodeError:
+                pass
     
-    async def update_cache(self):
+    async def update_cache(self, publish: bool = True):
         data_path = join(self.media_path, "data.json")
 
         if not os.path.exists(data_path):
@@ -98,6 +118,8 @@ class MediaSaver:
         if updated:
             with open(data_path, "w", encoding="utf-8") as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+            
+            if publish and self.invalidation: await self.invalidation.publish(self.INVALIDATION_TOPIC)
     
     async def _generate_id_for_file(self, key: str, filepath: str) -> str:
         media_type = self.media_type_by_key(key)
@@ -136,20 +158,23 @@ class MediaSaver:
             raise RuntimeError(f"Ошибка при загрузке файла {filepath}: {e}")
 
     async def close(self):
-        if self._refresh_task:
-            self._refresh_task.cancel()
+        if self._start_task and not self._start_task.done():
+            self._start_task.cancel()
             try:
-                await self._refresh_task
+                await self._start_task
             except asyncio.CancelledError:
                 pass  # Ожидаемое исключение при отмене задачи
 
-    async def _background_refresh(self):
-        while True:
-            try:
-                await self.update_cache()
-            except Exception as e:
-                print(f"Ошибка обновления кеша медиа: {e}")
-            await asyncio.sleep(self.REFRESH_INTERVAL)
+    async def _on_invalidated(self, _keys: Optional[set[str]]):
+        self.load_cache()
+
+    async def _start(self):
+        try:
+            if self.invalidation:
+                await self.invalidation.subscribe(self.INVALIDATION_TOPIC, self._on_invalidated)
+            await self.update_cache()
+        except Exception as e:
+            logging.getLogger(__name__).exception(f"Ошибка обновления кеша медиа: {e}")
     
     def media_type_by_key(self, key: str) -> Optional[MediaType]:
         if key.startswith("photo"): return MediaType.photo
@@ -0,0 +1,214 @@
+import logging
+from collections import Counter
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from pymongo import AsyncMongoClient
+from pymongo import monitoring
+
+from configs.environment import (MONGO_URI, MONGO_TLS_CA_PATH, MONGO_TLS_KEY_PATH, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE,
+                                 MONGO_MAX_IDLE_TIME_MS, MONGO_COMPRESSORS, MONGO_CONNECT_TIMEOUT_MS,
+                                 MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS, MONGO_QUERY_BUDGET)
+
+
+@dataclass
+class PoolStats:
+    """Счётчики пула соединений с момента запуска процесса"""
+    checkouts: int = 0                  # выданные соединения
+    checkout_failures: int = 0
+    checked_out: int = 0                # занятые прямо сейчас
+    max_checked_out: int = 0
+    wait_time_total: float = 0.0        # суммарное ожидание соединения, сек
+    wait_time_max: float = 0.0
+    connections_created: int = 0
+    connections_closed: int = 0
+    pool_clears: int = 0
+
+    @property
+    def wait_time_avg(self) -> float:
+        return self.wait_time_total / self.checkouts if self.checkouts else 0.0
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Собирает статистику пула соединений по событиям pymongo.
+    Колбэки вызываются синхронно в потоке драйвера, поэтому в них только обновление счётчиков.
+    """
+
+    def __init__(self):
+        self.stats = PoolStats()
+        self.logger = logging.getLogger(__name__)
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent): pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent): pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent):
+        self.stats.pool_clears += 1
+        self.logger.warning(f"Mongo connection pool for {event.address} cleared")
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent): pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent):
+        self.stats.connections_created += 1
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent): pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent):
+        self.stats.connections_closed += 1
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent): pass
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent):
+        self.stats.checkout_failures += 1
+        self.logger.warning(f"Mongo connection check out failed ({event.reason}) after {event.duration or 0:.3f}s")
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent):
+        stats = self.stats
+        stats.checkouts += 1
+        stats.checked_out += 1
+        stats.max_checked_out = max(stats.max_checked_out, stats.checked_out)
+        if event.duration:
+            stats.wait_time_total += event.duration
+            stats.wait_time_max = max(stats.wait_time_max, event.duration)
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent):
+        self.stats.checked_out -= 1
+
+
+@dataclass
+class CommandTotals:
+    count: int = 0
+    failures: int = 0
+    duration_total: float = 0.0         # сек
+    duration_max: float = 0.0
+
+    @property
+    def duration_avg(self) -> float:
+        return self.duration_total / self.count if self.count else 0.0
+
+
+@dataclass
+class UpdateQueries:
+    """Команды Mongo, выполненные за обработку одного апдейта"""
+    label: str
+    count: int = 0
+    duration_total: float = 0.0
+    commands: Counter = field(default_factory=Counter)     # (коллекция, команда) -> количество
+
+
+# апдейт, который сейчас обрабатывается; задачи, созданные из хендлера, наследуют его вместе с контекстом
+current_update: ContextVar[Optional[UpdateQueries]] = ContextVar("current_update", default=None)
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    Считает команды Mongo по (коллекция, команда): количество и время выполнения.
+    Команды, выполненные при обработке апдейта, дополнительно записываются в его UpdateQueries,
+    и если их больше MONGO_QUERY_BUDGET, в лог пишется предупреждение со списком самых частых -
+    так сразу видны N+1 запросы в хендлерах.
+    """
+
+    def __init__(self, budget: int = MONGO_QUERY_BUDGET):
+        self.budget = budget
+        self.totals: dict[tuple[str, str], CommandTotals] = {}
+        self.logger = logging.getLogger(__name__)
+
+        self._started: dict[tuple, tuple[str, str]] = {}
+
+    @staticmethod
+    def _collection(event: monitoring.CommandStartedEvent) -> str:
+        # у find/insert/aggregate/... имя коллекции - значение самой команды, у getMore - поле collection
+        target = event.command.get(event.command_name)
+        if isinstance(target, str): return target
+        return event.command.get("collection", "-")
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        self._started[(event.connection_id, event.request_id)] = (self._collection(event), event.command_name)
+
+    def _finished(self, event, failed: bool):
+        key = self._started.pop((event.connection_id, event.request_id), None)
+        if key is None: return
+        duration = event.duration_micros / 1_000_000
+
+        totals = self.totals.setdefault(key, CommandTotals())
+        totals.count += 1
+        totals.failures += failed
+        totals.duration_total += duration
+        totals.duration_max = max(totals.duration_max, duration)
+
+        if (update := current_update.get()) is not None:
+            update.count += 1
+            update.duration_total += duration
+            update.commands[key] += 1
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finished(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finished(event, failed=True)
+
+    def begin_update(self, label: str) -> Token:
+        return current_update.set(UpdateQueries(label))
+
+    def end_update(self, token: Token) -> Optional[UpdateQueries]:
+        update = current_update.get()
+        current_update.reset(token)
+
+        if update and update.count > self.budget:
+            top = ", ".join(f"{collection}.{command} x{count}" for (collection, command), count in update.commands.most_common(5))
+            self.logger.warning(f"Query budget exceeded: {update.count} Mongo commands ({update.duration_total * 1000:.0f} ms) "
+                                f"for {update.label}, budget {self.budget}. Top: {top}")
+        return update
+
+
+pool_monitor = PoolMonitor()
+command_monitor = CommandMonitor()
+_client: Optional[AsyncMongoClient[Any]] = None
+
+
+def get_mongo_client() -> AsyncMongoClient[Any]:
+    """
+    Общий на процесс клиент Mongo: FSM, троттлинг и репозитории работают через один пул соединений
+    и одно TLS-рукопожатие на соединение. Параметры пула задаются в configs/environment.py.
+    """
+    global _client
+    if _client is None:
+        options: dict[str, Any] = {}
+        if MONGO_COMPRESSORS: options["compressors"] = MONGO_COMPRESSORS
+
+        _client = AsyncMongoClient(MONGO_URI,
+                                   tls=True,
+                                   tlsCAFile=MONGO_TLS_CA_PATH,
+                                   tlsCertificateKeyFile=MONGO_TLS_KEY_PATH,
+                                   maxPoolSize=MONGO_MAX_POOL_SIZE,
+                                   minPoolSize=MONGO_MIN_POOL_SIZE,
+                                   maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                                   connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                                   serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                                   waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                                   event_listeners=[pool_monitor, command_monitor],
+                                   **options)
+    return _client
+
+
+async def close_mongo_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+__all__ = [
+    "PoolStats",
+    "PoolMonitor",
+    "pool_monitor",
+    "CommandTotals",
+    "UpdateQueries",
+    "current_update",
+    "CommandMonitor",
+    "command_monitor",
+    "get_mongo_client",
+    "close_mongo_client"
+]
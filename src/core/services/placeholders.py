@@ -1,47 +1,58 @@
 import asyncio
+import logging
 import re
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterable, Optional
 
 if TYPE_CHECKING:
+    from core.services.invalidation import InvalidationBus
     from schemas.db_models import PlaceholdersRepository
     from schemas.db_models import Placeholder
 
 class PlaceholderManager:
+    """Кеш плейсхолдеров; изменённые ключи перечитываются по событиям InvalidationBus"""
     
-    REFRESH_INTERVAL = 15 * 60 # 15m
-    
-    def __init__(self, txt_repo: "PlaceholdersRepository"):
+    def __init__(self, txt_repo: "PlaceholdersRepository", invalidation: "InvalidationBus"):
         self.txt_repo = txt_repo
+        self.invalidation = invalidation
         
         self._txt_cache: dict[str, "Placeholder"] = {}
         
-        self._refresh_task = asyncio.create_task(self._background_refresh())
+        self._start_task = asyncio.create_task(self._start())
     
-    async def update_placeholders(self):
-        txt_placeholders = await self.txt_repo.get_all()
+    async def update_placeholders(self, keys: Optional[Iterable[str]] = None):
+        """Перечитывает плейсхолдеры с ключами keys (None - все)"""
+        if keys is None:
+            txt_placeholders = await self.txt_repo.get_all()
+            self._txt_cache = {ph.key: ph for ph in txt_placeholders}
+            return
         
-        self._txt_cache = {ph.key: ph for ph in txt_placeholders}
+        keys = list(keys)
+        found = {ph.key: ph for ph in await self.txt_repo.find_by({"key": {"$in": keys}})}
+        for key in keys:
+            if key in found: self._txt_cache[key] = found[key]
+            else: self._txt_cache.pop(key, None)
         
     async def close(self):
-        if self._refresh_task:
-            self._refresh_task.cancel()
+        if self._start_task and not self._start_task.done():
+            self._start_task.cancel()
             try:
-                await self._refresh_task
+                await self._start_task
             except asyncio.CancelledError:
                 pass  # Ожидаемое исключение при отмене задачи
 
-    async def _background_refresh(self):
-        while True:
-            try:
-                await self.update_placeholders()
-            except Exception as e:
-                print(f"Ошибка обновления кеша плейсхолдеров: {e}")
-            await asyncio.sleep(self.REFRESH_INTERVAL)
+    async def _start(self):
+        try:
+            # подписываемся до загрузки, чтобы не пропустить изменения, сделанные во время неё
+            await self.invalidation.subscribe(self.txt_repo.INVALIDATION_TOPIC, self.update_placeholders)
+            await self.update_placeholders()
+        except Exception as e:
+            logging.getLogger(__name__).exception(f"Ошибка загрузки кеша плейсхолдеров: {e}")
 
     def process_text(self, text: str, lang: str) -> str:
         def replacer(match: re.Match) -> str:
             key = match.group(1)
-            localized = self._txt_cache.get(key).value
+            placeholder = self._txt_cache.get(key)
+            localized = placeholder.value if placeholder else None
             
             return localized.get(lang) if localized else f"[[{key}]]"
 
@@ -0,0 +1,144 @@
+import asyncio
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+from cachetools import TTLCache
+
+from core.types.values import LocalizedString
+
+if TYPE_CHECKING:
+    from core.services.db import DatabaseService
+    from schemas.db_models import AppAbstractRepository
+
+
+@dataclass
+class CartStatsLine:
+    name: LocalizedString
+    in_carts: int = 0               # для товаров - число покупателей, для уценки - число записей
+    in_carts_with_delivery: int = 0 # то же, но только у покупателей с настроенной доставкой
+
+@dataclass
+class CartsReport:
+    products: list[CartStatsLine] = field(default_factory=list)
+    discounted_products: list[CartStatsLine] = field(default_factory=list)
+
+@dataclass
+class OrderedStatsLine:
+    name: LocalizedString
+    quantity: int = 0
+
+@dataclass
+class OrdersReport:
+    products: list[OrderedStatsLine] = field(default_factory=list)
+    discounted_sold: int = 0
+    orders_count: int = 0
+    paid_orders_count: int = 0
+    paid_totals: dict[str, Decimal] = field(default_factory=dict) # валюта -> сумма оплаченных заказов
+
+
+class StatisticsService:
+    """
+    Отчёты для меню статистики админки, кешируются на CACHE_TTL секунд.
+    Корзины считаются агрегатами по cart_entries, заказы - по дневным сводкам stats_daily.
+    """
+
+    CACHE_TTL = 60
+
+    def __init__(self, db: "DatabaseService"):
+        self.db = db
+        self._cache: TTLCache[str, Any] = TTLCache(maxsize=16, ttl=self.CACHE_TTL)
+
+    async def _cached(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        if (report := self._cache.get(key)) is not None:
+            return report
+
+        report = await factory()
+        self._cache[key] = report
+        return report
+
+    def invalidate(self):
+        self._cache.clear()
+
+    async def _carts_lines(self, repo: "AppAbstractRepository", distinct_customers: bool) -> list[CartStatsLine]:
+        entries_pipeline: list[dict] = [{"$match": {"order_id": None}}]
+        customer_field = "customer_id"
+        if distinct_customers:
+            # у кого-то по два одинаковых товара в корзине
+            entries_pipeline.append({"$group": {"_id": "$customer_id"}})
+            customer_field = "_id"
+
+        entries_pipeline += [
+            {"$lookup": {
+                "from": self.db.customers._collection_name,
+                "localField": customer_field,
+                "foreignField": "_id",
+                "pipeline": [
+                    {"$match": {"privacy_data.delivery_info.service": {"$ne": None}}},
+                    {"$project": {"_id": 1}}
+                ],
+                "as": "with_delivery"
+            }},
+            {"$group": {
+                "_id": None,
+                "in_carts": {"$sum": 1},
+                "in_carts_with_delivery": {"$sum": {"$cond": [{"$gt": [{"$size": "$with_delivery"}, 0]}, 1, 0]}}
+            }}
+        ]
+
+        cursor = await repo.get_collection().aggregate([
+            {"$sort": {"_id": 1}},
+            {"$project": {"name": 1}},
+            {"$lookup": {
+                "from": self.db.cart_entries._collection_name,
+                "localField": "_id",
+                "foreignField": "source_id",
+                "pipeline": entries_pipeline,
+                "as": "stats"
+            }}
+        ])
+        return [
+            CartStatsLine(name=LocalizedString.model_validate(document["name"]),
+                          in_carts=document["stats"][0]["in_carts"] if document["stats"] else 0,
+                          in_carts_with_delivery=document["stats"][0]["in_carts_with_delivery"] if document["stats"] else 0)
+            async for document in cursor
+        ]
+
+    async def _product_names(self) -> list[tuple[Any, LocalizedString]]:
+        cursor = self.db.products.get_collection().find({}, projection={"name": 1}).sort("_id", 1)
+        return [(document["_id"], LocalizedString.model_validate(document["name"])) async for document in cursor]
+
+    async def _build_carts_report(self) -> CartsReport:
+        products, discounted_products = await asyncio.gather(
+            self._carts_lines(self.db.products, distinct_customers=True),
+            self._carts_lines(self.db.discounted_products, distinct_customers=False)
+        )
+        return CartsReport(products=products, discounted_products=discounted_products)
+
+    async def _build_orders_report(self, since: Optional[date], until: Optional[date]) -> OrdersReport:
+        names, totals = await asyncio.gather(
+            self._product_names(),
+            self.db.daily_stats.totals(since, until)
+        )
+        return OrdersReport(products=[OrderedStatsLine(name=name, quantity=totals.items.get(product_id, 0)) for product_id, name in names],
+                            discounted_sold=totals.discounted,
+                            orders_count=totals.orders,
+                            paid_orders_count=totals.paid_orders,
+                            paid_totals=totals.revenue)
+
+    async def carts_report(self) -> CartsReport:
+        return await self._cached("carts", self._build_carts_report)
+
+    async def orders_report(self, since: Optional[date] = None, until: Optional[date] = None) -> OrdersReport:
+        """Заказы за дни [since; until] включительно (UTC), по умолчанию за всё время"""
+        return await self._cached(f"orders:{since}:{until}", lambda: self._build_orders_report(since, until))
+
+
+__all__ = [
+    "CartStatsLine",
+    "CartsReport",
+    "OrderedStatsLine",
+    "OrdersReport",
+    "StatisticsService"
+]
@@ -0,0 +1,141 @@
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from enum import Enum
+from typing import Any
+
+from cachetools import TTLCache
+from pymongo import ASCENDING, AsyncMongoClient, ReturnDocument
+
+from configs.environment import MONGO_DB_NAME
+
+
+class ThrottleVerdict(str, Enum):
+    ok = "ok"
+    throttled = "throttled"  # лимит превышен только что, пользователя нужно предупредить
+    banned = "banned"        # пользователь уже в бане, апдейт молча пропускаем
+
+
+class ThrottleBackend(ABC):
+    """Базовый класс хранилища для ThrottlingMiddleware"""
+
+    BURST_WINDOW = .25  # запросы ближе этого интервала считаются частыми
+    RATE_WINDOW = 30    # окно, в котором считаются частые запросы
+    RATE_LIMIT = 5      # сколько частых запросов допускается за окно
+    BAN_TIME = 15
+
+    @abstractmethod
+    async def hit(self, user_id: int) -> ThrottleVerdict: ...
+
+
+class MemoryThrottleBackend(ThrottleBackend):
+    """Лимиты в памяти процесса. С несколькими воркерами каждый считает запросы отдельно."""
+
+    def __init__(self):
+        self.default = TTLCache(maxsize=25_000, ttl=self.BURST_WINDOW)
+        # Храним последние RATE_LIMIT + 1 частых запросов пользователя (user_id -> deque)
+        self.user_requests: TTLCache[int, deque[float]] = TTLCache(maxsize=25_000, ttl=self.RATE_WINDOW)
+        # Храним "забаненных" пользователей
+        self.banned_users = TTLCache(maxsize=25_000, ttl=self.BAN_TIME)
+
+    async def hit(self, user_id: int) -> ThrottleVerdict:
+        if user_id in self.banned_users:
+            return ThrottleVerdict.banned
+
+        if user_id not in self.default:
+            self.default[user_id] = None
+            return ThrottleVerdict.ok
+
+        now = time.monotonic()
+        timestamps = self.user_requests.get(user_id)
+        if timestamps is None:
+            timestamps = deque(maxlen=self.RATE_LIMIT + 1)
+        timestamps.append(now)
+        self.user_requests[user_id] = timestamps
+
+        # кольцо заполнено и самый старый запрос ещё в окне - значит за окно было больше RATE_LIMIT запросов
+        if len(timestamps) == timestamps.maxlen and now - timestamps[0] < self.RATE_WINDOW:
+            self.banned_users[user_id] = None
+            return ThrottleVerdict.throttled
+
+        return ThrottleVerdict.ok
+
+
+class MongoThrottleBackend(ThrottleBackend):
+    """
+    Общие для всех воркеров лимиты по тем же правилам, что и MemoryThrottleBackend:
+    состояние пользователя в коллекции Mongo обновляется одним атомарным find_one_and_update на апдейт.
+    Время берётся с сервера ($$NOW), чтобы расхождение часов воркеров не влияло на окна.
+    """
+
+    def __init__(self, client: AsyncMongoClient[Any], db_name: str = MONGO_DB_NAME, collection_name: str = "throttling"):
+        self._collection = client[db_name][collection_name]
+        self._indexes_created = False
+
+    async def _ensure_indexes(self):
+        if self._indexes_created: return
+        await self._collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+        self._indexes_created = True
+
+    @staticmethod
+    def _after(seconds: float) -> dict:
+        return {"$add": ["$$NOW", int(seconds * 1000)]}
+
+    @staticmethod
+    def _active(field: str) -> dict:
+        return {"$gt": [{"$ifNull": [f"${field}", "$$NOW"]}, "$$NOW"]}
+
+    async def hit(self, user_id: int) -> ThrottleVerdict:
+        await self._ensure_indexes()
+
+        frequent = {"$eq": ["$verdict", "frequent"]}
+        # как deque в TTLCache: частые запросы забываются, если последний из них был раньше RATE_WINDOW
+        recent = {"$cond": [self._active("requests_until"), {"$ifNull": ["$requests", []]}, []]}
+        # хранится RATE_LIMIT + 1 последних частых запросов; самый старый ещё в окне - лимит превышен
+        over_limit = {"$and": [
+            frequent,
+            {"$eq": [{"$size": {"$ifNull": ["$requests", []]}}, self.RATE_LIMIT + 1]},
+            {"$lt": [{"$subtract": ["$$NOW", {"$arrayElemAt": ["$requests", 0]}]}, self.RATE_WINDOW * 1000]}
+        ]}
+
+        document = await self._collection.find_one_and_update(
+            {"_id": user_id},
+            [
+                {"$set": {"verdict": {"$switch": {
+                    "branches": [
+                        {"case": self._active("banned_until"), "then": ThrottleVerdict.banned.value},
+                        {"case": {"$not": [self._active("burst_until")]}, "then": ThrottleVerdict.ok.value}
+                    ],
+                    "default": "frequent"
+                }}}},
+                {"$set": {
+                    # окно частых запросов отсчитывается от первого запроса после паузы и не продлевается
+                    "burst_until": {"$cond": [{"$eq": ["$verdict", ThrottleVerdict.ok.value]},
+                                              self._after(self.BURST_WINDOW), "$burst_until"]},
+                    "requests": {"$cond": [frequent,
+                                           {"$slice": [{"$concatArrays": [recent, ["$$NOW"]]}, -(self.RATE_LIMIT + 1)]},
+                                           "$requests"]},
+                    "requests_until": {"$cond": [frequent, self._after(self.RATE_WINDOW), "$requests_until"]}
+                }},
+                {"$set": {"verdict": {"$cond": [over_limit, ThrottleVerdict.throttled.value, "$verdict"]}}},
+                {"$set": {
+                    "banned_until": {"$cond": [{"$eq": ["$verdict", ThrottleVerdict.throttled.value]},
+                                               self._after(self.BAN_TIME), "$banned_until"]},
+                    "expires_at": self._after(max(self.BURST_WINDOW, self.RATE_WINDOW, self.BAN_TIME))
+                }}
+            ],
+            projection={"verdict": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        if document["verdict"] == "frequent": return ThrottleVerdict.ok
+        return ThrottleVerdict(document["verdict"])
+
+
+__all__ = [
+    "ThrottleVerdict",
+    "ThrottleBackend",
+    "MemoryThrottleBackend",
+    "MongoThrottleBackend"
+]
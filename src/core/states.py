@@ -1,7 +1,9 @@
 import logging
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import ReplyKeyboardRemove
-from typing import Callable, Dict, Any, Awaitable, Tuple, Union, List
+from typing import Callable, Dict, Any, Awaitable, Optional, Tuple, Union, List
+
+from core.fsm import BufferedFSMContext
 
 from ui.message_tools import clear_keyboard_effect, send_media_response
 from ui.texts import *
@@ -59,6 +61,8 @@ async def call_state_handler(state: State,
                 await ctx.message.answer(text, reply_markup=ReplyKeyboardRemove())
                 cached_state = await ctx.fsm.get_state()
                 await ctx.fsm.set_state("nothing")
+                # пока ждём, другие апдейты пользователя должны видеть "nothing" в хранилище
+                if isinstance(ctx.fsm, BufferedFSMContext): await ctx.fsm.flush()
                 
                 await asyncio.sleep(sleep_time)
                 
@@ -143,9 +147,20 @@ async def handle_admin_customers_menu(ctx: Context, customer: Customer, **_):
     await ctx.message.answer(await AdminTextGen.customer_menu_text(customer, ctx), 
                              reply_markup=AdminKBs.Customers.customer_menu(customer, ctx))
     
+async def active_orders_view(ctx: Context, state: Optional[OrderStateKey] = None, page: int = 0):
+    """Текст и inline-клавиатура страницы обзора активных заказов; по умолчанию - первый статус с заказами"""
+    counts = await ctx.services.db.orders.count_active_by_state()
+    if state not in dict(counts): state, page = (counts[0][0] if counts else None), 0
+    
+    pages = AdminTextGen.active_orders_pages(counts, state)
+    page = min(max(page, 0), pages - 1)
+    return (await AdminTextGen.active_orders_menu_text(ctx, counts, state, page),
+            AdminKBs.Orders.active_orders_pages(counts, state, page, pages, ctx))
+
 @state_handlers.register(AdminStates.Main.Orders.AskId)
 async def handle_admin_orders_ask_id(ctx: Context, **_):
-    await ctx.message.answer(await AdminTextGen.active_orders_menu_text(ctx))
+    text, reply_markup = await active_orders_view(ctx)
+    await ctx.message.answer(text, reply_markup=reply_markup)
     await ctx.message.answer("Введите ID заказа либо попытайтесь найти по PUIDу (начинать с #):", reply_markup=AdminKBs.Orders.orders_menu(ctx))
     
 @state_handlers.register(AdminStates.Main.Orders.OrderMenu)
@@ -361,7 +376,7 @@ class AssortmentStates(StatesGroup):
 
 @state_handlers.register(AssortmentStates.Menu)
 async def assortment_menu_handler(ctx: Context, **_):
-    categories = await ctx.services.db.categories.get_all()
+    categories = await ctx.services.catalog.get_categories()
     if not categories:
         await call_state_handler(CommonStates.MainMenu, ctx, send_before="Err: There's no categories!")
         return
@@ -373,14 +388,13 @@ async def viewing_assortment_handler(ctx: Context,
                                      category: str,
                                      current: int,
                                      **_):
-    amount = await ctx.services.db.products.count_in_category(category, only_visible=True)
+    product, amount = await ctx.services.catalog.find_by_category_and_index_with_count(category, current-1, only_visible=True)
 
     if amount == 0:
         await call_state_handler(AssortmentStates.Menu,
                                  ctx, send_before=(ctx.t.AssortmentTranslates.no_products_in_category, 0.2))
         return
     
-    product: Product = await ctx.services.db.products.find_by_category_and_index(category, current-1, only_visible=True)
     if not product:
         await call_state_handler(AssortmentStates.ViewingAssortment,
                                  ctx, 
@@ -406,7 +420,7 @@ async def forming_order_entry_handler(ctx: Context,
 
     if ctx.is_query: await clear_keyboard_effect(ctx.message)
     
-    additionals = await ctx.services.db.additionals.get(product)
+    additionals = await ctx.services.catalog.get_additionals(product)
     
     kb = AssortmentKBs.adding_to_cart_main(options, len(additionals) > 0, ctx)
     
@@ -490,14 +504,16 @@ class DiscountedStates(StatesGroup):
 async def viewing_products_handler(ctx: Context,
                                    current: int, 
                                    **_):
-    amount = await ctx.services.db.discounted_products.count()
+    discounted_product, amount = await ctx.services.db.discounted_products.find_by_index_with_count(current-1)
     
     if amount == 0:
         await call_state_handler(CommonStates.MainMenu,
                                  ctx, send_before=(ctx.t.DiscountedProductsTranslates.no_discounted_products, 1))
         return
     
-    discounted_product: DiscountedProduct = await ctx.services.db.discounted_products.find_by_index(current-1)
+    if not discounted_product:
+        current = 1
+        discounted_product = await ctx.services.db.discounted_products.find_by_index(0)
     caption = DiscountedProductsGen.generate_discounted_product_text(discounted_product, ctx)
     
     await send_media_response(ctx,
@@ -518,20 +534,16 @@ class CartStates(StatesGroup):
 
 @state_handlers.register(CartStates.Menu)
 async def cart_menu_handler(ctx: Context, current: int = 1, **_):
-    amount = await ctx.services.db.cart_entries.count_customer_cart_entries(ctx.customer)
+    summary, entry, product = await ctx.services.db.cart_entries.find_cart_page(ctx.customer, current-1)
     
-    if amount == 0:
+    if summary.count == 0 or not entry:
         await call_state_handler(CommonStates.MainMenu,
                                  ctx, send_before=(ctx.t.CartTranslates.no_products_in_cart, 1))
         return
-    if current > amount: current = 1
-    
-    entry = await ctx.services.db.cart_entries.find_customer_cart_entry_by_id(ctx.customer, current-1)
+    if current > summary.count or current < 1:
+        current = 1
     is_product = entry.source_type == CartItemSource.product
     
-    product: Product = await ctx.services.db.products.find_one_by_id(entry.source_id) if is_product else None
-    total_price = await ctx.services.db.cart_entries.calculate_customer_cart_price(ctx.customer)
-    
     caption = CartTextGen.generate_cart_viewing_caption(entry=entry,
                                             product=product,
                                             ctx=ctx)
@@ -539,7 +551,7 @@ async def cart_menu_handler(ctx: Context, current: int = 1, **_):
     await send_media_response(ctx,
                             product.description_media if is_product else entry.frozen_snapshot.media,
                             caption,
-                            await CartKBs.cart_view(entry, current, amount, total_price, ctx))
+                            CartKBs.cart_view(entry, current, summary, ctx))
 
 @state_handlers.register(CartStates.EntryRemoveConfirm)
 async def entry_remove_confirm_handler(ctx: Context, **_):
@@ -678,7 +690,7 @@ async def delivery_edit_is_foreign_handler(ctx: Context, **_):
 async def delivery_edit_service_handler(ctx: Context, is_foreign_services: bool, **_):
     first_setup: bool = ctx.customer.privacy_data.delivery_info.service is None
     
-    services = await ctx.services.db.delivery_services.get_all(is_foreign_services)
+    services = await ctx.services.catalog.get_delivery_services(is_foreign_services)
     
     await ctx.message.answer(
         ctx.t.ProfileTranslates.Delivery.service_text,
@@ -3,9 +3,16 @@ from pydantic_core import core_schema
 
 
 from decimal import Decimal, InvalidOperation
+from functools import lru_cache
 from typing import Annotated, Any
 
 
+@lru_cache(maxsize=4096)
+def _decimal128_to_decimal(bid: bytes) -> Decimal:
+    # Decimal128.to_decimal разбирает биты на чистом питоне, а цен в базе немного - кешируем по bid
+    return Decimal128.from_bid(bid).to_decimal()
+
+
 class DecimalAnnotation:
     @classmethod
     def __get_pydantic_core_schema__(
@@ -17,7 +24,7 @@ class DecimalAnnotation:
             if isinstance(value, Decimal):
                 return value
             if isinstance(value, Decimal128):
-                return value.to_decimal()          # ← вот ключевой момент
+                return _decimal128_to_decimal(value.bid)          # ← вот ключевой момент
             if isinstance(value, str):
                 try:
                     return Decimal(value)
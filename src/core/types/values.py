@@ -26,7 +26,9 @@ class Money(BaseModel):
 
     @model_validator(mode="after")
     def normalize(self):
-        self.amount = self._quantize(self.amount)
+        # суммы из БД уже округлены, их не трогаем
+        if self.amount.as_tuple().exponent != -SUPPORTED_CURRENCIES[self.currency].precision:
+            self.amount = self._quantize(self.amount)
         return self
 
     def to_text(self) -> str:
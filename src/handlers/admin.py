@@ -1,3 +1,4 @@
+import asyncio
 import contextlib
 from datetime import datetime
 from decimal import Decimal
@@ -13,6 +14,7 @@ from pydantic_mongo import PydanticObjectId
 
 from configs.environment import DEBUG
 from core.services.db import *
+from core.services.mongo import command_monitor, pool_monitor
 
 import core
 from core.helper_classes import Context
@@ -25,6 +27,7 @@ from core.types.values import LocalizedMoney, LocalizedString
 from ui.message_tools import list_commands
 
 router = Router(name="admin")
+_background_jobs: set[asyncio.Task] = set()
 middleware = RoleCheckMiddleware("admin")
 
 router.message.middleware.register(middleware)
@@ -45,6 +48,51 @@ async def help_handler(_, ctx: Context):
     
     await ctx.message.answer("Обновлено!")
     
+@router.message(Command("update_catalog"))
+async def update_catalog_handler(_, ctx: Context):
+    """/update_catalog - Сбросить кеш каталога во всех воркерах и пересчитать корзины (после ручной правки БД)"""
+    
+    version = await ctx.services.db.bump_catalog_version()
+    await ctx.services.catalog.reload()
+    carts = await ctx.services.db.cart_entries.refresh_all_summaries()
+    
+    await ctx.message.answer(f"Обновлено! Версия каталога: {version}, пересчитано корзин: {carts}")
+
+@router.message(Command("db_reads"))
+async def db_reads_handler(_, ctx: Context):
+    """/db_reads - Сколько чтений выполнено и сколько объединено с уже выполнявшимися (single-flight)"""
+
+    lines = [f"{name}: {repo.reads_executed} выполнено, {repo.reads_coalesced} объединено"
+             for name, repo in ctx.services.db.repositories.items()
+             if repo.reads_executed or repo.reads_coalesced]
+
+    await ctx.message.answer("\n".join(lines) or "Чтений пока не было.", parse_mode=None)
+
+@router.message(Command("db_pool"))
+async def db_pool_handler(_, ctx: Context):
+    """/db_pool - Статистика пула соединений с Mongo в этом воркере"""
+
+    stats = pool_monitor.stats
+    await ctx.message.answer(
+        f"Выдано соединений: {stats.checkouts} (ошибок: {stats.checkout_failures})\n"
+        f"Занято сейчас: {stats.checked_out}, максимум: {stats.max_checked_out}\n"
+        f"Ожидание соединения: в среднем {stats.wait_time_avg * 1000:.1f} мс, максимум {stats.wait_time_max * 1000:.1f} мс\n"
+        f"Открыто соединений: {stats.connections_created}, закрыто: {stats.connections_closed}\n"
+        f"Сбросов пула: {stats.pool_clears}",
+        parse_mode=None
+    )
+
+@router.message(Command("db_commands"))
+async def db_commands_handler(_, ctx: Context):
+    """/db_commands - Самые частые команды Mongo в этом воркере: количество и время выполнения"""
+
+    top = sorted(command_monitor.totals.items(), key=lambda item: item[1].count, reverse=True)[:20]
+    lines = [f"{collection}.{command}: {totals.count} (ошибок: {totals.failures}), "
+             f"в среднем {totals.duration_avg * 1000:.1f} мс, максимум {totals.duration_max * 1000:.1f} мс"
+             for (collection, command), totals in top]
+
+    await ctx.message.answer("\n".join(lines) or "Команд пока не было.", parse_mode=None)
+
 @router.message(Command("iwanttocuddlewithfluttershy"))
 async def code_execution_entry_point(_, ctx: Context):
     global cmd_namespace
@@ -97,6 +145,8 @@ async def add_bonus_money_handler(_, ctx: Context, command: CommandObject):
     if not user_id:
         await ctx.message.answer("Неправильный формат команды")
         return
+    # событие шины могло ещё не дойти до этого воркера, поэтому читаем из БД
+    ctx.services.db.customers.invalidate(user_id)
     customer = await ctx.services.db.customers.find_by_user_id(user_id)
     if not customer:
         await ctx.message.answer("Пользователь не найден")
@@ -216,6 +266,9 @@ async def confirm_manual_payment_handler(_, ctx: Context, command: CommandObject
         await ctx.message.answer("Заказ не в ожидании подтверждения оплаты")
         return
     
+    # время с часовым поясом приводим к местному, как хранятся остальные naive-времена оплаты
+    if parsed_datetime.tzinfo: parsed_datetime = parsed_datetime.astimezone().replace(tzinfo=None)
+    
     order.price_details.customer_paid = True
     order.price_details.payment_time = parsed_datetime
     order.state.set_state(OrderStateKey.accepted)
@@ -233,14 +286,16 @@ async def confirm_manual_payment_handler(_, ctx: Context, command: CommandObject
         await ctx.services.notificators.UserTelegramNotificator.send_order_payment_accepted(customer, order, receipts)
         
     await ctx.services.db.orders.save(order)
+    await ctx.services.db.daily_stats.record_payment(order)
     
     
     # Уценка
     discounted_entries = await ctx.services.db.cart_entries.find_entries_by_order(order, {"source_type": CartItemSource.discounted})
+    discounted_ids = [entry.source_id for entry in discounted_entries]
     
-    for entry in discounted_entries:
-        await ctx.services.db.discounted_products.delete_by_id(entry.source_id)
-        await ctx.services.db.cart_entries.delete_discounted_product_from_carts(entry.source_id)
+    if discounted_ids:
+        await ctx.services.db.discounted_products.delete_many_by_ids(discounted_ids)
+        await ctx.services.db.cart_entries.delete_discounted_product_from_carts(discounted_ids)
     
     
     if await ctx.services.db.orders.count_formed_customer_orders(customer) == 1 and customer.invited_by:
@@ -248,12 +303,51 @@ async def confirm_manual_payment_handler(_, ctx: Context, command: CommandObject
             if reward := await ctx.services.db.inviters.count_new_first_order(inviter, order, ctx):
                 inviter_customer = await ctx.services.db.customers.find_one_by_id(inviter.customer_id)
                 await ctx.services.notificators.UserTelegramNotificator.send_inviter_reward(inviter_customer, reward)
-                
-            await ctx.services.db.inviters.save(inviter)
     
     
     await ctx.message.answer("Заказ подтвержден")
     
+@router.message(Command("rebuild_stats"))
+async def rebuild_stats_handler(_, ctx: Context):
+    """/rebuild_stats - Пересчитать дневную статистику продаж по всем заказам"""
+    await ctx.message.answer("Пересчитываю... Заказы, оформленные или оплаченные во время пересчёта, могут не попасть в статистику - в таком случае запустите его ещё раз.")
+    
+    processed = await ctx.services.db.daily_stats.rebuild()
+    ctx.services.statistics.invalidate()
+    
+    await ctx.message.answer(f"Готово, обработано заказов: {processed}")
+    
+@router.message(Command("sync_product_carts"))
+async def sync_product_carts_handler(_, ctx: Context, command: CommandObject):
+    """/sync_product_carts <product_id> - Перенести изменения товара в открытые корзины (в фоне)"""
+    try:
+        product = await ctx.services.db.products.find_one_by_id(PydanticObjectId(command.args)) if command.args else None
+    except Exception:
+        product = None
+    if not product:
+        await ctx.message.answer("Товар не найден")
+        return
+    
+    additionals = await ctx.services.db.additionals.get(product)
+    message = ctx.message
+    
+    async def report_progress(processed: int, total: int):
+        if processed and processed < total: await message.answer(f"Обработано {processed} из {total}")
+    
+    async def job():
+        try:
+            updated = await ctx.services.db.cart_entries.update_product_in_carts(product, additionals, report_progress)
+            await message.answer(f"Готово, обновлено записей в корзинах: {updated}")
+        except Exception as e:
+            await message.answer(f"Ошибка при обновлении корзин: {e}", parse_mode=None)
+    
+    # держим ссылку на задачу, иначе её может собрать GC до завершения
+    task = asyncio.create_task(job())
+    _background_jobs.add(task)
+    task.add_done_callback(_background_jobs.discard)
+    
+    await ctx.message.answer(f"Обновляю корзины с товаром {product.name.get(ctx)} в фоне...")
+    
 @router.message(Command("unform_order"))
 async def unform_order_handler(_, ctx: Context, command: CommandObject):
     """/unform_order <order_id> - Расформировать заказ"""
@@ -452,7 +546,7 @@ async def manual_delivery_price_handler(_, ctx: Context, command: CommandObject)
     
     customer.privacy_data.delivery_info.service = delivery_service
     customer.privacy_data.delivery_info.waiting_for_manual_delivery_info_confirmation = False
-    await ctx.services.db.customers.save(customer)
+    await ctx.services.db.customers.update_delivery_info(customer, "service", "waiting_for_manual_delivery_info_confirmation")
     
     await ctx.services.notificators.UserTelegramNotificator.send_delivery_price_confirmed(customer)
     
@@ -486,7 +580,7 @@ async def price_confirmation_cancel_handler(_, ctx: Context):
     customer: Customer = await Customer.from_fsm_context(ctx, "customer")
     
     customer.privacy_data.delivery_info.waiting_for_manual_delivery_info_confirmation = False
-    await ctx.services.db.customers.save(customer)
+    await ctx.services.db.customers.update_delivery_info(customer, "waiting_for_manual_delivery_info_confirmation")
     await ctx.fsm.update_data(customer=None)
     
     if text == "0":
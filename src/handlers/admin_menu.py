@@ -1,12 +1,15 @@
 import asyncio
+import contextlib
 from dataclasses import replace
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 import re
 from typing import Optional
 
-from aiogram import Router
+from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
+from aiogram.types import CallbackQuery
 from pydantic_mongo import PydanticObjectId
 
 from configs.languages import SUPPORTED_LANGUAGES_TEXT
@@ -14,11 +17,12 @@ from core.services.db import *
 
 from core.helper_classes import Context
 from core.middlewares import RoleCheckMiddleware
-from core.states import AdminStates, CommonStates, call_state_handler
+from core.states import AdminStates, CommonStates, active_orders_view, call_state_handler
 from core.types.enums import CartItemSource, DiscountType, OrderStateKey
 from core.types.values import Discount, LocalizedSavedMedia, Money
 from core.types.values import LocalizedString
 from core.types.values import LocalizedMoney
+from ui.keyboards import AdminKBs
 from ui.message_tools import split_message
 from ui.texts import AdminTextGen, CartTextGen
 from ui.translates import EnumTranslates, ReplyButtonsTranslates
@@ -104,7 +108,7 @@ async def customer_menu_handler(_, ctx: Context):
         await call_state_handler(AdminStates.Main.Customers.CustomerMenu, ctx, customer=customer, send_before=f"<code>/msg_to {customer.user_id}</code>")
     elif text in ["Заблокировать", "Разблокировать"]:
         customer.banned = not customer.banned
-        await ctx.services.db.customers.save(customer)
+        await ctx.services.db.customers.save_changes(customer)
         await customer.save_in_fsm(ctx, "customer")
         
         await call_state_handler(AdminStates.Main.Customers.CustomerMenu, ctx, customer=customer, send_before="Успешно.")
@@ -181,9 +185,7 @@ async def discounted_products_ask_delete_id_handler(_, ctx: Context):
             await call_state_handler(AdminStates.Main.DiscountedProducts.AskDeleteId, ctx, send_before="Товар не найден.")
             return
         
-        entries = await ctx.services.db.cart_entries.find_entries_by_product(prod, {"order_id": None})
-        for entry in entries:
-            await ctx.services.db.cart_entries.delete_by_id(entry.id)
+        await ctx.services.db.cart_entries.delete_discounted_product_from_carts(prod.id)
         
         await ctx.services.db.discounted_products.delete_by_id(PydanticObjectId(text))
         await call_state_handler(AdminStates.Main.DiscountedProducts.Menu, ctx, send_before="Удалено.")
@@ -363,6 +365,19 @@ async def discounted_products_edit_handler(_, ctx: Context):
     except Exception as e:
         raise Exception(f"Не удалось отредактировать товар: {e}")
     
+@router.callback_query(AdminStates.Main.Orders.AskId, F.data.startswith(f"{AdminKBs.Orders.ACTIVE_ORDERS_CALLBACK}:"))
+async def active_orders_page_handler(callback: CallbackQuery, ctx: Context):
+    _, state_key, page = callback.data.split(":")
+    try:
+        state = OrderStateKey(state_key)
+    except ValueError:
+        state = None
+    
+    text, reply_markup = await active_orders_view(ctx, state, int(page))
+    with contextlib.suppress(TelegramBadRequest): # message is not modified
+        await callback.message.edit_text(text, reply_markup=reply_markup)
+    await callback.answer()
+
 @router.message(AdminStates.Main.Orders.AskId)
 async def orders_ask_id_handler(_, ctx: Context):
     text = ctx.message.text
@@ -594,87 +609,35 @@ async def statistics_handler(_, ctx: Context):
     if not text: return
     
     if text == "Корзины":
-        products = await ctx.services.db.products.find_by({})
-        discounted_products = await ctx.services.db.discounted_products.find_by({})
+        report = await ctx.services.statistics.carts_report()
         
-        async def gen_prods():
-            lines = []
-            
-            for product in products:
-                c = await ctx.services.db.cart_entries.find_entries_by_product(product, {"order_id": None})
-                
-                seen = set() # у кого-то по два товара в корзине
-                c = [entry for entry in c if entry.customer_id not in seen and not seen.add(entry.customer_id)]
-                
-                customers_ids = [entry.customer_id for entry in c]
-                valid_ids = {
-                    customer.id for customer in
-                    await ctx.services.db.customers.find_by({"id": {"$in": customers_ids}, "privacy_data.delivery_info.service": {"$exists": True, "$ne": None}})
-                }
-                c_ser = [entry for entry in c if entry.customer_id in valid_ids]
-                count_txt = f"{len(c)} шт; {len(c_ser)} шт." if (len(c) != 0 or len(c_ser) != 0) else "ни у кого." 
-                    
-                lines.append(f"{product.name.get(ctx)} — {count_txt}")
-            return lines
-                
-        async def gen_discount_prods():
-            lines = []
-            
-            for discounted_product in discounted_products:
-                c = await ctx.services.db.cart_entries.find_entries_by_product(discounted_product, {"order_id": None})
-                
-                customers_ids = [entry.customer_id for entry in c]
-                valid_ids = {
-                    customer.id for customer in
-                    await ctx.services.db.customers.find_by({"id": {"$in": customers_ids}, "privacy_data.delivery_info.service": {"$exists": True, "$ne": None}})
-                }
-                c_ser = [entry for entry in c if entry.customer_id in valid_ids]
-                count_txt = f"{len(c)} шт; {len(c_ser)} шт." if (len(c) != 0 or len(c_ser) != 0) else "ни у кого." 
-                
-                lines.append(f"{discounted_product.name.get(ctx)} — {count_txt}")
-            return lines
-                
-        prods_lines = await gen_prods()
-        discount_prods_lines = await gen_discount_prods()
+        def gen_lines(lines):
+            return [
+                f"{line.name.get(ctx)} — {f'{line.in_carts} шт; {line.in_carts_with_delivery} шт.' if line.in_carts or line.in_carts_with_delivery else 'ни у кого.'}"
+                for line in lines
+            ]
         
         txt = f"""<b>Статистика ассортиментных товаров:</b>
 Имя товара — количество в корзине; количество в корзине у пользователей с 🚚.
 
-{'\n'.join(prods_lines)}
+{'\n'.join(gen_lines(report.products))}
 
 <b>Статистика товаров \"В наличии\":</b>
 Имя товара — количество в корзине; количество в корзине у пользователей с 🚚.
 
-{'\n'.join(discount_prods_lines)}"""
+{'\n'.join(gen_lines(report.discounted_products))}"""
             
         await ctx.message.answer(txt)
     elif text == "Заказы":
+        report = await ctx.services.statistics.orders_report()
         
-        async def gen_prods():
-            lines = []
-            
-            products = await ctx.services.db.products.find_by({})
-            for product in products:
-                c = await ctx.services.db.cart_entries.find_entries_by_product(product, {"order_id": {"$ne": None}})
-                quants = [entry.quantity for entry in c]
-                    
-                lines.append(f"{product.name.get(ctx)} — заказано {sum(quants)} шт.")
-            return lines
-                
-        async def gen_discount_prods():
-            c = await ctx.services.db.cart_entries.find_by({"source_type": CartItemSource.discounted, "order_id": {"$ne": None}})
-            return f"Продано {len(c)} шт."
-                
-        prods_lines = await gen_prods()
-        discount_prods_txt = await gen_discount_prods()
-        
-        orders = await ctx.services.db.orders.find_by({})
-        total_rub = sum([order.price_details.total_price for order in orders if order.price_details.customer_paid and order.price_details.total_price.currency == "RUB"], 
-                    start=Money(currency="RUB", amount=0.0)).to_text()
-        total_usd = sum([order.price_details.total_price for order in orders if order.price_details.customer_paid and order.price_details.total_price.currency == "USD"], 
-                    start=Money(currency="USD", amount=0.0)).to_text()
-        
-        txt = f"<b>Статистика ассортиментных товаров:</b>\n{'\n'.join(prods_lines)}\n\n<b>Статистика товаров \"В наличии\":</b>\n{discount_prods_txt}\n\n<b>Общая статистика:</b>\nВсего заказов — {len(orders)}\nВ рублях на {total_rub}\nВ долларах на {total_usd}"
+        prods_lines = [f"{line.name.get(ctx)} — заказано {line.quantity} шт." for line in report.products]
+        discount_prods_txt = f"Продано {report.discounted_sold} шт."
+        
+        total_rub = Money(currency="RUB", amount=report.paid_totals.get("RUB", 0)).to_text()
+        total_usd = Money(currency="USD", amount=report.paid_totals.get("USD", 0)).to_text()
+        
+        txt = f"<b>Статистика ассортиментных товаров:</b>\n{'\n'.join(prods_lines)}\n\n<b>Статистика товаров \"В наличии\":</b>\n{discount_prods_txt}\n\n<b>Общая статистика:</b>\nВсего заказов — {report.orders_count}\nОплачено заказов — {report.paid_orders_count}\nВ рублях на {total_rub}\nВ долларах на {total_usd}"
             
         await ctx.message.answer(txt)
     elif text == ctx.t.UncategorizedTranslates.back:
@@ -29,11 +29,8 @@ async def assortment_category_handler(_, ctx: Context) -> None:
                                  ctx)
         return
 
-    category = next(
-        (category.name for category in await ctx.services.db.categories.get_all()
-         if category.localized_name.get(ctx) == ctx.message.text),
-        None  # значение по умолчанию, если ничего не найдено
-    )
+    category = await ctx.services.catalog.find_category_by_localized_name(ctx.message.text, ctx)
+    category = category.name if category else None
 
     if not category:
         await call_state_handler(AssortmentStates.Menu, ctx)
@@ -62,7 +59,7 @@ async def assortment_viewing_handler(_, ctx: Context) -> None:
     
     current = await ctx.fsm.get_value("current") or 1
     category = await ctx.fsm.get_value("category")
-    amount = await ctx.services.db.products.count_in_category(category, only_visible=True)
+    amount = await ctx.services.catalog.count_in_category(category, only_visible=True)
     
     if text in ["⬅️", "➡️"]:
         if text == '⬅️':
@@ -82,7 +79,7 @@ async def assortment_viewing_handler(_, ctx: Context) -> None:
         
         await ctx.fsm.update_data(product=None)
         
-        product: Product = await ctx.services.db.products.find_by_category_and_index(category, current-1, only_visible=True)
+        product: Product = await ctx.services.catalog.find_by_category_and_index(category, current-1, only_visible=True)
         if not product:
             await call_state_handler(AssortmentStates.Menu,
                                 ctx)
@@ -107,14 +104,14 @@ async def detailed_product_viewing_handler(_, ctx: Context) -> None:
     
     
     if text == ctx.t.ReplyButtonsTranslates.Assortment.add_to_cart:
-        product: Product = await ctx.services.db.products.find_by_category_and_index(category, current-1, only_visible=True)
+        product: Product = await ctx.services.catalog.find_by_category_and_index(category, current-1, only_visible=True)
         
         await product.save_in_fsm(ctx, "product")
         await call_state_handler(AssortmentStates.FormingOrderEntry,
                                 ctx,
                                 product=product)
     else:
-        if current > await ctx.services.db.products.count_in_category(category, only_visible=True): 
+        if current > await ctx.services.catalog.count_in_category(category, only_visible=True): 
             await ctx.fsm.update_data(current=1)
             current = 1
         
@@ -134,7 +131,7 @@ async def forming_order_entry_viewing_handler(_, ctx: Context) -> None:
         current: int = await ctx.fsm.get_value("current")
         category: int = await ctx.fsm.get_value("category")
         
-        if current > await ctx.services.db.products.count_in_category(category, only_visible=True): 
+        if current > await ctx.services.catalog.count_in_category(category, only_visible=True): 
             await ctx.fsm.update_data(current=1)
             current = 1
         
@@ -152,8 +149,8 @@ async def forming_order_entry_viewing_handler(_, ctx: Context) -> None:
                                     send_before=(ctx.t.AssortmentTranslates.cant_add_to_cart_more, 1))
             return
         
-        base_product: Product = await ctx.services.db.products.find_one_by_id(product.id)
-        product.configuration.update(base_product.configuration, await ctx.services.db.additionals.get(product))
+        base_product: Product = await ctx.services.catalog.get_product(product.id)
+        product.configuration.update(base_product.configuration, await ctx.services.catalog.get_additionals(product))
         
         await ctx.services.db.cart_entries.add_to_cart(product, ctx.customer)
         await call_state_handler(CommonStates.MainMenu,
@@ -161,7 +158,7 @@ async def forming_order_entry_viewing_handler(_, ctx: Context) -> None:
                                 send_before=(ctx.t.AssortmentTranslates.add_to_cart_finished, 1))
         
     elif text == ctx.t.ReplyButtonsTranslates.Assortment.extra_options:
-        allowed_additionals = await ctx.services.db.additionals.get(product)
+        allowed_additionals = await ctx.services.catalog.get_additionals(product)
         await call_state_handler(AssortmentStates.AdditionalsEditing,
                                 ctx,
                                 product=product,
@@ -197,8 +194,8 @@ async def entry_option_select(message: Message, ctx: Context) -> None:
     changing_option: ConfigurationOption = await ConfigurationOption.from_fsm_context(ctx, "changing_option")
 
     if message.text == ctx.t.UncategorizedTranslates.back:
-        base_product: Product = await ctx.services.db.products.find_one_by_id(product.id)
-        product.configuration.update(base_product.configuration, await ctx.services.db.additionals.get(product))
+        base_product: Product = await ctx.services.catalog.get_product(product.id)
+        product.configuration.update(base_product.configuration, await ctx.services.catalog.get_additionals(product))
 
         await product.save_in_fsm(ctx, "product")
         
@@ -327,7 +324,7 @@ async def additionals_handler(message: Message, ctx: Context) -> None:
 
         return
 
-    allowed_additionals = await ctx.services.db.additionals.get(product)
+    allowed_additionals = await ctx.services.catalog.get_additionals(product)
     if text:
         text = text.replace(" ✅", "")
         additional = ctx.services.db.additionals.get_by_name(text, allowed_additionals, ctx)
@@ -27,7 +27,7 @@ async def cart_viewer_handler(_, ctx: Context):
                                 ctx)
         return
     
-    amount = await ctx.services.db.cart_entries.count_customer_cart_entries(ctx.customer)
+    amount = (await ctx.services.db.cart_entries.get_summary(ctx.customer)).count
     current = await ctx.fsm.get_value("current") or 1
     
     if text == '❌':
@@ -137,9 +137,9 @@ async def cart_price_confirmation_handler(_, ctx: Context):
     entries = await ctx.services.db.cart_entries.find_entries_by_order(order)
         
     disounted_products_ids = [ent.source_id for ent in entries if ent.source_type == CartItemSource.discounted]
-    for disounted_product_id in disounted_products_ids:
-        await ctx.services.db.discounted_products.delete_by_id(disounted_product_id)
-        await ctx.services.db.cart_entries.delete_discounted_product_from_carts(disounted_product_id)
+    if disounted_products_ids:
+        await ctx.services.db.discounted_products.delete_many_by_ids(disounted_products_ids)
+        await ctx.services.db.cart_entries.delete_discounted_product_from_carts(disounted_products_ids)
     
     await ctx.services.notificators.AdminChatNotificator.send_price_confirmation(order, ctx)
     
@@ -324,6 +324,18 @@ async def order_configuration_payment_confirmation_handler(_, ctx: Context):
                                         send_before=(ctx.t.CartTranslates.OrderConfiguration.price_changed, 1))
                 return
         
+        # Снимаем бонусы до промокода: если бонусов не хватило, использование промокода не тратится
+        bonuses_applied = order.price_details.bonuses_applied
+        if bonuses_applied:
+            try:
+                await ctx.services.db.customers.remove_bonus_money(ctx.customer, bonuses_applied, ctx)
+            except ValueError:
+                await order.update_applied_bonuses(None)
+                await order.save_in_fsm(ctx, "order")
+                await call_state_handler(CartStates.OrderConfiguration.Menu, ctx, order=order,
+                                        send_before=(ctx.t.CartTranslates.OrderConfiguration.bonus_balance_changed, 1))
+                return
+        
         # Промокод
         if order.promocode_id:
             promocode = await ctx.services.db.promocodes.find_one_by_id(order.promocode_id)
@@ -332,19 +344,22 @@ async def order_configuration_payment_confirmation_handler(_, ctx: Context):
             else:
                 entries = await ctx.services.db.cart_entries.find_entries_by_order(order) if entries_assigned else await ctx.services.db.cart_entries.find_customer_cart_entries(ctx.customer)
                 check_result = await promocode.check_promocode(ctx, entries)
+                if check_result == PromocodeCheckResult.ok:
+                    try:
+                        await ctx.services.db.promocodes.update_usage(order.promocode_id, 1)
+                    except ValueError:
+                        # лимит использований исчерпан параллельным заказом
+                        check_result = PromocodeCheckResult.max_usages_reached
+                        
                 if check_result != PromocodeCheckResult.ok:
+                    if bonuses_applied: await ctx.services.db.customers.add_bonus_money(ctx.customer, bonuses_applied, ctx)
+                    
                     check_result_text = getattr(ctx.t.EnumTranslates.PromocodeCheckResult, str(check_result.name))
                     check_result_text = ctx.t.CartTranslates.OrderConfiguration.promocode_check_failed.format(reason=check_result_text)
                     
                     await call_state_handler(CartStates.OrderConfiguration.Menu, ctx, order=order, 
                                             send_before=(check_result_text, 1))
                     return
-                    
-                await ctx.services.db.promocodes.update_usage(order.promocode_id, 1)
-                
-        # Снимаем бонусы
-        if order.price_details.bonuses_applied:
-            await ctx.services.db.customers.remove_bonus_money(ctx.customer, order.price_details.bonuses_applied, ctx)
         
         
         order.state.set_state(OrderStateKey.waiting_for_manual_payment_confirm)
@@ -47,7 +47,7 @@ async def command_start_handler(_, ctx: Context, command: CommandObject) -> None
             ctx.lang = lang
             ctx.t = TranslatorHub.get_for_lang(lang, ctx.services.placeholders)
 
-            await ctx.services.db.customers.save(ctx.customer)
+            await ctx.services.db.customers.save_changes(ctx.customer)
             await call_state_handler(NewUserStates.AskAge, ctx)
             return
         
@@ -68,7 +68,8 @@ async def command_start_handler(_, ctx: Context, command: CommandObject) -> None
         
         ctx.customer.giveaways.append(Participation(giveaway_id=giveaway.id,
                                                     when=datetime.now(timezone.utc)))
-        await ctx.services.db.customers.save(ctx.customer)
+        ctx.customer.mark_changed("giveaways")
+        await ctx.services.db.customers.save_changes(ctx.customer)
         await call_state_handler(CommonStates.MainMenu,
                                 ctx,
                                 send_before=(
@@ -91,7 +92,7 @@ async def lang_changing_handler(callback: CallbackQuery, ctx: Context) -> None:
     ctx.customer.lang = callback.data
     ctx.lang = callback.data
 
-    await ctx.services.db.customers.save(ctx.customer)
+    await ctx.services.db.customers.save_changes(ctx.customer)
 
     await callback.message.delete()
 
@@ -108,7 +109,7 @@ async def ask_age_handler(callback: CallbackQuery, ctx: Context) -> None:
         await call_state_handler(NewUserStates.CurrencyChoosing, ctx)
     elif text == "no":
         ctx.customer.banned = True
-        await ctx.services.db.customers.save(ctx.customer)
+        await ctx.services.db.customers.save_changes(ctx.customer)
         await ctx.message.answer(ctx.t.CommonTranslates.age_restriction)
         
     await callback.message.delete()
@@ -119,9 +120,7 @@ async def currency_choosing_handler(callback: CallbackQuery, ctx: Context) -> No
     if callback.data.upper() not in SUPPORTED_CURRENCIES.keys():
         return
     
-    await ctx.customer.change_selected_currency(callback.data, ctx, do_timeout=False)
-
-    await ctx.services.db.customers.save(ctx.customer)
+    await ctx.services.db.customers.change_currency(ctx.customer, callback.data, ctx, do_timeout=False)
 
     await callback.message.delete()
     
@@ -145,7 +144,8 @@ async def currency_choosing_handler(callback: CallbackQuery, ctx: Context) -> No
         
         ctx.customer.giveaways.append(Participation(giveaway_id=giveaway.id,
                                                     when=datetime.now(timezone.utc)))
-        await ctx.services.db.customers.save(ctx.customer)
+        ctx.customer.mark_changed("giveaways")
+        await ctx.services.db.customers.save_changes(ctx.customer)
         
         await call_state_handler(CommonStates.MainMenu,
                                 ctx,
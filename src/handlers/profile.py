@@ -70,7 +70,7 @@ async def profile_change_lang_handler(_, ctx: Context) -> None:
         ctx.lang = SUPPORTED_LANGUAGES_TEXT.get(ctx.message.text)
         ctx.t = TranslatorHub.get_for_lang(ctx.lang, ctx.services.placeholders)
         
-        await ctx.services.db.customers.save(ctx.customer)
+        await ctx.services.db.customers.save_changes(ctx.customer)
         
         text = ctx.t.ProfileTranslates.Settings.lang_changed
         
@@ -92,8 +92,7 @@ async def profile_change_lang_handler(_, ctx: Context) -> None:
             await call_state_handler(ProfileStates.Settings.Menu, ctx, send_before=(ctx.t.ProfileTranslates.Settings.nothing_changed, 1))
             return
         
-        await ctx.customer.change_selected_currency(currency, ctx)
-        await ctx.services.db.customers.save(ctx.customer)
+        await ctx.services.db.customers.change_currency(ctx.customer, currency, ctx)
         
         text = ctx.t.ProfileTranslates.Settings.currency_changed.format(currency=ctx.message.text)
         await call_state_handler(ProfileStates.Settings.Menu, ctx, send_before=(text, 1))
@@ -235,7 +234,7 @@ async def editable_service_handler(_, ctx: Context) -> None:
         return
 
 
-    services: Iterable[DeliveryService] = await ctx.services.db.delivery_services.get_all(is_foreign)
+    services: Iterable[DeliveryService] = await ctx.services.catalog.get_delivery_services(is_foreign)
     service_name = ctx.message.text.rsplit(" ", 1)[0]
     service = next((ser for ser in services if ser.name.get(ctx) == service_name), None)
     
@@ -323,7 +322,7 @@ async def editable_requirement_handler(_, ctx: Context) -> None:
         
         
         ctx.customer.privacy_data.delivery_info.service = service
-        await ctx.services.db.customers.save(ctx.customer)
+        await ctx.services.db.customers.update_delivery_info(ctx.customer, "service")
         
         if await ctx.fsm.get_value("back_to_cart_after_delivery"):
             await ctx.fsm.update_data(back_to_cart_after_delivery=None)
@@ -352,7 +351,7 @@ async def editable_send_to_manual_confirmation_handler(_, ctx: Context) -> None:
     
     ctx.customer.privacy_data.delivery_info.service = None
     ctx.customer.privacy_data.delivery_info.waiting_for_manual_delivery_info_confirmation = True
-    await ctx.services.db.customers.save(ctx.customer)
+    await ctx.services.db.customers.update_delivery_info(ctx.customer, "service", "waiting_for_manual_delivery_info_confirmation")
     
     await ctx.fsm.update_data(requirement_index=None, service=None)
     await call_state_handler(CommonStates.MainMenu, ctx, send_before=(ctx.t.ProfileTranslates.delivery_info_price_sent_to_confirmation, 1))
@@ -365,6 +364,6 @@ async def delete_confimation_handler(_, ctx: Context) -> None:
     
     ctx.customer.privacy_data.delivery_info.service = None
     
-    await ctx.services.db.customers.save(ctx.customer)
+    await ctx.services.db.customers.update_delivery_info(ctx.customer, "service")
     
     await call_state_handler(ProfileStates.Delivery.Menu, ctx)
\ No newline at end of file
@@ -5,7 +5,6 @@ from os import getenv
 import asyncio
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.fsm.storage.pymongo import PyMongoStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from pathlib import Path
@@ -19,18 +18,36 @@ sys.path.insert(0, str(Path(__file__).parent))   # adds src/ directory
 from handlers import admin_menu, discounted_products, profile, admin, bottom, cart, orders, common, assortment
 from core.logger import setup_logging
 from core import middlewares
-from configs.environment import BOT_TOKEN, MONGO_URI, MONGO_TLS_CA_PATH, MONGO_TLS_KEY_PATH, USE_WEBHOOK, APP_SERVER, WEB_SERVER_HOST, WEB_SERVER_PORT
+from core.fsm import SharedClientMongoStorage, TieredMongoStorage
+from core.services.mongo import get_mongo_client
+from core.services.throttling import MemoryThrottleBackend, MongoThrottleBackend
+from configs.environment import BOT_TOKEN, USE_WEBHOOK, APP_SERVER, WEB_SERVER_HOST, WEB_SERVER_PORT, FSM_STORAGE, FSM_SYNC_FLUSH, THROTTLE_BACKEND, WORKERS
+
+
+def create_fsm_storage(client: AsyncMongoClient):
+    if FSM_STORAGE == "tiered":
+        if WORKERS > 1:
+            logging.getLogger(__name__).warning("FSM_STORAGE=tiered with several workers: states of a user handled by different workers may diverge.")
+        return TieredMongoStorage(client, sync_flush=FSM_SYNC_FLUSH)
+    
+    return SharedClientMongoStorage(client)
+
+
+def create_throttle_backend(client: AsyncMongoClient):
+    if THROTTLE_BACKEND == "mongo":
+        return MongoThrottleBackend(client)
+    
+    return MemoryThrottleBackend()
 
 
 async def main():
+    # тот же клиент использует DatabaseService в ContextMiddleware
+    client = get_mongo_client()
 
-    dp = Dispatcher(storage=PyMongoStorage(AsyncMongoClient(MONGO_URI, 
-                    tls=True, 
-                    tlsCAFile=MONGO_TLS_CA_PATH,
-                    tlsCertificateKeyFile=MONGO_TLS_KEY_PATH)))
+    dp = Dispatcher(storage=create_fsm_storage(client))
 
     
-    dp.update.middleware.register(middlewares.ThrottlingMiddleware())
+    dp.update.middleware.register(middlewares.ThrottlingMiddleware(create_throttle_backend(client)))
     context_middleware = middlewares.ContextMiddleware()
     dp.update.middleware.register(context_middleware)
     dp.update.middleware.register(middlewares.ErrorLoggingMiddleware())
@@ -1,20 +1,26 @@
 from __future__ import annotations
 import asyncio
 from datetime import datetime, timezone, timedelta
+from decimal import Decimal
 import json
 import logging
 import re
-from typing import Any, Generic, Type, TypeVar, Optional, Iterable, TYPE_CHECKING, Union, cast, get_args
+import time
+from typing import Any, Awaitable, Callable, Generic, Type, TypeVar, Optional, Iterable, TYPE_CHECKING, Union, cast, get_args
 
 from aiogram.types import Message
 
-from pydantic import BaseModel, Field, field_validator, model_validator
+from cachetools import TTLCache
+from pydantic import BaseModel, Field, PrivateAttr, field_validator, model_validator
 
-from pymongo import ReplaceOne
+from bson import Decimal128, ObjectId
+from pymongo import ASCENDING, IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from pymongo.results import InsertOneResult, UpdateResult
 from pydantic_mongo import AsyncAbstractRepository, PydanticObjectId
 from pydantic_mongo.base_abstract_repository import (
     ModelWithId,
+    Sort,
     T as TPyMongoModel
 )
 
@@ -39,10 +45,64 @@ TDBModel = TypeVar("TDBModel", bound="AppDBModel[Any]")
 
 
 class AppAbstractRepository(AsyncAbstractRepository[T]):
+    MIGRATION_BATCH_SIZE = 500
+    
     def __init__(self, dbs: DatabaseService):
         super().__init__(dbs.db)
         self.dbs = dbs
         
+        # single-flight: одинаковые одновременные чтения выполняются одним запросом
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self.reads_executed = 0
+        self.reads_coalesced = 0
+        
+    async def _single_flight(self, key: tuple, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Если такой же запрос уже выполняется, дожидается его результата вместо нового запроса.
+        Общими бывают только сырые документы: модели каждый вызывающий строит сам, так как их изменяют.
+        """
+        if (future := self._inflight.get(key)) is not None:
+            self.reads_coalesced += 1
+            return await asyncio.shield(future)
+        
+        future = asyncio.ensure_future(fetch())
+        self._inflight[key] = future
+        future.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+        self.reads_executed += 1
+        return await asyncio.shield(future)
+    
+    def _forget_inflight(self):
+        # чтения, начатые до записи, могут вернуть старые данные - после записи к ним больше не присоединяемся
+        self._inflight.clear()
+        
+    async def find_one_by(self, query: dict) -> Optional[T]:
+        mapped_query = self._map_id(query)
+        document = await self._single_flight(("find_one", repr(mapped_query)),
+                                             lambda: self.get_collection().find_one(mapped_query))
+        return self.to_model(document) if document else None
+    
+    async def find_by_with_output_type(self, output_type: Type[TPyMongoModel], query: dict,
+                                       skip: Optional[int] = None, limit: Optional[int] = None,
+                                       sort: Optional[Sort] = None, projection: Optional[dict[str, int]] = None) -> Iterable[TPyMongoModel]:
+        mapped_query = self._map_id(query)
+        mapped_projection = self._map_id(projection) if projection else None
+        mapped_sort = self._map_sort(sort) if sort else None
+        
+        async def fetch() -> list[dict]:
+            cursor = self.get_collection().find(mapped_query, mapped_projection)
+            if limit: cursor.limit(limit)
+            if skip: cursor.skip(skip)
+            if mapped_sort: cursor.sort(mapped_sort)
+            return [document async for document in cursor]
+        
+        key = ("find", repr(mapped_query), skip, limit, repr(mapped_sort), repr(mapped_projection))
+        return [self.to_model_custom(output_type, document) for document in await self._single_flight(key, fetch)]
+    
+    async def count_where(self, query: dict) -> int:
+        mapped_query = self._map_id(query)
+        return await self._single_flight(("count", repr(mapped_query)),
+                                         lambda: self.get_collection().count_documents(mapped_query))
+        
     async def log(self, log_type: LogType, data: str):
         await self.dbs.logs.add_log_entry(log_type, data)
         
@@ -50,31 +110,170 @@ class AppAbstractRepository(AsyncAbstractRepository[T]):
         model_cls = get_args(type(self).__orig_bases__[0])[0]
         return model_cls.latest_schema_version()
 
-    async def check_migrations(self):
-        current_version = self.get_latest_schema_version()
-        query = {"$or": [
+    def _outdated_query(self) -> dict:
+        return {"$or": [
             {"schema_version": {"$exists": False}},
-            {"schema_version": {"$lt": current_version}}
+            {"schema_version": {"$lt": self.get_latest_schema_version()}}
         ]}
+    
+    async def has_outdated_documents(self) -> bool:
+        """Есть ли документы со schema_version ниже текущей; limit=1 - запрос не дочитывает коллекцию"""
+        return await self.get_collection().count_documents(self._outdated_query(), limit=1) > 0
+
+    async def check_migrations(self):
+        """
+        Переводит устаревшие документы на текущую schema_version пачками по MIGRATION_BATCH_SIZE.
+        Мигрированные документы сразу записываются и выпадают из выборки, поэтому прерванная миграция
+        продолжается с того же места при следующем запуске.
+        """
+        logger = logging.getLogger(__name__)
+        query = self._outdated_query()
         
-        migrated = await self.find_by(query)
-        if len(migrated) == 0:
+        total = await self.get_collection().count_documents(query)
+        if total == 0:
             return
         
-        await self.save_many_with_replace(migrated)
-        logging.getLogger(__name__).info(f"Migrated {len(migrated)} documents in {self._collection_name} collection")
+        logger.info(f"Migrating {total} documents in {self._collection_name} collection")
+        started_at = time.monotonic()
+        migrated = 0
+        failed = 0
+        batch: list[T] = []
+        
+        async def flush_batch():
+            nonlocal migrated
+            await self.save_many_with_replace(batch)
+            migrated += len(batch)
+            batch.clear()
+            
+            elapsed = time.monotonic() - started_at
+            logger.info(f"Migrated {migrated}/{total} documents in {self._collection_name} collection ({migrated / elapsed if elapsed else migrated:.0f} docs/s)")
+        
+        cursor = self.get_collection().find(query, batch_size=self.MIGRATION_BATCH_SIZE).sort("_id", 1)
+        async for document in cursor:
+            try:
+                batch.append(self.to_model(document))
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to migrate document {document.get('_id')} in {self._collection_name} collection: {e}")
+                continue
+            
+            if len(batch) >= self.MIGRATION_BATCH_SIZE:
+                await flush_batch()
+                
+        if batch:
+            await flush_batch()
+        
+        if failed:
+            raise RuntimeError(f"{failed} documents in {self._collection_name} collection failed to migrate")
+
+    def to_model_custom(self, output_type: Type[TPyMongoModel], data: dict) -> TPyMongoModel:
+        model = super().to_model_custom(output_type, data)
+        if isinstance(model, AppDBModel): model.clear_changes()
+        return model
+
+    async def save(self, model: TPyMongoModel) -> Union[InsertOneResult, UpdateResult]:
+        result = await super().save(model)
+        self._forget_inflight()
+        if isinstance(model, AppDBModel): model.clear_changes()
+        return result
+    
+    async def save_many(self, models: Iterable[TPyMongoModel]):
+        await super().save_many(models)
+        self._forget_inflight()
+    
+    async def delete(self, model: TPyMongoModel):
+        result = await super().delete(model)
+        self._forget_inflight()
+        return result
+    
+    async def delete_by_id(self, _id: Any):
+        result = await super().delete_by_id(_id)
+        self._forget_inflight()
+        return result
+
+    async def save_changes(self, model: TPyMongoModel, guard: Optional[dict] = None) -> Optional[Union[InsertOneResult, UpdateResult]]:
+        """
+        Записывает только изменённые поля модели через $set/$unset (None-значения снимаются через $unset).
+        Новые модели сохраняются целиком. guard - дополнительные условия на документ, результат тогда проверяет вызывающий код.
+        """
+        model_with_id = cast(ModelWithId, model)
+        if not model_with_id.id or not isinstance(model, AppDBModel):
+            return await self.save(model)
+        
+        changed = model.changed_fields
+        if not changed: return None
+        
+        dumped = model.model_dump(include=changed)
+        to_set = {key: value for key, value in dumped.items() if value is not None}
+        to_unset = {key: "" for key, value in dumped.items() if value is None}
+        
+        update = {}
+        if to_set: update["$set"] = to_set
+        if to_unset: update["$unset"] = to_unset
+        
+        result = await self.get_collection().update_one({"_id": model_with_id.id, **(guard or {})}, update)
+        self._forget_inflight()
+        model.clear_changes()
+        return result
+
+    async def update_where(self, query: dict, set_fields: dict[str, Any]) -> int:
+        """$set полей у всех документов по запросу без загрузки моделей. Возвращает число изменённых документов"""
+        result = await self.get_collection().update_many(self._map_id(query), {"$set": set_fields})
+        self._forget_inflight()
+        return result.modified_count
+    
+    async def delete_where(self, query: dict) -> int:
+        """Удаляет все документы по запросу одним delete_many. Возвращает число удалённых документов"""
+        result = await self.get_collection().delete_many(self._map_id(query))
+        self._forget_inflight()
+        return result.deleted_count
+
+    async def find_at_index(self, query: dict, idx: int, sort: Optional[Sort] = None) -> Optional[T]:
+        """Документ на позиции idx в отсортированной выборке (skip/limit по индексу, без выгрузки всех id)"""
+        if idx < 0: return None
+        
+        found = await self.find_by(query, skip=idx, limit=1, sort=sort or [("_id", 1)])
+        return found[0] if found else None
+    
+    async def find_at_index_with_count(self, query: dict, idx: int, sort: Optional[Sort] = None) -> tuple[Optional[T], int]:
+        """Документ на позиции idx и общее количество документов по запросу: оба запроса по индексу и одновременно"""
+        item, total = await asyncio.gather(self.find_at_index(query, idx, sort), self.count_where(query))
+        return item, total
+    
+    async def increment(self, model: TPyMongoModel, fields: dict[str, Any], guard: Optional[dict] = None) -> Optional[TPyMongoModel]:
+        """
+        Атомарно увеличивает поля через $inc (guard - дополнительные условия на документ)
+        и переносит новые значения в model. Возвращает обновлённую модель или None, если условия не выполнены.
+        """
+        document = await self.get_collection().find_one_and_update(
+            {"_id": cast(ModelWithId, model).id, **(guard or {})},
+            {"$inc": fields},
+            return_document=True
+        )
+        self._forget_inflight()
+        if not document: return None
+        
+        updated = self.to_model(document)
+        if isinstance(model, AppDBModel):
+            model.sync_fields(updated, *{field.split(".")[0] for field in fields})
+        return updated
 
     async def save_with_replace(self, model: TPyMongoModel) -> Union[InsertOneResult, UpdateResult]:
         document = self.to_document(model)
         model_with_id = cast(ModelWithId, model)
 
         if model_with_id.id:
-            return await self.get_collection().replace_one(
+            result = await self.get_collection().replace_one(
                 {"_id": document.pop("_id")}, document, upsert=True
             )
+            self._forget_inflight()
+            if isinstance(model, AppDBModel): model.clear_changes()
+            return result
 
         result = await self.get_collection().insert_one(document)
         model_with_id.id = result.inserted_id
+        self._forget_inflight()
+        if isinstance(model, AppDBModel): model.clear_changes()
         return result
 
     async def save_many_with_replace(self, models: Iterable[TPyMongoModel]):
@@ -94,6 +293,7 @@ class AppAbstractRepository(AsyncAbstractRepository[T]):
 
             for idx, inserted_id in enumerate(result.inserted_ids):
                 cast(ModelWithId, models_to_insert[idx]).id = inserted_id
+            self._forget_inflight()
 
         if len(models_to_update) == 0:
             return
@@ -105,7 +305,54 @@ class AppAbstractRepository(AsyncAbstractRepository[T]):
             for mongo_id, document in zip(mongo_ids, documents_to_update)
         ]
         await self.get_collection().bulk_write(bulk_operations, ordered=False)
+        self._forget_inflight()
         
+class CatalogRepository(AppAbstractRepository[T]):
+    """Репозиторий данных каталога: любая запись поднимает версию каталога, по которой CatalogCache сбрасывает кеш"""
+
+    async def save(self, model: TPyMongoModel) -> Union[InsertOneResult, UpdateResult]:
+        result = await super().save(model)
+        await self.dbs.bump_catalog_version()
+        return result
+
+    async def save_changes(self, model: TPyMongoModel) -> Optional[Union[InsertOneResult, UpdateResult]]:
+        result = await super().save_changes(model)
+        if result is not None: await self.dbs.bump_catalog_version()
+        return result
+
+    async def save_many(self, models: Iterable[TPyMongoModel]):
+        await super().save_many(models)
+        await self.dbs.bump_catalog_version()
+
+    async def save_with_replace(self, model: TPyMongoModel) -> Union[InsertOneResult, UpdateResult]:
+        result = await super().save_with_replace(model)
+        await self.dbs.bump_catalog_version()
+        return result
+
+    async def save_many_with_replace(self, models: Iterable[TPyMongoModel]):
+        await super().save_many_with_replace(models)
+        await self.dbs.bump_catalog_version()
+
+    async def delete(self, model: TPyMongoModel):
+        result = await super().delete(model)
+        await self.dbs.bump_catalog_version()
+        return result
+
+    async def delete_by_id(self, _id: Any):
+        result = await super().delete_by_id(_id)
+        await self.dbs.bump_catalog_version()
+        return result
+
+    async def update_where(self, query: dict, set_fields: dict[str, Any]) -> int:
+        modified = await super().update_where(query, set_fields)
+        if modified: await self.dbs.bump_catalog_version()
+        return modified
+
+    async def delete_where(self, query: dict) -> int:
+        deleted = await super().delete_where(query)
+        if deleted: await self.dbs.bump_catalog_version()
+        return deleted
+
 # класс BaseModel, но со своей функцией для загрузки сериализованных объектов
 class AppBaseModel(BaseModel, Generic[TModel]):
     @classmethod
@@ -134,6 +381,31 @@ class AppBaseModel(BaseModel, Generic[TModel]):
 class AppDBModel(AppBaseModel[TModel]):
     schema_version: int = 0
     
+    # поля верхнего уровня, присвоенные после загрузки/сохранения; вложенные изменения нужно отмечать через mark_changed
+    _changed_fields: set[str] = PrivateAttr(default_factory=set)
+    
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        
+        if name in type(self).model_fields and self.__pydantic_private__ is not None:
+            self._changed_fields.add(name)
+    
+    @property
+    def changed_fields(self) -> set[str]:
+        return set(self._changed_fields)
+    
+    def mark_changed(self, *fields: str):
+        """Отмечает поля изменёнными, например после изменения вложенной модели на месте"""
+        self._changed_fields.update(fields)
+        
+    def clear_changes(self):
+        self._changed_fields.clear()
+        
+    def sync_fields(self, source: "AppDBModel", *fields: str):
+        """Копирует значения полей из source, не отмечая их изменёнными"""
+        for field in fields:
+            super().__setattr__(field, getattr(source, field))
+    
     @model_validator(mode="before")
     @classmethod
     def _base_migrate(cls, data: dict):
@@ -228,8 +500,23 @@ class Placeholder(AppDBModel):
     value: LocalizedString
     
 class PlaceholdersRepository(AppAbstractRepository[Placeholder]):
+    INVALIDATION_TOPIC = "placeholders"
+    
     class Meta:
         collection_name = 'placeholders'
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True)
+        ]
+    
+    async def save(self, model: Placeholder) -> Union[InsertOneResult, UpdateResult]:
+        result = await super().save(model)
+        await self.dbs.invalidation.publish(self.INVALIDATION_TOPIC, [model.key])
+        return result
+    
+    async def delete(self, model: Placeholder):
+        result = await super().delete(model)
+        await self.dbs.invalidation.publish(self.INVALIDATION_TOPIC, [model.key])
+        return result
         
     async def find_by_key(self, key: str) -> Optional[Placeholder]:
         return await self.find_one_by({'key': key})
@@ -293,6 +580,7 @@ class OrderState(BaseModel):
 class Order(AppDBModel):
     id: Optional[PydanticObjectId] = None
     puid: Optional[str] = None
+    puid_unique: bool = False  # puid проверен уникальным индексом при создании заказа
     number: Optional[int] = None
     
     customer_id: PydanticObjectId
@@ -355,12 +643,39 @@ class Order(AppDBModel):
 class OrdersRepository(AppAbstractRepository[Order]):
     class Meta:
         collection_name = 'orders'
+        indexes = [
+            IndexModel([("customer_id", ASCENDING)]),
+            IndexModel([("number", ASCENDING)], unique=True),
+            IndexModel([("puid", ASCENDING)]),
+            # уникальность puid проверяется только у новых заказов: старые дубликаты остаются как есть,
+            # их puid уже видели покупатели, а поиск по puid в админке дубликаты учитывает
+            IndexModel([("puid", ASCENDING), ("puid_unique", ASCENDING)], unique=True, partialFilterExpression={"puid_unique": True}),
+            IndexModel([("state.key", ASCENDING)])
+        ]
+        
+    NUMBER_BLOCK_SIZE = 20
+    PUID_ATTEMPTS = 5
         
     def __init__(self, dbs: DatabaseService):
         super().__init__(dbs)
         
         self.logger = logging.getLogger(__name__)
         
+        # номера заказов резервируются блоками (hi/lo), чтобы не ходить в counters на каждый заказ
+        self._next_number = 0
+        self._block_end = -1
+        self._number_lock = asyncio.Lock()
+        
+    async def _allocate_number(self) -> int:
+        async with self._number_lock:
+            if self._next_number > self._block_end:
+                self._block_end = await self.dbs.reserve_counter_block(self.Meta.collection_name, self.NUMBER_BLOCK_SIZE)
+                self._next_number = self._block_end - self.NUMBER_BLOCK_SIZE + 1
+            
+            number = self._next_number
+            self._next_number += 1
+            return number
+        
     def new_order(self, customer: Customer, products_price: LocalizedMoney, save_delivery_info: bool = True) -> Order:
         delivery_info = customer.privacy_data.delivery_info if save_delivery_info else None
         price_details = OrderPriceDetails.new(customer, products_price, delivery_info)
@@ -370,6 +685,9 @@ class OrdersRepository(AppAbstractRepository[Order]):
     async def find_customer_orders(self, customer: Customer) -> Iterable[Order]:
         return await self.find_by({"customer_id": customer.id})
     
+    async def find_last_customer_orders(self, customer: Customer, limit: int) -> Iterable[Order]:
+        return await self.find_by({"customer_id": customer.id}, limit=limit, sort=[("_id", -1)])
+    
     async def find_by_puid(self, puid: str, customer: Optional[Customer] = None) -> Optional[Order] | Iterable[Order]:
         if customer:
             return await self.find_one_by({"puid": puid, "customer_id": customer.id})
@@ -382,21 +700,56 @@ class OrdersRepository(AppAbstractRepository[Order]):
     async def count_formed_customer_orders(self, customer: Customer) -> int:
         return await self.get_collection().count_documents({"customer_id": customer.id, "state.key": {"$ne": OrderStateKey.waiting_for_forming.name}})
     
+    async def count_active_by_state(self) -> list[tuple[OrderStateKey, int]]:
+        """Число незавершённых заказов по статусам в порядке OrderStateKey"""
+        cursor = await self.get_collection().aggregate([
+            {"$match": {"state.key": {"$ne": OrderStateKey.received}}},
+            {"$group": {"_id": "$state.key", "count": {"$sum": 1}}}
+        ])
+        
+        counts = {}
+        async for document in cursor:
+            try:
+                counts[OrderStateKey(document["_id"])] = document["count"]
+            except ValueError:
+                # устаревший или неизвестный статус - в обзоре не показываем
+                self.logger.warning(f"{document['count']} orders have unknown state {document['_id']!r}")
+        return [(state, counts[state]) for state in OrderStateKey if state in counts]
+    
+    async def find_active_ids_page(self, state: OrderStateKey, skip: int, limit: int) -> list[PydanticObjectId]:
+        """id заказов в статусе state по возрастанию _id, страница [skip; skip + limit)"""
+        cursor = self.get_collection().find({"state.key": state}, projection={"_id": 1}).sort("_id", 1).skip(skip).limit(limit)
+        return [PydanticObjectId(document["_id"]) async for document in cursor]
+    
     async def save(self, order: Order):
-        order.number = order.number or await self.dbs.get_next_for_counter(self.Meta.collection_name)
+        order.number = order.number or await self._allocate_number()
         
-        # puid только для нового заказа
-        if not order.id:
-            result = await super().save(order)
-            inserted_id = str(result.inserted_id)
-            
-            order.id = PydanticObjectId(inserted_id)
-            order.puid = Order.generate_puid(inserted_id)
-            self.logger.info(f"New order {order.id} for customer {order.customer_id}")
-            
-        await super().save(order)
+        if order.id:
+            return await super().save(order)
+        
+        # id и puid генерируются на клиенте, чтобы новый заказ записывался одним insert
+        for attempt in range(self.PUID_ATTEMPTS):
+            order.id = PydanticObjectId(ObjectId())
+            order.puid = Order.generate_puid(str(order.id))
+            order.puid_unique = True
+            try:
+                result = await self.get_collection().insert_one(self.to_document(order))
+                break
+            except DuplicateKeyError as e:
+                if "puid" not in str(e) or attempt == self.PUID_ATTEMPTS - 1:
+                    order.id = order.puid = None
+                    order.puid_unique = False
+                    raise
+                self.logger.warning(f"puid collision for {order.puid}, regenerating")
+        
+        self._forget_inflight()
+        order.clear_changes()
+        self.logger.info(f"New order {order.id} for customer {order.customer_id}")
+        return result
     
 class CartEntry(AppDBModel):
+    schema_version: int = 1
+    
     id: Optional[PydanticObjectId] = None
     customer_id: PydanticObjectId
     order_id: Optional[PydanticObjectId] = None
@@ -429,6 +782,19 @@ class CartEntry(AppDBModel):
 
         return data
     
+    @model_validator(mode="before")
+    @classmethod
+    def migrate(cls, data: dict):
+        if not isinstance(data, dict):
+            return data
+        
+        if data.get("schema_version", 0) == 0:
+            # у старых записей нет configuration.price: модель считает его из опций при загрузке,
+            # а миграция сохраняет, чтобы пайплайн цен не считал такую конфигурацию бесплатной
+            data["schema_version"] = 1
+        
+        return data
+    
     @model_validator(mode="before")
     @classmethod
     def resolve_snapshot(cls, data: dict):
@@ -464,9 +830,26 @@ class CartEntry(AppDBModel):
         elif self.source_type == CartItemSource.discounted:
             return self.frozen_snapshot.price
 
+class CartSummary(AppBaseModel):
+    """Сводка корзины покупателя (коллекция cart_summaries), пересчитывается при каждом изменении её записей"""
+    id: Optional[PydanticObjectId] = None # id покупателя
+    count: int = 0
+    entry_ids: list[PydanticObjectId] = Field(default_factory=list) # в порядке добавления
+    total: LocalizedMoney = Field(default_factory=LocalizedMoney)
+    requires_price_confirmation: bool = False
+    catalog_version: int = 0 # версия каталога, по ценам которой посчитан total
+    refreshed_at: Optional[datetime] = None # начало пересчёта; более старый пересчёт не перезаписывает более новый
+
 class CartEntriesRepository(AppAbstractRepository[CartEntry]):
+    SUMMARIES_COLLECTION = "cart_summaries"
+    
     class Meta:
         collection_name = 'cart_entries'
+        indexes = [
+            IndexModel([("customer_id", ASCENDING), ("order_id", ASCENDING), ("_id", ASCENDING)]),
+            IndexModel([("source_id", ASCENDING), ("order_id", ASCENDING)]),
+            IndexModel([("order_id", ASCENDING)])
+        ]
     
     def __init__(self, dbs: DatabaseService):
         super().__init__(dbs)
@@ -474,6 +857,44 @@ class CartEntriesRepository(AppAbstractRepository[CartEntry]):
         self.logger = logging.getLogger(__name__)
         
     
+    async def save(self, model: CartEntry) -> Union[InsertOneResult, UpdateResult]:
+        result = await super().save(model)
+        await self.refresh_summaries([model.customer_id])
+        return result
+    
+    async def save_changes(self, model: CartEntry) -> Optional[Union[InsertOneResult, UpdateResult]]:
+        result = await super().save_changes(model)
+        if result is not None: await self.refresh_summaries([model.customer_id])
+        return result
+    
+    async def save_many(self, models: Iterable[CartEntry]):
+        models = list(models)
+        await super().save_many(models)
+        await self.refresh_summaries(model.customer_id for model in models)
+        
+    async def delete(self, model: CartEntry):
+        result = await super().delete(model)
+        await self.refresh_summaries([model.customer_id])
+        return result
+    
+    async def delete_by_id(self, _id: Any):
+        document = await self.get_collection().find_one_and_delete({"_id": _id}, projection={"customer_id": 1})
+        self._forget_inflight()
+        if document: await self.refresh_summaries([document["customer_id"]])
+        return document
+    
+    async def update_where(self, query: dict, set_fields: dict[str, Any]) -> int:
+        customer_ids = await self.get_collection().distinct("customer_id", self._map_id(query))
+        modified = await super().update_where(query, set_fields)
+        if modified: await self.refresh_summaries(customer_ids)
+        return modified
+    
+    async def delete_where(self, query: dict) -> int:
+        customer_ids = await self.get_collection().distinct("customer_id", self._map_id(query))
+        deleted = await super().delete_where(query)
+        if deleted: await self.refresh_summaries(customer_ids)
+        return deleted
+    
     async def add_to_cart(self, source: Product | DiscountedProduct, customer: Customer):
         is_product = isinstance(source, Product)
 
@@ -495,12 +916,11 @@ class CartEntriesRepository(AppAbstractRepository[CartEntry]):
                                                             "order_id": {"$ne": None},
                                                             "source_id": product.id}) > 0
         
-    async def delete_discounted_product_from_carts(self, discounted_product_id: PydanticObjectId):
-        entries = await self.find_by({"order_id": None, 
-                            "source_type": CartItemSource.discounted,
-                            "source_id": discounted_product_id})
-        for entry in entries:
-            await self.delete(entry)
+    async def delete_discounted_product_from_carts(self, discounted_product_id: PydanticObjectId | list[PydanticObjectId]) -> int:
+        source_id = {"$in": discounted_product_id} if isinstance(discounted_product_id, list) else discounted_product_id
+        return await self.delete_where({"order_id": None,
+                                        "source_type": CartItemSource.discounted,
+                                        "source_id": source_id})
         
     async def count_customer_cart_entries(self, customer: Customer):
         return await self.get_collection().count_documents({"customer_id": customer.id, "order_id": None})
@@ -526,12 +946,35 @@ class CartEntriesRepository(AppAbstractRepository[CartEntry]):
         base_query = {**(query or {}), "source_id": product.id}
         return await self.find_by(base_query, sort=[("_id", 1)])
 
-    async def find_customer_cart_entry_by_id(self, customer: Customer, idx: int) -> Optional[CartEntry]:
-        ids = await self.find_customer_cart_ids_sorted_by_date(customer)
-        if not ids: return None
+    async def find_entry_names_by_orders(self, order_ids: list[PydanticObjectId]) -> dict[PydanticObjectId, list[LocalizedString]]:
+        """Названия содержимого заказов за два запроса: записи всех заказов и названия их товаров"""
+        if not order_ids: return {}
+        
+        cursor = self.get_collection().find(
+            {"order_id": {"$in": order_ids}},
+            projection={"order_id": 1, "source_type": 1, "source_id": 1, "frozen_snapshot.name": 1}
+        ).sort("_id", 1)
+        entries = [document async for document in cursor]
         
-        return await self.find_one_by_id(ids[idx]) if 0 <= idx < len(ids) else None
+        product_names = await self.dbs.products.get_names_by_ids(
+            list({entry["source_id"] for entry in entries if entry.get("source_type") != CartItemSource.discounted})
+        )
+        
+        products: dict[PydanticObjectId, dict[PydanticObjectId, LocalizedString]] = {}
+        discounted: dict[PydanticObjectId, list[LocalizedString]] = {}
+        for entry in entries:
+            if entry.get("source_type") == CartItemSource.discounted:
+                if name := (entry.get("frozen_snapshot") or {}).get("name"):
+                    discounted.setdefault(entry["order_id"], []).append(LocalizedString.model_validate(name))
+            elif name := product_names.get(entry["source_id"]):
+                products.setdefault(entry["order_id"], {})[entry["source_id"]] = name
         
+        # как и раньше: сначала товары (без повторов), потом уценка
+        return {order_id: [*products.get(order_id, {}).values(), *discounted.get(order_id, [])] for order_id in order_ids}
+    
+    async def find_customer_cart_entry_by_id(self, customer: Customer, idx: int) -> Optional[CartEntry]:
+        return await self.find_at_index({"customer_id": customer.id, "order_id": None}, idx)
+    
     async def assign_cart_entries_to_order(self, customer: Customer, order: Order):
         entries = await self.find_customer_cart_entries(customer)
         
@@ -553,6 +996,7 @@ class CartEntriesRepository(AppAbstractRepository[CartEntry]):
                 entry.frozen_snapshot = products_map.get(entry.source_id)
             
         await self.save_many(entries)
+        await self.dbs.daily_stats.record_order_formed(order, entries)
         
     async def unassign_cart_entries_from_order(self, order: Order):
         entries = await self.find_entries_by_order(order)
@@ -567,16 +1011,170 @@ class CartEntriesRepository(AppAbstractRepository[CartEntry]):
             #     await self.delete(entry)
         
         await self.save_many(entries)
+        await self.dbs.daily_stats.record_order_unformed(order, entries)
         
-    async def update_product_in_carts(self, product: Product, additionals: Iterable[ProductAdditional]):
-        entries = await self.find_entries_by_product(product)
-        for entry in entries:
+    async def update_product_in_carts(self, product: Product, additionals: Iterable[ProductAdditional],
+                                      on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> int:
+        """
+        Переносит изменения конфигурации товара в открытые корзины (записи в заказах заморожены).
+        Записи читаются курсором батчами, в БД уходят только изменившиеся конфигурации.
+        on_progress(обработано, всего) вызывается после каждого батча. Возвращает число изменённых записей.
+        """
+        additionals = list(additionals)
+        query = {"source_id": product.id, "order_id": None, "source_type": CartItemSource.product}
+        total = await self.get_collection().count_documents(query)
+        
+        processed = updated = 0
+        customer_ids = set()
+        operations: list[UpdateOne] = []
+        
+        async def flush_batch():
+            nonlocal updated
+            if operations:
+                result = await self.get_collection().bulk_write(operations, ordered=False)
+                updated += result.modified_count
+                operations.clear()
+                self._forget_inflight()
+            if on_progress: await on_progress(processed, total)
+        
+        cursor = self.get_collection().find(query, batch_size=self.MIGRATION_BATCH_SIZE).sort("_id", 1)
+        async for document in cursor:
+            processed += 1
+            entry = self.to_model(document)
+            if not entry.configuration: continue
+            
             entry.configuration.update(product.configuration, additionals)
-
-        await self.save_many(entries)
+            configuration = self.to_document(entry)["configuration"]
+            if configuration != document.get("configuration"):
+                operations.append(UpdateOne({"_id": entry.id}, {"$set": {"configuration": configuration}}))
+                customer_ids.add(entry.customer_id)
+            
+            if processed % self.MIGRATION_BATCH_SIZE == 0:
+                await flush_batch()
+        await flush_batch()
+        
+        if customer_ids: await self.refresh_summaries(customer_ids)
+        self.logger.info(f"Updated {updated} of {total} cart entries for product {product.id}")
+        return updated
     
-    async def calculate_customer_cart_price(self, customer: Customer) -> LocalizedMoney:
-        entries: Iterable[CartEntry] = await self.find_by({"customer_id": customer.id, "order_id": None})
+    @staticmethod
+    def _money_amount(localized_money: Any, currency: Any) -> dict:
+        """$-выражение: сумма LocalizedMoney в валюте currency или 0, как LocalizedMoney.get_amount"""
+        return {"$ifNull": [
+            {"$first": {"$map": {
+                "input": {"$filter": {
+                    "input": {"$objectToArray": {"$ifNull": [f"{localized_money}.data", {"$literal": {}}]}},
+                    "cond": {"$eq": ["$$this.k", currency]}
+                }},
+                "in": "$$this.v.amount"
+            }}},
+            Decimal128("0")
+        ]}
+
+    @staticmethod
+    def _round_money(amount: Any, currency: Any) -> dict:
+        """$-выражение: округление до точности валюты по ROUND_HALF_UP, как Money._quantize ($round в Mongo округляет к чётному)"""
+        factor = {"$switch": {
+            "branches": [{"case": {"$eq": [currency, iso]}, "then": Decimal128(str(10 ** info.precision))}
+                         for iso, info in SUPPORTED_CURRENCIES.items()],
+            "default": Decimal128("1")
+        }}
+        return {"$let": {
+            "vars": {"amount": amount, "factor": factor},
+            "in": {"$divide": [
+                {"$multiply": [
+                    {"$cond": [{"$lt": ["$$amount", 0]}, -1, 1]},
+                    {"$floor": {"$add": [{"$multiply": [{"$abs": "$$amount"}, "$$factor"]}, Decimal128("0.5")]}}
+                ]},
+                "$$factor"
+            ]}
+        }}
+
+    def _priced_entries_stages(self, query: dict) -> list[dict]:
+        """
+        Стадии, выдающие по записи на каждую запись корзины по запросу (в порядке _id) с её суммой по валютам в items.
+        Повторяет calculate_price_reference: товар по текущей цене (с его скидкой) плюс цена конфигурации,
+        уценённый товар по цене из frozen_snapshot.
+        """
+        base = self._money_amount("$product.base_price", "$$currency")
+        discount_type = "$product.discount.dicount_type"
+        discount = {"$switch": {
+            "branches": [
+                {"case": {"$eq": [discount_type, DiscountType.percent]},
+                 "then": self._round_money({"$max": [{"$min": [{"$multiply": [base, {"$divide": ["$product.discount.value", Decimal128("100")]}]}, base]}, 0]}, "$$currency")},
+                {"case": {"$eq": [discount_type, DiscountType.fixed]},
+                 "then": {"$max": [{"$min": [self._money_amount("$product.discount.value", "$$currency"), base]}, 0]}}
+            ],
+            "default": Decimal128("0")
+        }}
+
+        product_items = {"$map": {
+            "input": {"$setUnion": [
+                {"$map": {"input": {"$objectToArray": {"$ifNull": ["$configuration.price.data", {"$literal": {}}]}}, "in": "$$this.k"}},
+                {"$map": {"input": {"$objectToArray": "$product.base_price.data"}, "in": "$$this.k"}}
+            ]},
+            "as": "currency",
+            "in": {
+                "k": "$$currency",
+                "v": {"$multiply": [
+                    {"$add": [self._money_amount("$configuration.price", "$$currency"), {"$subtract": [base, discount]}]},
+                    "$quantity"
+                ]}
+            }
+        }}
+        discounted_items = {"$map": {
+            "input": {"$objectToArray": "$frozen_snapshot.price.data"},
+            "in": {"k": "$$this.k", "v": {"$multiply": ["$$this.v.amount", "$quantity"]}}
+        }}
+
+        return [
+            {"$match": self._map_id(query)},
+            {"$sort": {"_id": 1}},
+            {"$project": {"customer_id": 1, "source_type": 1, "source_id": 1, "quantity": 1,
+                          "configuration.price": 1, "configuration.requires_price_confirmation": 1, "frozen_snapshot.price": 1}},
+            {"$lookup": {
+                "from": self.dbs.products._collection_name,
+                "localField": "source_id",
+                "foreignField": "_id",
+                "pipeline": [{"$project": {"base_price": 1, "discount": 1}}],
+                "as": "product"
+            }},
+            {"$unwind": {"path": "$product", "preserveNullAndEmptyArrays": True}},
+            {"$project": {
+                "customer_id": 1,
+                "requires_price_confirmation": {"$ifNull": ["$configuration.requires_price_confirmation", False]},
+                "items": {"$switch": {
+                    "branches": [
+                        # как и в calculate_price_reference, записи удалённых товаров не учитываются
+                        {"case": {"$and": [{"$eq": ["$source_type", CartItemSource.product]}, {"$eq": [{"$type": "$product"}, "object"]}]},
+                         "then": product_items},
+                        {"case": {"$eq": ["$source_type", CartItemSource.discounted]},
+                         "then": discounted_items}
+                    ],
+                    "default": []
+                }}
+            }}
+        ]
+
+    def _price_pipeline(self, query: dict) -> list[dict]:
+        """Пайплайн, считающий сумму записей по валютам на стороне Mongo: [{"_id": валюта, "total": Decimal128}]"""
+        return [
+            *self._priced_entries_stages(query),
+            {"$unwind": "$items"},
+            {"$group": {"_id": "$items.k", "total": {"$sum": "$items.v"}}}
+        ]
+
+    async def calculate_price(self, query: dict) -> LocalizedMoney:
+        """Сумма записей корзины по запросу одним агрегатом"""
+        cursor = await self.get_collection().aggregate(self._price_pipeline(query))
+        return LocalizedMoney(data={
+            document["_id"]: Money(currency=document["_id"], amount=document["total"])
+            async for document in cursor
+        })
+
+    async def calculate_price_reference(self, query: dict) -> LocalizedMoney:
+        """Та же сумма, посчитанная на моделях в питоне - эталон для calculate_price в tests/test_cart_pricing.py"""
+        entries: Iterable[CartEntry] = await self.find_by(query)
         products: Iterable[Product] = await self.dbs.products.find_by({"_id": {"$in": [entry.source_id for entry in entries if entry.source_type == CartItemSource.product]}})
         product_map: dict[PydanticObjectId, Product] = {
             product.id: product for product in products
@@ -587,24 +1185,159 @@ class CartEntriesRepository(AppAbstractRepository[CartEntry]):
             if entry.source_type == CartItemSource.product and (product := product_map.get(entry.source_id)):
                 total_price += entry.calculate_price(product)
             if entry.source_type == CartItemSource.discounted:
-                total_price += entry.calculate_price()
+                total_price += entry.frozen_snapshot.price * entry.quantity
         return total_price
 
+    async def calculate_customer_cart_price(self, customer: Customer) -> LocalizedMoney:
+        return await self.calculate_price({"customer_id": customer.id, "order_id": None})
+
     async def calculate_cart_entries_price_by_order(self, order: Order) -> LocalizedMoney:
-        entries: Iterable[CartEntry] = await self.find_by({"order_id": order.id})
-        products: Iterable[Product] = await self.dbs.products.find_by({"_id": {"$in": [entry.source_id for entry in entries if entry.source_type == CartItemSource.product]}})
-        product_map: dict[PydanticObjectId, Product] = {
-            product.id: product for product in products
-        }
+        return await self.calculate_price({"order_id": order.id})
+    
+    def _summaries(self):
+        return self.dbs.db[self.SUMMARIES_COLLECTION]
 
-        total_price = LocalizedMoney()
-        for entry in entries:
-            if entry.source_type == CartItemSource.product and (product := product_map.get(entry.source_id)):
-                entry_total = (product.price + entry.configuration.price) * entry.quantity
-                total_price += entry_total
-            if entry.source_type == CartItemSource.discounted:
-                total_price += entry.frozen_snapshot.price * entry.quantity
-        return total_price
+    async def refresh_summaries(self, customer_ids: Iterable[PydanticObjectId]):
+        """Пересчитывает сводки корзин покупателей одним агрегатом с $merge в cart_summaries"""
+        customer_ids = list(set(customer_ids))
+        if not customer_ids: return
+        
+        # версию читаем до цен: если каталог изменится во время пересчёта, сводка останется устаревшей по версии
+        catalog_version = await self.dbs.get_catalog_version()
+        
+        empty_summaries = [
+            CartSummary(id=customer_id).model_dump(exclude={"id"}) | {"_id": customer_id} for customer_id in customer_ids
+        ]
+        
+        await self.get_collection().aggregate([
+            *self._priced_entries_stages({"customer_id": {"$in": customer_ids}, "order_id": None}),
+            {"$group": {
+                "_id": "$customer_id",
+                "count": {"$sum": 1},
+                "entry_ids": {"$push": "$_id"},
+                "requires_price_confirmation": {"$max": "$requires_price_confirmation"},
+                "items": {"$push": "$items"}
+            }},
+            {"$set": {"items": {"$reduce": {"input": "$items", "initialValue": [], "in": {"$concatArrays": ["$$value", "$$this"]}}}}},
+            {"$project": {
+                "count": 1,
+                "entry_ids": 1,
+                "requires_price_confirmation": 1,
+                "total": {"data": {"$arrayToObject": {"$map": {
+                    "input": {"$setUnion": ["$items.k"]},
+                    "as": "currency",
+                    "in": {"k": "$$currency", "v": {
+                        "currency": "$$currency",
+                        "amount": {"$sum": {"$map": {
+                            "input": {"$filter": {"input": "$items", "cond": {"$eq": ["$$this.k", "$$currency"]}}},
+                            "in": "$$this.v"
+                        }}}
+                    }}
+                }}}}
+            }},
+            # опустевшие корзины в группировку не попадают - для них пишем пустую сводку
+            {"$unionWith": {"pipeline": [{"$documents": empty_summaries}]}},
+            {"$sort": {"count": -1}},
+            {"$group": {"_id": "$_id", "summary": {"$first": "$$ROOT"}}},
+            {"$replaceWith": "$summary"},
+            {"$set": {"catalog_version": catalog_version, "refreshed_at": "$$NOW"}},
+            # параллельные пересчёты одной корзины могут закончиться в любом порядке - оставляем начатый позже,
+            # он прочитал записи не раньше любого изменения, после которого начался другой
+            {"$merge": {
+                "into": self.SUMMARIES_COLLECTION,
+                "whenMatched": [{"$replaceWith": {"$cond": [{"$lt": ["$$new.refreshed_at", "$refreshed_at"]}, "$$ROOT", "$$new"]}}],
+                "whenNotMatched": "insert"
+            }}
+        ])
+        
+    async def refresh_all_summaries(self) -> int:
+        """Пересчитывает сводки всех непустых корзин пачками, например после ручной правки цен в БД. Возвращает число корзин"""
+        customer_ids = set(await self.get_collection().distinct("customer_id", {"order_id": None}))
+        customer_ids.update(await self._summaries().distinct("_id", {"count": {"$gt": 0}}))
+        
+        customer_ids = sorted(customer_ids)
+        for start in range(0, len(customer_ids), self.MIGRATION_BATCH_SIZE):
+            await self.refresh_summaries(customer_ids[start:start + self.MIGRATION_BATCH_SIZE])
+        return len(customer_ids)
+        
+    async def refresh_product_summaries(self, product_id: PydanticObjectId):
+        """Пересчитывает сводки корзин, в которых лежит товар (после изменения его цены)"""
+        customer_ids = await self.get_collection().distinct("customer_id", {"source_id": product_id, "order_id": None})
+        await self.refresh_summaries(customer_ids)
+
+    @staticmethod
+    def _summary_from_document(document: dict) -> CartSummary:
+        return CartSummary.model_validate({
+            "id": document["_id"],
+            **{field: document[field] for field in CartSummary.model_fields if field in document}
+        })
+
+    @staticmethod
+    def _summary_is_current(document: dict) -> bool:
+        actual_count = document["actual"][0]["count"] if document["actual"] else 0
+        catalog_version = document["catalog"][0]["version"] if document["catalog"] else 0
+        
+        return (document["count"] == actual_count
+                and document.get("catalog_version", 0) >= catalog_version
+                and (document["count"] == 0 or bool(document["entry"])))
+
+    async def get_summary(self, customer: Customer) -> CartSummary:
+        document = await self._summaries().find_one({"_id": customer.id})
+        if document is None:
+            await self.refresh_summaries([customer.id])
+            document = await self._summaries().find_one({"_id": customer.id})
+        return self._summary_from_document(document) if document else CartSummary(id=customer.id)
+    
+    async def find_cart_page(self, customer: Customer, idx: int) -> tuple[CartSummary, Optional[CartEntry], Optional[Product]]:
+        """
+        Сводка корзины, запись на позиции idx (первая, если такой позиции нет) и её товар одним запросом.
+        В том же запросе считаются записи корзины и читается версия каталога: сводка с другим числом записей
+        или посчитанная по старым ценам пересчитывается.
+        """
+        pipeline = [
+            {"$match": {"_id": customer.id}},
+            {"$lookup": {
+                "from": self._collection_name,
+                "let": {"entry_id": {"$arrayElemAt": [
+                    "$entry_ids",
+                    {"$cond": [{"$and": [{"$gte": [idx, 0]}, {"$lt": [idx, "$count"]}]}, idx, 0]}
+                ]}},
+                "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$entry_id"]}}}],
+                "as": "entry"
+            }},
+            {"$lookup": {
+                "from": self.dbs.products._collection_name,
+                "localField": "entry.source_id",
+                "foreignField": "_id",
+                "as": "product"
+            }},
+            {"$lookup": {
+                "from": self._collection_name,
+                "pipeline": [{"$match": {"customer_id": customer.id, "order_id": None}}, {"$count": "count"}],
+                "as": "actual"
+            }},
+            {"$lookup": {
+                "from": self.dbs.invalidation.collection.name,
+                "pipeline": [{"$match": {"_id": self.dbs.CATALOG_TOPIC}}, {"$project": {"version": 1}}],
+                "as": "catalog"
+            }}
+        ]
+        
+        document = None
+        for _ in range(2):
+            cursor = await self._summaries().aggregate(pipeline)
+            document = next(iter(await cursor.to_list(1)), None)
+            if document and self._summary_is_current(document):
+                break
+            # сводки ещё нет или она разошлась с записями - пересчитываем и читаем заново
+            await self.refresh_summaries([customer.id])
+        
+        if not document:
+            return CartSummary(id=customer.id), None, None
+        
+        entry = self.to_model(document["entry"][0]) if document["entry"] else None
+        product = self.dbs.products.to_model(document["product"][0]) if document["product"] else None
+        return self._summary_from_document(document), entry, product
     
     async def check_price_confirmation_in_cart(self, customer: Customer) -> bool:
         query = {
@@ -642,16 +1375,11 @@ class DiscountedProductsRepository(AppAbstractRepository[DiscountedProduct]):
     async def count(self) -> int:
         return await self.get_collection().count_documents({})
     
-    async def find_by_index(self, idx: int) -> Optional[Product]:
-        cursor = self.get_collection().find(
-            {},
-            projection={"_id": 1}
-        ).sort("_id", 1)
-        
-        ids = [PydanticObjectId(doc["_id"]) async for doc in cursor]
-        if not ids: return None
-        
-        return await self.find_one_by_id(ids[idx]) if 0 <= idx < len(ids) else None
+    async def find_by_index(self, idx: int) -> Optional[DiscountedProduct]:
+        return await self.find_at_index({}, idx)
+    
+    async def find_by_index_with_count(self, idx: int) -> tuple[Optional[DiscountedProduct], int]:
+        return await self.find_at_index_with_count({}, idx)
     
     async def check_reserved(self, product_id: PydanticObjectId | list[PydanticObjectId]) -> bool:
         if isinstance(product_id, list):
@@ -661,22 +1389,18 @@ class DiscountedProductsRepository(AppAbstractRepository[DiscountedProduct]):
         
         return await self.get_collection().count_documents(query) > 0
     
-    async def set_reserved(self, product_id: PydanticObjectId | list[PydanticObjectId], reserved: bool):
+    async def set_reserved(self, product_id: PydanticObjectId | list[PydanticObjectId], reserved: bool) -> int:
         if isinstance(product_id, list):
-            products = await self.find_by({"_id": {"$in": product_id}})
-            if not products: return
-            
-            for product in products:
-                product.reserved = reserved
-                
-            await self.save_many(products)
-        elif isinstance(product_id, PydanticObjectId):
-            product = await self.find_one_by_id(product_id)
-            if not product: return
-            
-            product.reserved = reserved
-            
-            await self.save(product)
+            if not product_id: return 0
+            query = {"_id": {"$in": product_id}}
+        else:
+            query = {"_id": product_id}
+        
+        return await self.update_where(query, {"reserved": reserved})
+    
+    async def delete_many_by_ids(self, product_ids: list[PydanticObjectId]) -> int:
+        if not product_ids: return 0
+        return await self.delete_where({"_id": {"$in": product_ids}})
 
 class ConfigurationSwitch(AppBaseModel):
     name: LocalizedEntry
@@ -1149,9 +1873,23 @@ class Product(AppDBModel):
             
     #     return total_price
 
-class ProductsRepository(AppAbstractRepository[Product]):
+class ProductsRepository(CatalogRepository[Product]):
     class Meta:
         collection_name = 'products'
+        indexes = [
+            IndexModel([("category", ASCENDING), ("visible", ASCENDING), ("_id", ASCENDING)])
+        ]
+    
+    async def save(self, model: Product) -> Union[InsertOneResult, UpdateResult]:
+        result = await super().save(model)
+        # цена товара входит в суммы сводок корзин
+        await self.dbs.cart_entries.refresh_product_summaries(model.id)
+        return result
+    
+    async def delete(self, model: Product):
+        result = await super().delete(model)
+        await self.dbs.cart_entries.refresh_product_summaries(model.id)
+        return result
     
     async def get_ids_by_category_sorted_by_date(self, category: str, only_visible: bool = True) -> list[PydanticObjectId]:
         """Получить список id продуктов в категории, отсортированных по дате создания (ObjectId)."""
@@ -1171,10 +1909,14 @@ class ProductsRepository(AppAbstractRepository[Product]):
         )
 
     async def find_by_category_and_index(self, category: str, idx: int, only_visible: bool = True) -> Optional[Product]:
-        ids = await self.get_ids_by_category_sorted_by_date(category, only_visible=only_visible)
-        if not ids: return None
+        f = {"category": category, "visible": True} if only_visible else {"category": category}
+        
+        return await self.find_at_index(f, idx)
+    
+    async def find_by_category_and_index_with_count(self, category: str, idx: int, only_visible: bool = True) -> tuple[Optional[Product], int]:
+        f = {"category": category, "visible": True} if only_visible else {"category": category}
         
-        return await self.find_one_by_id(ids[idx]) if 0 <= idx < len(ids) else None
+        return await self.find_at_index_with_count(f, idx)
     
     async def get_name_by_id(self, product_id: PydanticObjectId) -> Optional[LocalizedString]:
         cursor = await self.get_collection().find_one(
@@ -1183,10 +1925,16 @@ class ProductsRepository(AppAbstractRepository[Product]):
         )
         return LocalizedString(**cursor["name"]) if cursor and "name" in cursor else None
     
+    async def get_names_by_ids(self, product_ids: list[PydanticObjectId]) -> dict[PydanticObjectId, LocalizedString]:
+        if not product_ids: return {}
+        
+        cursor = self.get_collection().find({"_id": {"$in": product_ids}}, projection={"name": 1})
+        return {document["_id"]: LocalizedString(**document["name"]) async for document in cursor if "name" in document}
+    
     async def count_in_category(self, category, only_visible: bool = True) -> int:
         f = {"category": category, "visible": True} if only_visible else {"category": category}
         
-        return await self.get_collection().count_documents(f)
+        return await self.count_where(f)
 
 class ProductAdditional(AppDBModel):
     id: Optional[PydanticObjectId] = None
@@ -1198,9 +1946,12 @@ class ProductAdditional(AppDBModel):
     price: LocalizedMoney
     disallowed_products: list[PydanticObjectId] = Field(default_factory=list)
 
-class AdditionalsRepository(AppAbstractRepository[ProductAdditional]):
+class AdditionalsRepository(CatalogRepository[ProductAdditional]):
     class Meta:
         collection_name = 'additionals'
+        indexes = [
+            IndexModel([("category", ASCENDING)])
+        ]
 
     async def get(self, product: Product):
         """Возвращает все additionals в категории, которые разрешены для данного продукта."""
@@ -1287,6 +2038,9 @@ class Promocode(AppDBModel):
 class PromocodesRepository(AppAbstractRepository[Promocode]):
     class Meta:
         collection_name = 'promocodes'
+        indexes = [
+            IndexModel([("code", ASCENDING)], unique=True)
+        ]
        
     async def find_by_code(self, code: str) -> Optional[Promocode]:
         return await self.find_one_by({"code": code})
@@ -1294,15 +2048,26 @@ class PromocodesRepository(AppAbstractRepository[Promocode]):
     async def get_all(self) -> Iterable[Promocode]:
         return await self.find_by({})
     
-    async def update_usage(self, promocode_id: PydanticObjectId, upd: int = 1):
-        promocode = await self.find_one_by_id(promocode_id)
-        if not promocode: return
-        if promocode.conditions.max_usages != -1 and (promocode.conditions.max_usages < promocode.already_used + upd):
+    async def update_usage(self, promocode_id: PydanticObjectId, upd: int = 1) -> Optional[Promocode]:
+        query: dict[str, Any] = {"_id": promocode_id}
+        if upd > 0:
+            # лимит проверяется в том же запросе, что и увеличение счётчика
+            query["$expr"] = {"$or": [
+                {"$eq": [{"$ifNull": ["$conditions.max_usages", -1]}, -1]},
+                {"$lte": [{"$add": [{"$ifNull": ["$already_used", 0]}, upd]}, "$conditions.max_usages"]}
+            ]}
+        
+        document = await self.get_collection().find_one_and_update(
+            query,
+            {"$inc": {"already_used": upd}},
+            return_document=True
+        )
+        self._forget_inflight()
+        if document: return self.to_model(document)
+        
+        if upd > 0 and await self.get_collection().count_documents({"_id": promocode_id}, limit=1):
             raise ValueError("Promocode max usages reached")
 
-        promocode.already_used += upd
-        await self.save(promocode)
-
 class Inviter(AppDBModel):
     id: Optional[PydanticObjectId] = None
     
@@ -1319,6 +2084,9 @@ class Inviter(AppDBModel):
 class InvitersRepository(AppAbstractRepository[Inviter]):
     class Meta:
         collection_name = 'inviters'
+        indexes = [
+            IndexModel([("customer_id", ASCENDING)], unique=True)
+        ]
         
     async def check_customer(self, customer_id: PydanticObjectId) -> bool:
         return await self.get_collection().count_documents({"customer_id": customer_id}) > 0
@@ -1326,6 +2094,10 @@ class InvitersRepository(AppAbstractRepository[Inviter]):
     async def find_by_customer_id(self, customer_id: PydanticObjectId) -> Optional[Inviter]:
         return await self.find_one_by({"customer_id": customer_id})
     
+    async def get_customer_id(self, inviter_id: PydanticObjectId) -> Optional[PydanticObjectId]:
+        document = await self.get_collection().find_one({"_id": inviter_id}, projection={"customer_id": 1})
+        return document["customer_id"] if document else None
+    
     async def find_inviter_by_deep_link(self, deep_link: str) -> Optional[Inviter]:
         try:
             if "_" not in deep_link:
@@ -1335,21 +2107,18 @@ class InvitersRepository(AppAbstractRepository[Inviter]):
         except Exception:
             return None
 
-    async def count_new_customer(self, inviter: Inviter):
-        inviter.invited_customers += 1
-        await self.save(inviter)
+    async def count_new_customer(self, inviter: Inviter) -> Optional[Inviter]:
+        return await self.increment(inviter, {"invited_customers": 1})
     
     async def count_new_first_order(self, inviter: Inviter, order: Order, ctx: Context) -> Optional[Money]:
-        inviter.invited_customers_first_orders += 1
+        await self.increment(inviter, {"invited_customers_first_orders": 1})
+        
         if inviter.inviter_type == InviterType.customer:
             customer = await self.dbs.customers.find_one_by_id(inviter.customer_id)
             if customer:
                 reward = await order.price_details.get_referral_reward()
                 
                 return await self.dbs.customers.add_bonus_money(customer, reward, ctx)
-                
-        
-        await self.save(inviter)
     
     async def new(self, customer_id: PydanticObjectId) -> Inviter:
         if await self.check_customer(customer_id):
@@ -1408,9 +2177,12 @@ class DeliveryService(AppDBModel):
             logging.error(f"Ошибка при восстановлении securs из строки: {e}")
             return
 
-class DeliveryServicesRepository(AppAbstractRepository[DeliveryService]):
+class DeliveryServicesRepository(CatalogRepository[DeliveryService]):
     class Meta:
         collection_name = 'delivery_services'
+        indexes = [
+            IndexModel([("is_foreign", ASCENDING)])
+        ]
     
     async def get_all(self, is_foreign: bool) -> Iterable[DeliveryService]:
         return await self.find_by({"is_foreign": is_foreign})
@@ -1511,6 +2283,7 @@ class Customer(AppDBModel):
             raise ValueError(f"Unsupported currency: {iso}")
 
         self.bonus_wallet.currency = iso
+        self.mark_changed("bonus_wallet")
         
         if self.bonus_wallet.amount > 0:
             try:
@@ -1534,8 +2307,95 @@ class Customer(AppDBModel):
 
 
 class CustomersRepository(AppAbstractRepository[Customer]):
+    CACHE_MAXSIZE = 10_000
+    CACHE_TTL = 60
+    INVALIDATION_TOPIC = "customers"
+    
     class Meta:
         collection_name = 'customers'
+        indexes = [
+            IndexModel([("user_id", ASCENDING)], unique=True),
+            IndexModel([("invited_by", ASCENDING)])
+        ]
+        
+    def __init__(self, dbs: DatabaseService):
+        super().__init__(dbs)
+        self._cache: TTLCache[int, Customer] = TTLCache(maxsize=self.CACHE_MAXSIZE, ttl=self.CACHE_TTL)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+    def _cache_put(self, customer: Customer):
+        self._cache[customer.user_id] = customer.model_copy(deep=True)
+        
+    def invalidate(self, user_id: int):
+        """Сбрасывает закешированного покупателя в этом воркере"""
+        self._cache.pop(user_id, None)
+        
+    async def publish_invalidation(self, user_id: int):
+        """Сбрасывает покупателя в кешах всех воркеров"""
+        self.invalidate(user_id)
+        await self.dbs.invalidation.publish(self.INVALIDATION_TOPIC, [str(user_id)])
+        
+    async def subscribe_invalidations(self):
+        await self.dbs.invalidation.subscribe(self.INVALIDATION_TOPIC, self._on_invalidated)
+        
+    async def _on_invalidated(self, keys: Optional[set[str]]):
+        if keys is None:
+            self._cache.clear()
+            return
+        for key in keys:
+            self.invalidate(int(key))
+        
+    def cache_stats(self) -> dict[str, int]:
+        return {"hits": self.cache_hits, "misses": self.cache_misses, "size": len(self._cache)}
+        
+    async def _write_through(self, model: Customer, write: Awaitable):
+        try:
+            result = await write
+        except Exception:
+            self.invalidate(model.user_id)
+            raise
+        
+        # другие воркеры перечитают покупателя, а этот сразу кладёт в кеш записанную версию
+        await self.dbs.invalidation.publish(self.INVALIDATION_TOPIC, [str(model.user_id)])
+        self._cache_put(model)
+        return result
+        
+    async def save(self, model: Customer) -> Union[InsertOneResult, UpdateResult]:
+        return await self._write_through(model, super().save(model))
+    
+    async def save_changes(self, model: Customer, guard: Optional[dict] = None) -> Optional[Union[InsertOneResult, UpdateResult]]:
+        if guard:
+            result = await super().save_changes(model, guard)
+            # при невыполненном условии в кеше осталась бы неверная версия
+            await self.publish_invalidation(model.user_id)
+            return result
+        return await self._write_through(model, super().save_changes(model))
+    
+    async def delete(self, model: Customer):
+        result = await super().delete(model)
+        await self.publish_invalidation(model.user_id)
+        return result
+        
+    async def change_currency(self, customer: Customer, iso: str, ctx: Context, do_timeout: bool = True):
+        """
+        Меняет валюту с пересчётом бонусного кошелька. Кошелёк записывается, только если в БД он не изменился
+        после чтения - иначе параллельное начисление или списание потерялось бы.
+        """
+        wallet = customer.bonus_wallet.model_copy()
+        await customer.change_selected_currency(iso, ctx, do_timeout)
+        
+        result = await self.save_changes(customer, {"bonus_wallet.currency": wallet.currency,
+                                                    "bonus_wallet.amount": Decimal128(str(wallet.amount))})
+        if result is not None and not result.matched_count:
+            raise RuntimeError("Бонусный баланс изменился, попробуйте ещё раз.")
+        
+    async def update_delivery_info(self, customer: Customer, *fields: str):
+        """Записывает только перечисленные поля privacy_data.delivery_info, не затрагивая остальные данные покупателя"""
+        dumped = customer.privacy_data.delivery_info.model_dump(include=set(fields))
+        await self.update_where({"_id": customer.id},
+                                {f"privacy_data.delivery_info.{field}": value for field, value in dumped.items()})
+        await self.publish_invalidation(customer.user_id)
         
     async def new_customer(self, user_id, username, inviter: Inviter = None, lang: str = "?", currency: str = "RUB") -> Customer:
         customer = Customer(
@@ -1552,7 +2412,15 @@ class CustomersRepository(AppAbstractRepository[Customer]):
         return customer
 
     async def find_by_user_id(self, user_id: int) -> Optional[Customer]:
-        return await self.find_one_by({"user_id": user_id})
+        # отдаём копию, чтобы несохранённые изменения хендлера не попадали в кеш
+        if (cached := self._cache.get(user_id)) is not None:
+            self.cache_hits += 1
+            return cached.model_copy(deep=True)
+        
+        self.cache_misses += 1
+        customer = await self.find_one_by({"user_id": user_id})
+        if customer: self._cache_put(customer)
+        return customer
     
     async def find_by_users_id(self, user_ids: Iterable[int]) -> Optional[Iterable[Customer]]:
         return await self.find_by({"user_id": {"$in": user_ids}})
@@ -1560,6 +2428,10 @@ class CustomersRepository(AppAbstractRepository[Customer]):
     async def find_many_by_inviter_id(self, inviter_id: PydanticObjectId) -> Optional[Iterable[Customer]]:
         return await self.find_by({"invited_by": inviter_id})
     
+    async def find_user_ids_by_inviter_id(self, inviter_id: PydanticObjectId) -> list[int]:
+        cursor = self.get_collection().find({"invited_by": inviter_id}, projection={"_id": 0, "user_id": 1})
+        return [document["user_id"] async for document in cursor]
+    
     async def add_bonus_money(self, customer: Customer, money: Money, ctx: Context):
         if money.amount <= 0.0001: return
         
@@ -1573,8 +2445,7 @@ class CustomersRepository(AppAbstractRepository[Customer]):
                 ) from e
             money = Money(currency=customer.currency, amount=amount)
 
-        customer.bonus_wallet += money
-        await self.save(customer)
+        await self._inc_bonus_wallet(customer, money.amount)
         return money
         
     async def remove_bonus_money(self, customer: Customer, money: Money, ctx: Context):
@@ -1590,23 +2461,38 @@ class CustomersRepository(AppAbstractRepository[Customer]):
                 ) from e
             money = Money(currency=customer.currency, amount=amount)
             
-        customer.bonus_wallet -= money
-        await self.save(customer)
+        # не даём уйти в минус, если кошелёк успели потратить параллельно
+        await self._inc_bonus_wallet(customer, -money.amount, {"bonus_wallet.amount": {"$gte": Decimal128(str(money.amount))}})
+        
+    async def _inc_bonus_wallet(self, customer: Customer, amount: Decimal, guard: Optional[dict] = None):
+        updated = await self.increment(customer,
+                                       {"bonus_wallet.amount": Decimal128(str(amount))},
+                                       {"bonus_wallet.currency": customer.currency, **(guard or {})})
+        if not updated:
+            await self.publish_invalidation(customer.user_id)
+            raise ValueError("Insufficient bonus balance or concurrent bonus wallet change")
+        
+        await self.dbs.invalidation.publish(self.INVALIDATION_TOPIC, [str(customer.user_id)])
+        self._cache_put(customer)
 
 class Category(AppDBModel):
     id: Optional[PydanticObjectId] = None
     name: str
     localized_name: LocalizedString
 
-class CategoriesRepository(AppAbstractRepository[Category]):
+class CategoriesRepository(CatalogRepository[Category]):
     class Meta:
         collection_name = 'categories'
+        indexes = [
+            IndexModel([("name", ASCENDING)], unique=True)
+        ]
 
     async def get_all(self) -> Optional[Iterable[Category]]:
         return await self.find_by({})
 
 __all__ = [
     "AppAbstractRepository",
+    "CatalogRepository",
     "AppBaseModel",
     "AppDBModel",
     "LogEntry",
@@ -1619,6 +2505,7 @@ __all__ = [
     "Order",
     "OrdersRepository",
     "CartEntry",
+    "CartSummary",
     "CartEntriesRepository",
     "DiscountedProduct",
     "DiscountedProductsRepository",
@@ -0,0 +1,59 @@
+import asyncio
+import os
+import uuid
+from typing import Awaitable, Callable
+
+import pytest
+
+# конфиг читается при импорте модулей; тестам нужен только сервер Mongo из docker-compose.test.yaml
+for name, value in {
+    "BOT_TOKEN": "1:test",
+    "BASE_WEBHOOK_URL": "http://localhost",
+    "WEBHOOK_SECRET": "test",
+    "CRYPTO_KEY": "MDAwMDAwMDAwMDAwMDAwMDAwMDAwMDAwMDAwMDAwMDA=",
+    "PROVIDER_TOKEN": "test",
+    "MONGO_URI": "mongodb://localhost",
+    "MONGO_TLS_CA_PATH": "-",
+    "MONGO_TLS_KEY_PATH": "-",
+    "MEDIA_PATH": "/tmp",
+    "CONFIGS_PATH": "/tmp",
+    "LOGS_PATH": "/tmp",
+    "TG_LOGS_CHANNEL_ID": "0",
+    "TG_ADMIN_CHAT_ID": "0"
+}.items():
+    os.environ.setdefault(name, value)
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27118/?directConnection=true")
+
+
+def _run_with_db(scenario: Callable[["DatabaseService"], Awaitable[None]]):
+    """Выполняет scenario на чистой базе тестового сервера и удаляет её после"""
+    from pymongo import AsyncMongoClient
+    from pymongo.errors import PyMongoError
+    from core.services.db import DatabaseService
+
+    async def main():
+        client = AsyncMongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=2000)
+        try:
+            try:
+                await client.admin.command("ping")
+            except PyMongoError as e:
+                return e
+
+            db_name = f"test_{uuid.uuid4().hex[:12]}"
+            db = DatabaseService(db_name, client)
+            try:
+                await scenario(db)
+            finally:
+                await db.close()
+                await client.drop_database(db_name)
+        finally:
+            await client.close()
+
+    if (error := asyncio.run(main())) is not None:
+        pytest.skip(f"Test Mongo is not available at {TEST_MONGO_URI}: {error}")
+
+
+@pytest.fixture
+def run_with_db():
+    return _run_with_db
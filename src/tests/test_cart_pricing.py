@@ -0,0 +1,105 @@
+"""calculate_price (агрегат в Mongo) против calculate_price_reference (модели в питоне)"""
+from decimal import Decimal
+
+from bson import ObjectId
+
+from schemas.db_models import (CartEntry, ConfigurationChoice, ConfigurationOption, DiscountedProduct, Product,
+                               ProductAdditional, ProductConfiguration)
+from core.types.enums import CartItemSource, DiscountType
+from core.types.values import Discount, LocalizedEntry, LocalizedMoney, LocalizedString
+
+
+def amounts(money: LocalizedMoney) -> dict[str, Decimal]:
+    return {currency: value.amount for currency, value in money.data.items()}
+
+
+def configuration(choice_price: LocalizedMoney, additional_price: LocalizedMoney = None) -> ProductConfiguration:
+    entry = LocalizedEntry(path="test")
+    option = ConfigurationOption(name=entry, text=entry, chosen_key="chosen",
+                                 choices={"chosen": ConfigurationChoice(name=entry, description=entry, price=choice_price)})
+    additionals = [ProductAdditional(id=ObjectId(), name=LocalizedString.from_keys(ru="Добавка"), category="test",
+                                     price=additional_price)] if additional_price else []
+    return ProductConfiguration(options={"option": option}, additionals=additionals)
+
+
+def product(base_price: LocalizedMoney, discount: Discount = None) -> Product:
+    name = LocalizedString.from_keys(ru="Товар")
+    return Product(name=name, name_for_tax="Товар", category="test", description=name, visible=True,
+                   base_price=base_price, discount=discount, configuration=configuration(LocalizedMoney()))
+
+
+def test_pipeline_matches_reference(run_with_db):
+    async def scenario(db):
+        customer_id = ObjectId()
+
+        # процентная скидка: 2.50 USD * 33% = 0.825 - HALF_UP даёт 0.83, а $round в Mongo дал бы 0.82
+        percent = product(LocalizedMoney.from_keys(RUB=Decimal("199.99"), USD=Decimal("2.50")),
+                          Discount(dicount_type=DiscountType.percent, value=Decimal("33")))
+        # фиксированная скидка только в рублях, цена товара без USD, опция конфигурации только в USD
+        fixed = product(LocalizedMoney.from_keys(RUB=Decimal("100")),
+                        Discount(dicount_type=DiscountType.fixed, value=LocalizedMoney.from_keys(RUB=Decimal("30"))))
+        discounted = DiscountedProduct(name=LocalizedString.from_keys(ru="Уценка"),
+                                       description=LocalizedString.from_keys(ru="Уценка"),
+                                       price=LocalizedMoney.from_keys(RUB=Decimal("500"), USD=Decimal("6.10")))
+        for model in (percent, fixed):
+            await db.products.save(model)
+        await db.discounted_products.save(discounted)
+
+        entries = [
+            CartEntry(customer_id=customer_id, source_id=percent.id, quantity=3,
+                      configuration=configuration(LocalizedMoney.from_keys(RUB=Decimal("10.01"), USD=Decimal("0.15")),
+                                                  LocalizedMoney.from_keys(RUB=Decimal("50"), USD=Decimal("0.99")))),
+            CartEntry(customer_id=customer_id, source_id=fixed.id, quantity=2,
+                      configuration=configuration(LocalizedMoney.from_keys(USD=Decimal("1.50")))),
+            CartEntry(customer_id=customer_id, source_type=CartItemSource.discounted, source_id=discounted.id,
+                      frozen_snapshot=discounted),
+            # товар удалён - запись не учитывается ни там, ни там
+            CartEntry(customer_id=customer_id, source_id=ObjectId(),
+                      configuration=configuration(LocalizedMoney.from_keys(RUB=Decimal("1")))),
+            # запись уже оформленного заказа
+            CartEntry(customer_id=customer_id, order_id=ObjectId(), source_id=percent.id,
+                      configuration=configuration(LocalizedMoney.from_keys(RUB=Decimal("1"))))
+        ]
+        for entry in entries:
+            await db.cart_entries.save(entry)
+
+        query = {"customer_id": customer_id, "order_id": None}
+        expected = amounts(await db.cart_entries.calculate_price_reference(query))
+
+        assert expected == {"RUB": Decimal("1222.00"), "USD": Decimal("17.53")}
+        assert amounts(await db.cart_entries.calculate_price(query)) == expected
+
+        summary = await db.cart_entries._summaries().find_one({"_id": customer_id})
+        assert summary["count"] == 4
+        assert amounts(db.cart_entries._summary_from_document(summary).total) == expected
+
+    run_with_db(scenario)
+
+
+def test_configuration_price_is_migrated(run_with_db):
+    async def scenario(db):
+        customer_id = ObjectId()
+        base = product(LocalizedMoney.from_keys(RUB=Decimal("100")))
+        await db.products.save(base)
+
+        # запись старой схемы: без schema_version и без сохранённой цены конфигурации
+        entry = CartEntry(customer_id=customer_id, source_id=base.id,
+                          configuration=configuration(LocalizedMoney.from_keys(RUB=Decimal("25"))))
+        document = db.cart_entries.to_document(entry)
+        document.pop("schema_version")
+        document["configuration"].pop("price")
+        await db.cart_entries.get_collection().insert_one(document)
+
+        query = {"customer_id": customer_id, "order_id": None}
+        assert amounts(await db.cart_entries.calculate_price(query)) == {"RUB": Decimal("100")}
+
+        await db.cart_entries.check_migrations()
+
+        stored = await db.cart_entries.get_collection().find_one({"customer_id": customer_id})
+        assert stored["schema_version"] == CartEntry.latest_schema_version()
+        assert stored["configuration"]["price"] is not None
+        expected = amounts(await db.cart_entries.calculate_price_reference(query))
+        assert expected == {"RUB": Decimal("125")}
+        assert amounts(await db.cart_entries.calculate_price(query)) == expected
+
+    run_with_db(scenario)
@@ -0,0 +1,49 @@
+"""IndexManager: планы запросов по объявленным индексам и безопасная пересборка изменившихся"""
+from bson import ObjectId
+
+
+def test_query_shapes_use_declared_indexes(run_with_db):
+    async def scenario(db):
+        assert await db.indexes.sync() == []
+
+        stages = await db.indexes.plan_stages(db.cart_entries, {"customer_id": ObjectId(), "order_id": None}, [("_id", 1)])
+        assert "IXSCAN" in stages and "COLLSCAN" not in stages
+
+        assert await db.indexes.check_query_plans() == []
+
+    run_with_db(scenario)
+
+
+def test_changed_index_is_built_before_the_old_one_is_dropped(run_with_db):
+    async def scenario(db):
+        orders = db.orders.get_collection()
+        # под именем объявленного индекса лежит индекс с другими ключами
+        await orders.create_index([("number", 1)], name="customer_id_1")
+
+        assert await db.indexes.sync() == []
+
+        existing = await orders.index_information()
+        assert "customer_id_1" not in existing
+        assert existing["customer_id_1_rebuilt"]["key"] == [("customer_id", 1)]
+
+        missing, _extra, changed, superseded = await db.indexes.diff(db.orders)
+        assert missing == changed == superseded == []
+
+    run_with_db(scenario)
+
+
+def test_failed_rebuild_keeps_the_old_index(run_with_db):
+    async def scenario(db):
+        orders = db.orders.get_collection()
+        # уникальный индекс на number не построится из-за дубликатов
+        await orders.create_index([("number", 1)], name="number_1")
+        await orders.insert_many([{"number": 1}, {"number": 1}])
+
+        assert await db.indexes.sync() == ["orders"]
+
+        existing = await orders.index_information()
+        assert existing["number_1"]["key"] == [("number", 1)]
+        assert not existing["number_1"].get("unique")
+        assert "number_1_rebuilt" not in existing
+
+    run_with_db(scenario)
@@ -185,6 +185,28 @@ class AdminKBs:
             return types.ReplyKeyboardMarkup(keyboard=kb,
                                             resize_keyboard=True)
         
+        ACTIVE_ORDERS_CALLBACK = "active_orders"
+        
+        @staticmethod
+        def active_orders_pages(counts: list[tuple[OrderStateKey, int]], state: Optional[OrderStateKey], page: int, pages: int, ctx: Context) -> Optional[types.InlineKeyboardMarkup]:
+            """Переключение статуса и страницы обзора активных заказов: callback_data = active_orders:<статус>:<страница>"""
+            if not counts: return None
+            prefix = AdminKBs.Orders.ACTIVE_ORDERS_CALLBACK
+            
+            builder = InlineKeyboardBuilder()
+            for key, count in counts:
+                name = EnumTranslates.OrderStateKey.translate(key.value, ctx.lang)
+                builder.row(types.InlineKeyboardButton(text=f"{'• ' if key == state else ''}{name} ({count})",
+                                                       callback_data=f"{prefix}:{key.value}:0"))
+            
+            if pages > 1:
+                builder.row(
+                    types.InlineKeyboardButton(text="◀️", callback_data=f"{prefix}:{state.value}:{(page - 1) % pages}"),
+                    types.InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data=f"{prefix}:{state.value}:{page}"),
+                    types.InlineKeyboardButton(text="▶️", callback_data=f"{prefix}:{state.value}:{(page + 1) % pages}")
+                )
+            return builder.as_markup()
+        
         @staticmethod
         def order_menu(ctx: Context) -> types.ReplyKeyboardMarkup:
             kb = [
@@ -420,7 +442,8 @@ class DiscountedProductKBs:
 
 class CartKBs:
     @staticmethod
-    async def cart_view(entry: CartEntry, current: int, amount: int, total_price: LocalizedMoney, ctx: Context) -> types.ReplyKeyboardMarkup:
+    def cart_view(entry: CartEntry, current: int, summary: CartSummary, ctx: Context) -> types.ReplyKeyboardMarkup:
+        amount = summary.count
         controls = [
             types.KeyboardButton(text="⬅️"),
             types.KeyboardButton(text=f"{current}/{amount}"),
@@ -429,7 +452,6 @@ class CartKBs:
             types.KeyboardButton(text=f"{current}/{amount}")
         ]
         
-        requires_price_confirmation = await ctx.services.db.cart_entries.check_price_confirmation_in_cart(ctx.customer)
         is_product = entry.source_type == CartItemSource.product
         
         kb = [
@@ -442,7 +464,7 @@ class CartKBs:
             controls,
             [
                 types.KeyboardButton(text=ctx.t.UncategorizedTranslates.back),
-                types.KeyboardButton(text=ctx.t.ReplyButtonsTranslates.Cart.send_to_check if requires_price_confirmation else ctx.t.ReplyButtonsTranslates.Cart.place.format(price=total_price.to_text(ctx.customer.currency)))
+                types.KeyboardButton(text=ctx.t.ReplyButtonsTranslates.Cart.send_to_check if summary.requires_price_confirmation else ctx.t.ReplyButtonsTranslates.Cart.place.format(price=summary.total.to_text(ctx.customer.currency)))
             ]
         ]
 
@@ -12,6 +12,7 @@ from schemas.db_models import *
 from core.types.enums import CartItemSource, DiscountType, InviterType, OrderStateKey
 from core.types.values import LocalizedMoney
 from ui.message_tools import build_list
+from ui.translates import EnumTranslates
 
 
 def gen_product_configurable_info_text(
@@ -80,7 +81,7 @@ def gen_product_configurable_info_text(
 async def form_entry_description(entry: CartEntry, ctx):
     is_product = entry.source_type == CartItemSource.product
     
-    product: Product = (entry.frozen_snapshot or await ctx.services.db.products.find_one_by_id(entry.source_id)) if is_product else None
+    product: Product = (entry.frozen_snapshot or await ctx.services.catalog.get_product(entry.source_id)) if is_product else None
     
     quantity_text = f" {entry.quantity} {ctx.t.UncategorizedTranslates.unit(entry.quantity)}" if entry.quantity > 1 else ""
     price = (product.price + entry.configuration.price) if is_product else entry.frozen_snapshot.price
@@ -92,11 +93,24 @@ async def form_entry_description(entry: CartEntry, ctx):
 
 class AdminTextGen:
     @staticmethod
-    async def customer_menu_text(customer: Customer, ctx: Context):
-        inviter = await ctx.services.db.inviters.find_by_customer_id(customer.id)
-        invited = inviter.invited_customers if inviter else 0
-        invited_list = await ctx.services.db.customers.find_many_by_inviter_id(inviter.id) if inviter else []
+    async def customer_menu_text(customer: Customer, ctx: Context, orders_limit: int = 10):
+        async def fetch_inviter():
+            inviter = await ctx.services.db.inviters.find_by_customer_id(customer.id)
+            invited_ids = await ctx.services.db.customers.find_user_ids_by_inviter_id(inviter.id) if inviter else []
+            return inviter, invited_ids
+        
+        async def fetch_invited_by():
+            return await ctx.services.db.inviters.get_customer_id(customer.invited_by) if customer.invited_by else None
+        
+        # запросы независимы друг от друга, поэтому выполняются одновременно
+        (inviter, invited_ids), invited_by, orders, orders_count = await asyncio.gather(
+            fetch_inviter(),
+            fetch_invited_by(),
+            ctx.services.db.orders.find_last_customer_orders(customer, orders_limit),
+            ctx.services.db.orders.count_customer_orders(customer)
+        )
         
+        invited = inviter.invited_customers if inviter else 0
         invited_orders = inviter.invited_customers_first_orders if inviter else 0
         
         def delivery_info(service: DeliveryService):
@@ -108,20 +122,21 @@ class AdminTextGen:
             requirements_info_text = "\n".join([f"  {requirement.name.get(ctx)}: <tg-spoiler>{html.quote(requirement.value.get())}</tg-spoiler>" for requirement in requirements])
             return ("Способ доставки: {delivery_service} ({service_price}), {delivery_req_lists_name}\n{requirements}").format(delivery_service=service.name.get(ctx), service_price=service.price.to_text(ctx.customer.currency), delivery_req_lists_name=service.selected_option.name.get(ctx), requirements=requirements_info_text)
         
-        async def orders_info():
-            orders = await ctx.services.db.orders.find_customer_orders(customer)
-            if len(orders) == 0:
+        def orders_info():
+            if orders_count == 0:
                 return "Нету."
             txt = ""
             for order in orders:
                 txt += f"\n🛒 {order.id} — {order.state.get_localized_name(ctx.lang)} — {order.price_details.total_price.to_text()}"
+            if orders_count > len(orders):
+                txt += f"\n...и ещё {orders_count - len(orders)} (показаны последние {len(orders)})"
             return txt
             
         username_text = f" @{customer.username}" if customer.username else ""
         
         text = f"""👤 <a href=\"tg://user?id={customer.user_id}\">{customer.user_id}{username_text}</a>
 
-Приглашён: {(await ctx.services.db.inviters.find_one_by_id(customer.invited_by)).customer_id if customer.invited_by else 'Никем'}
+Приглашён: {invited_by or 'Никем'}
 Зарегистрировался: {customer.id.generation_time.strftime("%d.%m.%Y %H:%M")} UTC
 Заблокировал бота? {customer.kicked}
 Заблокирован? {customer.banned}
@@ -135,40 +150,46 @@ class AdminTextGen:
 Она ждет подтверждения стоимости? {customer.privacy_data.delivery_info.waiting_for_manual_delivery_info_confirmation}
 
 Скольких пригласил: {invited} 
-[{', '.join([str(c.user_id) for c in invited_list])}]
+[{', '.join(str(user_id) for user_id in invited_ids)}]
 
 Из них сделали хоть один заказ: {invited_orders}
 
-Заказы: {await orders_info()}
+Заказы: {orders_info()}
 """
         return text
     
+    ACTIVE_ORDERS_PAGE_SIZE = 8
+    ACTIVE_ORDER_ENTRIES_LIMIT = 200 # символов содержимого на заказ, чтобы страница влезала в сообщение
+    
     @staticmethod
-    async def active_orders_menu_text(ctx: Context):
-        STATE_ORDER = {key: i for i, key in enumerate(OrderStateKey)}
-        active_orders = await ctx.services.db.orders.find_by({"state.key": {"$ne": OrderStateKey.received}})
-        active_orders.sort(key=lambda order: STATE_ORDER.get(order.state.key, 999))
+    async def active_orders_menu_text(ctx: Context, counts: list[tuple[OrderStateKey, int]], state: Optional[OrderStateKey], page: int):
+        if not counts: return "Активных заказов нет."
         
+        text = "\n".join(f"{'▶️ ' if key == state else ''}{EnumTranslates.OrderStateKey.translate(key.value, ctx.lang)}: {count}" for key, count in counts)
+        text += "\n\n"
         
-        text = ""
-        for order in active_orders:
-            text += f"<b>Заказ <code>{order.id}</code></b> от {order.id.generation_time.strftime('%d.%m.%Y %H:%M UTC')}\n"
-            text += f"  Статус заказа: {order.state.get_localized_name(ctx.lang)}\n"
-            entries = await ctx.services.db.cart_entries.find_entries_by_order(order)
-            products = await ctx.services.db.products.find_by({"_id": {"$in": [entry.source_id for entry in entries if entry.source_type == CartItemSource.product]}})
-            names = [pr.name.get(ctx) for pr in products]
-            names.extend(
-                ent.frozen_snapshot.name.get(ctx)
-                for ent in entries
-                if ent.source_type == CartItemSource.discounted
-            )
+        page_size = AdminTextGen.ACTIVE_ORDERS_PAGE_SIZE
+        ids = await ctx.services.db.orders.find_active_ids_page(state, page * page_size, page_size)
+        names = await ctx.services.db.cart_entries.find_entry_names_by_orders(ids)
+        
+        state_name = EnumTranslates.OrderStateKey.translate(state.value, ctx.lang)
+        for order_id in ids:
+            text += f"<b>Заказ <code>{order_id}</code></b> от {order_id.generation_time.strftime('%d.%m.%Y %H:%M UTC')}\n"
+            text += f"  Статус заказа: {state_name}\n"
             
-            entries_text = ", ".join(names)
+            entries_text = ", ".join(name.get(ctx) for name in names.get(order_id, []))
+            if len(entries_text) > AdminTextGen.ACTIVE_ORDER_ENTRIES_LIMIT:
+                entries_text = entries_text[:AdminTextGen.ACTIVE_ORDER_ENTRIES_LIMIT].rstrip(", ") + "…"
             
             text += f"  Содержимое: {entries_text}\n\n"
-            
+        
+        text += f"<i>Страница {page + 1} из {AdminTextGen.active_orders_pages(counts, state)}</i>"
         return text
     
+    @staticmethod
+    def active_orders_pages(counts: list[tuple[OrderStateKey, int]], state: Optional[OrderStateKey]) -> int:
+        return max(-(-dict(counts).get(state, 0) // AdminTextGen.ACTIVE_ORDERS_PAGE_SIZE), 1)
+    
     @staticmethod
     async def order_menu_text(order: Order, ctx: Context):
         customer = await ctx.services.db.customers.find_one_by_id(order.customer_id)
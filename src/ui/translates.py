@@ -1694,6 +1694,11 @@ class CartTranslates(Translatable):
             "en": "One or more of your items have been temporarily reserved for another user for the duration of payment. Please try to place the order later."
         }
         
+        bonus_balance_changed = {
+            "ru": "На бонусном счету недостаточно средств: баланс изменился. Бонусы сняты с заказа, проверьте его и подтвердите снова.",
+            "en": "There is not enough money on your bonus account: the balance has changed. Bonuses were removed from the order, please check it and confirm again."
+        }
+        
         not_using_bonus_money = {
             "ru": "Не используются.",
             "en": "Not used."